@@ -0,0 +1,183 @@
+"""
+Formato en disco del índice sin pickle.
+
+- `index.faiss`: el índice de FAISS, que la aplicación abre con memory-mapping para
+  que varios procesos compartan la caché de páginas del sistema operativo (Flat y HNSW
+  sólo se mapean con faiss-cpu >= 1.15; con versiones anteriores, sólo IVF).
+- `docstore.sqlite`: texto y metadatos de cada chunk, indexados por su posición en
+  el índice; sólo se leen las filas de los top-k resultados de cada consulta.
+- `lexico.npz`: índice invertido BM25 sobre los mismos chunks (ver `lexico.py`).
+"""
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Union
+
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from lexico import construir_indice_lexico, reportar_indice_lexico, texto_indexable
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_INDICE = "index.faiss"
+ARCHIVO_DOCSTORE = "docstore.sqlite"
+ARCHIVO_PICKLE = "index.pkl"  # formato anterior de FAISS.save_local
+
+
+def guardar_base(db: FAISS, directorio: Path) -> None:
+    """Guarda el índice, el docstore y el índice léxico en el formato sin pickle."""
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    faiss.write_index(db.index, str(directorio / ARCHIVO_INDICE))
+
+    ruta_docstore = directorio / ARCHIVO_DOCSTORE
+    ruta_docstore.unlink(missing_ok=True)
+    (directorio / ARCHIVO_PICKLE).unlink(missing_ok=True)
+    conn = sqlite3.connect(str(ruta_docstore))
+    try:
+        conn.execute("""
+            CREATE TABLE chunks (
+                pos INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, texto TEXT NOT NULL, metadata TEXT NOT NULL
+            )
+        """)
+        filas = []
+        textos = []
+        for pos, id_doc in sorted(db.index_to_docstore_id.items()):
+            doc = db.docstore.search(id_doc)
+            if not isinstance(doc, Document):
+                raise ValueError(f"No se encontró el documento {id_doc} en el docstore.")
+            filas.append((int(pos), id_doc, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False, default=str)))
+            textos.append(texto_indexable(doc))
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", filas)
+        conn.commit()
+    finally:
+        conn.close()
+
+    lexico = construir_indice_lexico((fila[0], texto) for fila, texto in zip(filas, textos))
+    lexico.guardar(directorio)
+    reportar_indice_lexico(lexico, textos)
+
+
+class DocstoreSQLite(Docstore):
+    """
+    Docstore de sólo lectura que lee cada chunk de SQLite bajo demanda.
+
+    La conexión se abre al cargar el índice y se comparte entre hilos: mantiene
+    abierto el archivo con el que se cargó, así que si después se publica otro
+    índice en el mismo directorio (renombrando o reemplazando los archivos) las
+    posiciones del `index.faiss` cargado siguen leyendo su propio docstore.
+    """
+
+    def __init__(self, ruta: Path):
+        self.uri = f"file:{Path(ruta)}?mode=ro"
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        self._total = self._consultar("SELECT COUNT(*) FROM chunks")[0][0]  # abre ya el archivo
+
+    def _consultar(self, sql: str, parametros: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self.conn.execute(sql, parametros).fetchall()
+
+    def search(self, search: str) -> Union[str, Document]:
+        filas = self._consultar("SELECT texto, metadata FROM chunks WHERE id = ?", (search,))
+        if not filas:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=filas[0][0], metadata=json.loads(filas[0][1]))
+
+    def id_en_posicion(self, pos: int) -> str:
+        filas = self._consultar("SELECT id FROM chunks WHERE pos = ?", (int(pos),))
+        if not filas:
+            raise KeyError(pos)
+        return filas[0][0]
+
+    def posiciones(self) -> List[int]:
+        return [pos for (pos,) in self._consultar("SELECT pos FROM chunks ORDER BY pos")]
+
+    def __len__(self) -> int:
+        return self._total
+
+
+class MapaPosiciones(Mapping):
+    """`index_to_docstore_id` perezoso: traduce posiciones del índice a ids consultando SQLite."""
+
+    def __init__(self, docstore: DocstoreSQLite):
+        self.docstore = docstore
+
+    def __getitem__(self, pos: int) -> str:
+        return self.docstore.id_en_posicion(pos)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.docstore.posiciones())
+
+    def __len__(self) -> int:
+        return len(self.docstore)
+
+
+def leer_indice(ruta: Path, mmap: bool = True) -> faiss.Index:
+    """
+    Lee el índice; con mmap los vectores se mapean en memoria en lugar de copiarse.
+
+    `IO_FLAG_MMAP_IFC` (faiss-cpu >= 1.15) mapea el almacenamiento de Flat y HNSW además
+    de las listas invertidas de IVF. Con versiones anteriores `IO_FLAG_MMAP` sólo mapea las
+    listas IVF y el resto de tipos se copia completo en memoria.
+    """
+    if mmap:
+        flag_mmap = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            index = faiss.read_index(str(ruta), flag_mmap | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning(f"Este tipo de índice no admite memory-mapping ({e}); se carga en memoria.")
+        else:
+            if flag_mmap == faiss.IO_FLAG_MMAP and faiss.try_extract_index_ivf(index) is None:
+                logger.warning(
+                    "Esta versión de faiss sólo mapea índices IVF: el índice se cargó completo en memoria. "
+                    "Instala faiss-cpu >= 1.15 para mapear también Flat y HNSW."
+                )
+            return index
+    return faiss.read_index(str(ruta))
+
+
+def cargar_base(directorio: Path, embeddings: Embeddings) -> FAISS:
+    """Abre el índice en modo de sólo lectura para consultas: índice mapeado y docstore perezoso."""
+    directorio = Path(directorio)
+    if not (directorio / ARCHIVO_DOCSTORE).exists():
+        raise FileNotFoundError(
+            f"No se encontró {ARCHIVO_DOCSTORE} en {directorio}. "
+            "Vuelve a generar el índice con procesar_docs.py para usar el formato sin pickle."
+        )
+    docstore = DocstoreSQLite(directorio / ARCHIVO_DOCSTORE)
+    index = leer_indice(directorio / ARCHIVO_INDICE)
+    return FAISS(embeddings, index, docstore, MapaPosiciones(docstore))
+
+
+def cargar_base_editable(directorio: Path, embeddings: Embeddings) -> FAISS:
+    """
+    Carga el índice completo en memoria para añadir o borrar documentos.
+
+    Acepta también el formato anterior (`index.pkl`) para migrar índices existentes;
+    al guardarlo de nuevo con `guardar_base` queda en el formato sin pickle.
+    """
+    directorio = Path(directorio)
+    if not (directorio / ARCHIVO_DOCSTORE).exists() and (directorio / ARCHIVO_PICKLE).exists():
+        logger.warning("Índice en formato pickle: se migrará al formato SQLite al guardarlo.")
+        return FAISS.load_local(str(directorio), embeddings, allow_dangerous_deserialization=True)
+
+    conn = sqlite3.connect(str(directorio / ARCHIVO_DOCSTORE))
+    try:
+        filas = conn.execute("SELECT pos, id, texto, metadata FROM chunks ORDER BY pos").fetchall()
+    finally:
+        conn.close()
+    documentos: Dict[str, Document] = {}
+    index_to_docstore_id: Dict[int, str] = {}
+    for pos, id_doc, texto, metadata in filas:
+        documentos[id_doc] = Document(page_content=texto, metadata=json.loads(metadata))
+        index_to_docstore_id[pos] = id_doc
+    index = faiss.read_index(str(directorio / ARCHIVO_INDICE))
+    return FAISS(embeddings, index, InMemoryDocstore(documentos), index_to_docstore_id)
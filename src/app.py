@@ -1,29 +1,26 @@
 import streamlit as st
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.prompts import PromptTemplate
 from pathlib import Path
 import time
 import torch
-import requests
-
-# --- Importaciones de Modelos Específicos (Actualizadas) ---
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-except ImportError as e:
-    st.error(f"Error al importar langchain_google_genai: {e}. Instala con: 'pip install langchain-google-genai'")
-    st.stop()
-
-try:
-    from langchain_ollama import ChatOllama
-except ImportError as e:
-    st.error(f"Error al importar langchain_ollama: {e}. Instala con: 'pip install langchain-ollama'")
-    st.stop()
 
 # --- Importaciones para la Cadena LCEL (Método Moderno) ---
-from langchain_core.runnables import RunnablePassthrough, RunnableParallel
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough, RunnableParallel
 from langchain_core.output_parsers import StrOutputParser
 
+from cache_consultas import CacheConsultas
+from cache_semantico import CacheSemantica, UMBRAL_SIMILITUD
+from contexto import empaquetar_contexto, presupuesto_modelo
+from diversidad import LAMBDA_MMR, buscar_diverso
+from embeddings_cpu import EmbeddingsCPU, leer_config_embeddings
+from generaciones import IndiceVivo
+from proveedores import PLAZO_PRIMER_TOKEN, LLMGestionado, PoolProveedores
+from rag import MODEL_CONFIG, PROMPT_TEMPLATE, LLMNoDisponible, format_docs
+from rerank import FACTOR_CANDIDATOS, PRESUPUESTO_MS, Reordenador
+from shards import cargar_busqueda_lexica, cargar_indice_consultas
+from trazas import RegistroTrazas, Traza, estimar_tokens, iniciar_servidor_metricas
+from utils import medir_stream
+
 # --- Configuración de la Página ---
 st.set_page_config(
     page_title="Asistente INAOE 🚀",
@@ -35,87 +32,103 @@ st.set_page_config(
 # --- Constantes y Configuración de Modelos ---
 RUTA_PROYECTO = Path(__file__).resolve().parent.parent
 RUTA_DB = RUTA_PROYECTO / "indice_faiss"
-
-MODEL_CONFIG = {
-    "mistral:7b": {
-        "provider": "ollama",
-        "info": "🏆 Local - Excelente para investigación, gratis, requiere 4GB RAM."
-    },
-    "gemini-1.5-flash": {
-        "provider": "google",
-        "info": "🟢 API Google - Rápido y preciso, requiere API key, 15 req/min gratis."
-    },
-}
-
-PROMPT_TEMPLATE = """Eres un asistente experto en investigación del INAOE. Tu tarea es responder a la pregunta del usuario de la forma más completa y precisa posible.
-
-Para ello, debes seguir estas reglas:
-1.  **COMBINA CONOCIMIENTO:** Fusiona tu propio conocimiento general sobre ciencia, tecnología y el INAOE con la información específica encontrada en los siguientes documentos de contexto.
-2.  **PRIORIZA EL CONTEXTO:** Si la respuesta se encuentra en los documentos, dale prioridad a esa información para que la respuesta sea fundamentada.
-3.  **USA CONOCIMIENTO GENERAL:** Si los documentos no contienen información relevante para la pregunta (o si el contexto está vacío), responde utilizando tu conocimiento general. No te limites a decir "no encontré información".
-4.  **SÉ COMPLETO:** Proporciona respuestas detalladas y bien estructuradas, adecuadas para un público de investigadores.
-
-A continuación, se presenta el contexto y la pregunta.
-
-CONTEXTO DE LOS DOCUMENTOS:
-{context}
-
-PREGUNTA: {question}
-
-RESPUESTA EXPERTA:"""
+RUTA_CACHE_RESPUESTAS = RUTA_PROYECTO / "cache_respuestas.sqlite"
+RUTA_TRAZAS = RUTA_PROYECTO / "trazas.jsonl"
 
 
 # --- Funciones de Carga y Configuración (Cacheadas) ---
 
+def cargar_generacion(ruta_db, anterior):
+    """Abre una generación del índice y su búsqueda BM25, reutilizando el modelo de embeddings si no cambió."""
+    # Mismo modelo y backend con los que se calcularon los vectores del índice
+    config_embeddings = leer_config_embeddings(ruta_db)
+    embeddings = anterior.db.embeddings if anterior is not None else None
+    if (getattr(embeddings, "modelo", None), getattr(embeddings, "backend", None)) != \
+            (config_embeddings["modelo"], config_embeddings["backend"]):
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        embeddings = EmbeddingsCPU(config_embeddings["modelo"], config_embeddings["backend"], device=device)
+    # Índice único o shards consultados en paralelo, con los parámetros de búsqueda de la ingesta
+    db = cargar_indice_consultas(ruta_db, embeddings)
+    return db, cargar_busqueda_lexica(ruta_db, db)
+
 @st.cache_resource
 def cargar_base_datos():
-    """Carga la base de datos vectorial FAISS de forma segura."""
+    """
+    Carga la base de datos vectorial FAISS de forma segura. Cuando la ingesta publica
+    otra generación, se carga en segundo plano y reemplaza a la actual entre consultas.
+    """
     if not RUTA_DB.exists():
         st.error(f"❌ No se encontró la base de datos en: {RUTA_DB}")
         st.info("💡 Ejecuta primero: `python procesar_docs.py`")
         return None
     try:
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={'device': device}
-        )
-        return FAISS.load_local(str(RUTA_DB), embeddings, allow_dangerous_deserialization=True)
+        indice = IndiceVivo(RUTA_DB, cargar_generacion)
     except Exception as e:
         st.error(f"Error al cargar la base de datos: {e}")
         return None
 
-@st.cache_data(ttl=300)
-def verificar_ollama():
-    """Verifica si el servicio de Ollama está activo."""
+    # Se obtienen aquí: la recarga corre en un hilo de fondo, fuera de la ejecución de Streamlit
+    cache_consultas, cache_semantica = obtener_cache_consultas(), obtener_cache_semantica()
+
+    def liberar_caches(anterior, nueva):
+        # Los resultados y embeddings cacheados pertenecen a la generación anterior
+        cache_consultas.vaciar()
+        cache_semantica.liberar_version(anterior.version)
+
+    indice.al_cambiar(liberar_caches)
+    return indice
+
+@st.cache_resource
+def obtener_reordenador():
+    """Cross-encoder local para reordenar los candidatos; None si no se puede cargar."""
     try:
-        requests.get("http://localhost:11434", timeout=3)
-        return True
-    except requests.ConnectionError:
-        return False
+        return Reordenador(device='cuda' if torch.cuda.is_available() else 'cpu')
+    except Exception as e:
+        st.warning(f"⚠️ No se pudo cargar el modelo de reordenamiento: {e}")
+        return None
 
-# --- Fábrica de LLMs (LLM Factory) ---
+@st.cache_resource
+def obtener_cache_consultas():
+    """Caché de consultas compartida por todas las sesiones; se vacía si cambia el índice."""
+    return CacheConsultas(RUTA_DB)
 
-def get_llm(modelo, temperature):
-    """Fábrica que devuelve una instancia del LLM seleccionado."""
-    config = MODEL_CONFIG.get(modelo, {})
-    provider = config.get("provider")
+@st.cache_resource
+def obtener_cache_semantica():
+    """Caché persistente de respuestas para preguntas casi idénticas."""
+    return CacheSemantica(RUTA_CACHE_RESPUESTAS)
 
-    if provider == "google":
-        if 'GOOGLE_API_KEY' not in st.secrets:
-            st.error("🚨 Falta la API Key de Google en .streamlit/secrets.toml.")
-            return None
-        return ChatGoogleGenerativeAI(model=modelo, api_key=st.secrets["GOOGLE_API_KEY"], temperature=temperature)
+@st.cache_resource
+def obtener_registro_trazas():
+    """Registro de trazas por etapa (JSONL) y endpoint /metrics para Prometheus."""
+    registro = RegistroTrazas(RUTA_TRAZAS)
+    iniciar_servidor_metricas(registro)
+    return registro
 
-    elif provider == "ollama":
-        if not verificar_ollama():
-            st.error("🚨 Ollama no está ejecutándose. Inicia el servicio de Ollama para usar este modelo.")
-            return None
-        return ChatOllama(model=modelo, temperature=temperature)
+@st.cache_resource
+def obtener_pool_proveedores():
+    """Clientes de LLM, límites por proveedor e interruptores compartidos por todas las sesiones."""
+    api_key = st.secrets["GOOGLE_API_KEY"] if 'GOOGLE_API_KEY' in st.secrets else None
+    return PoolProveedores(google_api_key=api_key)
 
-    else:
-        st.error(f"🚨 Proveedor '{provider}' para el modelo '{modelo}' no está configurado.")
-        return None
+# --- Fábrica de LLMs (LLM Factory) ---
+
+def get_llm(modelo, temperature, respaldo=None):
+    """
+    Fábrica que devuelve una instancia del LLM seleccionado (None si no está disponible).
+    Con `respaldo` = (modelo, plazo) se lanza ese modelo si el principal no da el primer token a tiempo.
+    """
+    pool = obtener_pool_proveedores()
+    modelo_respaldo, plazo = respaldo if respaldo else (None, PLAZO_PRIMER_TOKEN)
+    try:
+        # El cliente se crea una vez por (modelo, temperatura) y se reutiliza entre ejecuciones
+        pool.cliente(modelo, temperature)
+    except LLMNoDisponible as e:
+        if modelo_respaldo is None:
+            st.error(f"🚨 {e}")
+            return None
+        st.warning(f"⚠️ {e} Se usará {modelo_respaldo}.")
+    return LLMGestionado(pool=pool, modelo=modelo, temperature=temperature,
+                         respaldo=modelo_respaldo, plazo_primer_token=plazo)
 
 # --- Funciones de la Interfaz de Usuario ---
 
@@ -130,43 +143,187 @@ def render_sidebar():
     chunk_size = 5
     temperature = 0.2
 
-    return modelo_seleccionado, chunk_size, temperature
+    busqueda_hibrida = st.sidebar.checkbox(
+        "🔤 Búsqueda híbrida (BM25 + vectores)", value=True,
+        help="Combina la similitud semántica con coincidencias exactas de términos técnicos."
+    )
+
+    with st.sidebar.expander("🎯 Reordenamiento"):
+        usar_rerank = st.checkbox(
+            "Reordenar con cross-encoder", value=False,
+            help=f"Recupera {FACTOR_CANDIDATOS}× más candidatos y envía al modelo sólo los mejores."
+        )
+        presupuesto_rerank = st.slider("Presupuesto por consulta (ms)", 50, 2000, PRESUPUESTO_MS, 50)
+
+    with st.sidebar.expander("🧭 Diversidad"):
+        usar_mmr = st.checkbox(
+            "Evitar chunks redundantes (MMR)", value=False, disabled=busqueda_hibrida,
+            help="Entre varios candidatos elige los relevantes que además aportan algo distinto a los ya "
+                 "elegidos. Sólo con búsqueda vectorial."
+        )
+        lambda_mmr = st.slider("Relevancia frente a diversidad (λ)", 0.0, 1.0, LAMBDA_MMR, 0.05)
+        k_adaptativo = st.checkbox(
+            "k adaptativo", value=False, disabled=busqueda_hibrida,
+            help="Deja de añadir chunks cuando la similitud con la pregunta cae de golpe. Sólo con búsqueda vectorial."
+        )
+
+    with st.sidebar.expander("📦 Contexto"):
+        compactar = st.checkbox(
+            "Fusionar chunks solapados y limitar tokens", value=True,
+            help="Une los chunks contiguos de una misma página, quita el texto repetido y envía los más "
+                 "relevantes hasta el presupuesto de tokens."
+        )
+        presupuesto_contexto = st.number_input(
+            "Presupuesto de contexto (tokens)", 200, 32000, presupuesto_modelo(modelo_seleccionado), 100,
+            key=f"presupuesto_{modelo_seleccionado}"
+        )
+
+    with st.sidebar.expander("🛟 Modelo de respaldo"):
+        otros = [m for m in MODEL_CONFIG if m != modelo_seleccionado]
+        usar_respaldo = st.checkbox(
+            "Lanzar otro modelo si el primero tarda", value=False, disabled=not otros,
+            help="Si el modelo elegido no empieza a responder dentro del plazo, también se consulta el de "
+                 "respaldo y se muestra la respuesta que llegue primero."
+        )
+        modelo_respaldo = st.selectbox("Modelo de respaldo", otros) if otros else None
+        plazo_respaldo = st.slider("Plazo para el primer token (s)", 1.0, 30.0, PLAZO_PRIMER_TOKEN, 0.5)
+
+    with st.sidebar.expander("🧠 Caché de respuestas"):
+        usar_cache = st.checkbox("Reutilizar respuestas de preguntas similares", value=True)
+        umbral_cache = st.slider("Similitud mínima", 0.80, 1.00, UMBRAL_SIMILITUD, 0.01)
+
+    respaldo = (modelo_respaldo, plazo_respaldo) if usar_respaldo and modelo_respaldo else None
+    if respaldo is not None and compactar:
+        # El contexto se construye antes de saber qué modelo responde: tiene que caber en los dos
+        presupuesto_contexto = min(presupuesto_contexto, presupuesto_modelo(modelo_respaldo))
+
+    return (modelo_seleccionado, chunk_size, temperature, umbral_cache if usar_cache else None,
+            busqueda_hibrida, presupuesto_rerank if usar_rerank else None, respaldo,
+            int(presupuesto_contexto) if compactar else None,
+            {"usar_mmr": usar_mmr, "adaptativo": k_adaptativo, "lambda_mmr": lambda_mmr}
+            if not busqueda_hibrida and (usar_mmr or k_adaptativo) else None)
+
+def render_estadisticas_cache(contenedor, cache_semantica):
+    """Muestra los contadores de la caché de respuestas en la barra lateral."""
+    stats = cache_semantica.estadisticas()
+    contenedor.caption(
+        f"🧠 Caché de respuestas: {stats['aciertos']} aciertos / {stats['fallos']} fallos "
+        f"({stats['tasa_aciertos']:.0%}), {stats['entradas']} respuestas guardadas"
+    )
+
+def render_generacion(indice, generacion):
+    """Muestra en la barra lateral qué generación del índice está sirviendo las consultas."""
+    texto = f"🗂️ Índice: generación {generacion.numero}"
+    if generacion.publicada:
+        texto += f" (publicada {generacion.publicada.replace('T', ' ')})"
+    if indice.cargando is not None:
+        texto += f" · cargando la generación {indice.cargando}…"
+    st.sidebar.caption(texto)
+    if indice.error:
+        st.sidebar.caption(f"⚠️ No se pudo cargar la última generación: {indice.error}")
 
 # --- Flujo Principal de la Aplicación ---
 
-def format_docs(docs):
-    """Formatea los documentos recuperados en una sola cadena de texto."""
-    return "\n\n".join(doc.page_content for doc in docs)
+def mostrar_traza(contenedor, datos):
+    """Muestra la duración de cada etapa de la consulta y el tamaño del contexto."""
+    with contenedor.expander("🔬 Traza de la consulta"):
+        st.table([{"Etapa": etapa, "Duración (ms)": f"{ms:.1f}"} for etapa, ms in datos["etapas"].items()])
+        st.caption(
+            f"Proveedor: {datos['proveedor']} · Modelo: {datos['modelo']} · "
+            f"Contexto: {datos.get('contexto_caracteres', 0)} caracteres (~{datos.get('contexto_tokens', 0)} tokens"
+            + (f", {datos['contexto_tokens_sin_empaquetar']} sin empaquetar" if 'contexto_tokens_sin_empaquetar' in datos else "")
+            + f") · Total: {datos['total_ms']:.0f} ms"
+        )
+
+def mostrar_fuentes(contenedor, documentos):
+    """Muestra las fuentes consultadas en el contenedor indicado."""
+    if documentos:
+        with contenedor.expander("📚 Ver fuentes consultadas"):
+            for doc in documentos:
+                st.info(f"Fuente: {doc.metadata.get('source', 'N/A')} - Página: {doc.metadata.get('page', 'N/A')}")
 
 def main():
     st.title("Asistente de Investigación INAOE 🤖")
     st.write("Hazme preguntas sobre los documentos del INAOE y te ayudaré a encontrar la información.")
 
-    modelo_sel, chunk_size, temp = render_sidebar()
+    (modelo_sel, chunk_size, temp, umbral_cache, busqueda_hibrida, presupuesto_rerank, respaldo,
+     presupuesto_contexto, diversidad) = render_sidebar()
+    contenedor_estadisticas = st.sidebar.empty()
 
-    db = cargar_base_datos()
+    indice = cargar_base_datos()
     # --- INICIO DE LA SECCIÓN CORREGIDA (SOLUCIÓN ERROR #2 y #3) ---
     # Esta comprobación es CRUCIAL. Si db es None, detenemos la app.
-    if db is None:
+    if indice is None:
         st.warning("La base de datos no está disponible. No se pueden realizar consultas.")
         st.stop()
     # --- FIN DE LA SECCIÓN CORREGIDA ---
+    # Toda la ejecución usa la misma generación aunque se active otra mientras tanto
+    generacion = indice.obtener()
+    db = generacion.db
+    render_generacion(indice, generacion)
 
-    llm = get_llm(modelo_sel, temp)
+    llm = get_llm(modelo_sel, temp, respaldo)
     if llm is None:
         st.stop()
 
     # Create retriever and chain only if db and llm are available
     if db is not None and llm is not None:
         try:
-            retriever = db.as_retriever(search_kwargs={"k": chunk_size})
+            cache_consultas = obtener_cache_consultas()
+            cache_semantica = obtener_cache_semantica()
+            lexico = generacion.lexico if busqueda_hibrida else None
+            reordenador = obtener_reordenador() if presupuesto_rerank is not None else None
+
+            registro_trazas = obtener_registro_trazas()
+            traza = Traza(MODEL_CONFIG[modelo_sel]["provider"], modelo_sel)
+
+            def recuperar(pregunta):
+                """Top chunk_size documentos; con reordenamiento se puntúan más candidatos y se conservan los mejores."""
+                with traza.span("embedding"):
+                    vector = cache_consultas.embedding(db, pregunta)
+                k = chunk_size if reordenador is None else chunk_size * FACTOR_CANDIDATOS
+                if diversidad is not None and lexico is None:
+                    estadisticas = {}
+                    with traza.span("busqueda_diversa"):
+                        docs = buscar_diverso(db, vector, k, estadisticas=estadisticas, **diversidad)
+                    traza.atributos["candidatos_diversidad"] = estadisticas.get("candidatos", 0)
+                else:
+                    with traza.span("busqueda_hibrida" if lexico is not None else "busqueda"):
+                        docs = cache_consultas.buscar(db, pregunta, k, lexico)
+                if reordenador is not None:
+                    with traza.span("reordenamiento"):
+                        docs = reordenador.reordenar(pregunta, docs, chunk_size, presupuesto_rerank)
+                traza.atributos["documentos"] = len(docs)
+                return docs
+
+            def construir_contexto(x):
+                docs = x["docs"]
+                if presupuesto_contexto is not None:
+                    with traza.span("empaquetado"):
+                        docs, empaquetado = empaquetar_contexto(docs, presupuesto_contexto)
+                    traza.atributos.update(contexto_tokens_sin_empaquetar=empaquetado["tokens_originales"],
+                                           piezas_contexto=empaquetado["incluidas"])
+                with traza.span("format_docs"):
+                    contexto = format_docs(docs)
+                traza.atributos.update(contexto_caracteres=len(contexto), contexto_tokens=estimar_tokens(contexto))
+                return contexto
+
+            def construir_prompt(x):
+                with traza.span("prompt"):
+                    valor = prompt.invoke(x)
+                traza.atributos["prompt_tokens"] = estimar_tokens(valor.to_string())
+                return valor
+
+            retriever = RunnableLambda(recuperar)
             prompt = PromptTemplate.from_template(PROMPT_TEMPLATE)
 
+            # Se recupera una sola vez; el contexto se construye a partir de los mismos documentos.
             rag_chain_with_source = RunnableParallel(
-                {"context": retriever | format_docs, "question": RunnablePassthrough(), "docs": retriever}
+                {"docs": retriever, "question": RunnablePassthrough()}
+            ).assign(
+                context=construir_contexto
             ).assign(answer=(
-                RunnablePassthrough()
-                | prompt
+                RunnableLambda(construir_prompt)
                 | llm
                 | StrOutputParser()
             ))
@@ -188,25 +345,102 @@ def main():
         st.rerun()
 
     if buscar_presionado and pregunta:
-        with st.spinner(f"🤖 Buscando respuesta con {modelo_sel}..."):
-            start_time = time.time()
-            try:
-                result = rag_chain_with_source.invoke(pregunta)
-                end_time = time.time()
+        st.markdown("### 📝 Respuesta:")
+        # Contenedores en el orden de la página; se llenan a medida que llega cada parte.
+        contenedor_respuesta = st.container()
+        contenedor_metricas = st.container()
+        contenedor_fuentes = st.container()
+        aviso = contenedor_respuesta.empty()
+        aviso.info(f"🤖 Buscando respuesta con {modelo_sel}...")
+
+        metricas = {}
+        resultado = {}
+        start_time = time.perf_counter()
+
+        def tokens_respuesta():
+            """Consume la cadena en streaming: muestra las fuentes al recuperarlas y cede los tokens."""
+            primer_token = True
+            for parte in rag_chain_with_source.stream(pregunta):
+                if "docs" in parte:
+                    metricas["recuperacion"] = time.perf_counter() - start_time
+                    resultado["docs"] = parte["docs"]
+                    mostrar_fuentes(contenedor_fuentes, parte["docs"])
+                if "answer" in parte:
+                    if primer_token:
+                        traza.agregar("llm_primer_token", traza.desde("prompt"))
+                        primer_token = False
+                    aviso.empty()
+                    yield parte["answer"]
+            traza.agregar("llm", traza.desde("prompt"))
 
-                st.markdown("### 📝 Respuesta:")
-                st.write(result.get("answer", "No se pudo generar una respuesta."))
-
-                st.metric("⏱️ Tiempo de respuesta", f"{end_time - start_time:.2f} segundos")
-
-                documentos = result.get("docs", [])
-                if documentos:
-                    with st.expander("📚 Ver fuentes consultadas"):
-                        for doc in documentos:
-                            st.info(f"Fuente: {doc.metadata.get('source', 'N/A')} - Página: {doc.metadata.get('page', 'N/A')}")
+        try:
+            cacheada = None
+            if umbral_cache is not None:
+                with traza.span("embedding"):
+                    vector_pregunta = cache_consultas.embedding(db, pregunta)
+                with traza.span("cache_semantica"):
+                    version_indice = generacion.version
+                    cacheada = cache_semantica.buscar(vector_pregunta, modelo_sel, version_indice, umbral_cache)
+
+            if cacheada is not None:
+                traza.atributos["cache"] = "semantica"
+                aviso.empty()
+                contenedor_respuesta.caption(
+                    f"⚡ Respuesta reutilizada de la caché (similitud {cacheada['similitud']:.2f} "
+                    f"con «{cacheada['pregunta']}»)"
+                )
+                contenedor_respuesta.write(cacheada["respuesta"])
+                mostrar_fuentes(contenedor_fuentes, cacheada["docs"])
+                contenedor_metricas.metric("⏱️ Tiempo de respuesta", f"{time.perf_counter() - start_time:.2f} segundos")
+            else:
+                respuesta = contenedor_respuesta.write_stream(medir_stream(tokens_respuesta(), metricas))
+                traza.atributos["respuesta_tokens"] = estimar_tokens(respuesta or "")
+                modelo_respuesta = llm.info.get("modelo", modelo_sel)
+                if llm.info.get("respaldo"):
+                    traza.etiquetas.update(proveedor=MODEL_CONFIG[modelo_respuesta]["provider"], modelo=modelo_respuesta)
+                    traza.atributos["respaldo_de"] = modelo_sel
+                    contenedor_respuesta.caption(f"🛟 Respondió el modelo de respaldo ({modelo_respuesta}).")
+                if not respuesta:
+                    contenedor_respuesta.write("No se pudo generar una respuesta.")
+                elif umbral_cache is not None:
+                    # Con respaldo, la respuesta queda en la caché del modelo que la generó
+                    cache_semantica.guardar(pregunta, vector_pregunta, modelo_respuesta, version_indice,
+                                            respuesta, resultado.get("docs", []))
+
+                col_recuperacion, col_primer, col_generacion, col_total = contenedor_metricas.columns(4)
+                col_recuperacion.metric(
+                    "🔎 Recuperación" + (" híbrida" if lexico is not None else ""),
+                    f"{metricas.get('recuperacion', 0) * 1000:.0f} ms"
+                )
+                col_primer.metric("⚡ Primer token", f"{metricas.get('primer_token', 0):.2f} segundos")
+                col_generacion.metric(
+                    "✍️ Generación",
+                    f"{metricas.get('generacion', 0) - metricas.get('recuperacion', 0):.2f} segundos"
+                )
+                col_total.metric("⏱️ Tiempo de respuesta", f"{time.perf_counter() - start_time:.2f} segundos")
 
-            except Exception as e:
-                st.error(f"❌ Error al generar la respuesta: {e}")
+        except Exception as e:
+            aviso.empty()
+            traza.atributos["error"] = str(e)
+            st.error(f"❌ Error al generar la respuesta: {e}")
+
+        mostrar_traza(contenedor_metricas, registro_trazas.registrar(traza))
+
+    render_estadisticas_cache(contenedor_estadisticas, cache_semantica)
+    stats_pool = obtener_pool_proveedores().estadisticas()
+    circuitos = ", ".join(f"{nombre}: {p['circuito']}" for nombre, p in stats_pool["proveedores"].items()
+                          if p["peticiones"])
+    if circuitos:
+        st.sidebar.caption(
+            f"🔌 Proveedores ({circuitos}) · respaldo lanzado {stats_pool['respaldos_lanzados']} veces, "
+            f"ganó {stats_pool['respaldos_ganadores']}"
+        )
+    if reordenador is not None:
+        stats = reordenador.estadisticas()
+        st.sidebar.caption(
+            f"🎯 Reordenamiento: {stats['reordenadas']} consultas, {stats['excedidas']} fuera de presupuesto, "
+            f"{stats['pares_en_cache']} pares en caché"
+        )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
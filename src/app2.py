@@ -1,16 +1,19 @@
 # app.py
 
 import streamlit as st
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.prompts import PromptTemplate
 from langchain_core.runnables import RunnableParallel, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from pathlib import Path
+import itertools
 import time
 import torch
 import requests
 
+from embeddings_cpu import EmbeddingsCPU, leer_config_embeddings
+from shards import cargar_indice_consultas
+from utils import medir_stream
+
 # --- Importaciones de Modelos Específicos ---
 # Se mantienen las importaciones para que la estructura sea extensible en el futuro.
 try:
@@ -81,11 +84,10 @@ def cargar_base_datos():
         return None
     try:
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={'device': device}
-        )
-        return FAISS.load_local(str(RUTA_DB), embeddings, allow_dangerous_deserialization=True)
+        # Mismo modelo y backend con los que se calcularon los vectores del índice
+        config_embeddings = leer_config_embeddings(RUTA_DB)
+        embeddings = EmbeddingsCPU(config_embeddings["modelo"], config_embeddings["backend"], device=device)
+        return cargar_indice_consultas(RUTA_DB, embeddings)
     except Exception as e:
         st.error(f"Error al cargar la base de datos: {e}")
         return None
@@ -190,34 +192,22 @@ def main():
         # Crear el prompt template
         prompt = PromptTemplate.from_template(PROMPT_TEMPLATE)
         
-        # Crear la nueva cadena RAG con LCEL
-        def create_rag_chain():
-            def rag_invoke(question):
-                # Obtener documentos relevantes
-                docs = retriever.get_relevant_documents(question)
-                context = format_docs(docs)
-                
-                # Crear el prompt
-                formatted_prompt = prompt.format(context=context, question=question)
-                
-                # Obtener respuesta del LLM
-                if llm is None:
-                    return {"context": context, "question": question, "answer": "Error: LLM no disponible"}
-                response = llm.invoke(formatted_prompt)
-                # Convertir la respuesta a string si es necesario
-                if hasattr(response, 'content'):
-                    answer = response.content
-                else:
-                    answer = str(response)
-                
-                return {
-                    "context": context,
-                    "question": question,
-                    "answer": answer
-                }
-            return rag_invoke
-        
-        rag_chain_with_source = create_rag_chain()
+        # Recuperación y generación separadas para poder mostrar las fuentes antes de la respuesta
+        def recuperar_contexto(question):
+            """Obtiene los documentos relevantes y los formatea como contexto."""
+            docs = retriever.get_relevant_documents(question)
+            return format_docs(docs)
+
+        def generar_respuesta(context, question):
+            """Genera la respuesta del LLM token a token."""
+            formatted_prompt = prompt.format(context=context, question=question)
+            if llm is None:
+                yield "Error: LLM no disponible"
+                return
+            for chunk in llm.stream(formatted_prompt):
+                # Los modelos de chat devuelven mensajes; los LLM de texto, cadenas
+                yield chunk.content if hasattr(chunk, 'content') else str(chunk)
+
     except Exception as e:
         st.error(f"Error al crear la cadena de QA: {e}")
         return
@@ -235,25 +225,37 @@ def main():
         st.rerun()
 
     if buscar_presionado and pregunta:
-        with st.spinner(f"🤖 Buscando respuesta con {modelo_sel}..."):
-            start_time = time.time()
-            try:
-                # Invocación simplificada con la nueva cadena LCEL
-                result = rag_chain_with_source(pregunta)
-                end_time = time.time()
-
-                st.markdown("### 📝 Respuesta:")
-                st.write(result.get("answer", "No se pudo generar una respuesta."))
-                
-                st.metric("⏱️ Tiempo de respuesta", f"{end_time - start_time:.2f} segundos")
-
-                # Mostrar fuentes consultadas
-                if result.get("context") and "No se encontró información relevante" not in result.get("answer", ""):
-                    with st.expander("📚 Ver fuentes consultadas"):
-                        st.write(result.get("context", ""))
-
-            except Exception as e:
-                st.error(f"❌ Error al generar la respuesta: {e}")
+        start_time = time.perf_counter()
+        try:
+            with st.spinner("🔎 Buscando documentos relevantes..."):
+                context = recuperar_contexto(pregunta)
+            tiempo_recuperacion = time.perf_counter() - start_time
+
+            st.markdown("### 📝 Respuesta:")
+            contenedor_respuesta = st.container()
+            contenedor_metricas = st.container()
+
+            # Mostrar fuentes consultadas en cuanto termina la recuperación
+            if context:
+                with st.expander("📚 Ver fuentes consultadas"):
+                    st.write(context)
+
+            metricas = {}
+            with contenedor_respuesta:
+                with st.spinner(f"🤖 Generando respuesta con {modelo_sel}..."):
+                    tokens = medir_stream(generar_respuesta(context, pregunta), metricas)
+                    primer_token = next(tokens, "")
+                respuesta = st.write_stream(itertools.chain([primer_token], tokens))
+            if not respuesta:
+                contenedor_respuesta.write("No se pudo generar una respuesta.")
+
+            col_primer, col_generacion, col_total = contenedor_metricas.columns(3)
+            col_primer.metric("⚡ Primer token", f"{tiempo_recuperacion + metricas.get('primer_token', 0):.2f} segundos")
+            col_generacion.metric("✍️ Generación", f"{metricas.get('generacion', 0):.2f} segundos")
+            col_total.metric("⏱️ Tiempo de respuesta", f"{time.perf_counter() - start_time:.2f} segundos")
+
+        except Exception as e:
+            st.error(f"❌ Error al generar la respuesta: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""
+Barrido de los parámetros de división y recuperación: chunk_size, chunk_overlap y k.
+
+Para cada combinación se mide, sobre un conjunto pequeño de preguntas etiquetadas:
+- recall@k: fracción de preguntas con algún chunk de su página relevante entre los k primeros;
+- bytes del índice y tiempo de construcción (división + embeddings + índice);
+- latencia p50 de la búsqueda y caracteres del contexto que recibiría el LLM.
+
+Al final se imprimen las configuraciones óptimas de Pareto: las que ninguna otra
+iguala o mejora en todas las métricas a la vez.
+
+Los pasos caros se hacen una sola vez: el texto de los documentos se extrae una vez
+(y sale de la caché de páginas si ya se había extraído), las preguntas se convierten
+a embeddings una vez, y cada par (chunk_size, chunk_overlap) construye un solo índice
+que sirve para todos los k, con una única búsqueda por lotes a k máximo para el recall.
+
+Las preguntas son un JSONL con `pregunta`, `fuente` (nombre del archivo) y, si se
+quiere afinar a nivel de página, `pagina` (desde 0, como el metadato `page`). Sin
+archivo se generan preguntas sintéticas a partir de fragmentos de las páginas.
+
+    python autoajuste.py --preguntas preguntas.jsonl --chunk-size 500 1000 1500 --chunk-overlap 0 100 200 --k 3 5 8
+"""
+import argparse
+import json
+import logging
+import time
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from benchmark import DIR_DOCS, DIR_RESULTADOS, PALABRAS_CONSULTA, commit_actual, percentiles
+from cache_paginas import directorio_cache
+from cargadores import agregar_argumentos_carga, listar_documentos
+from embeddings_cpu import agregar_argumentos_embeddings, embeddings_desde_argumentos
+from indices import agregar_argumentos_indice, config_desde_argumentos, crear_indice, tamano_indice
+from ingesta import CHUNK_OVERLAP, CHUNK_SIZE, crear_splitter, procesar_archivos
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PREGUNTAS_SINTETICAS = 50
+# (métrica, True si mayor es mejor) que decide el frente de Pareto
+OBJETIVOS = (("recall", True), ("bytes_indice", False), ("construccion_s", False),
+             ("latencia_p50_ms", False), ("caracteres_contexto", False))
+
+
+# --- Preguntas ---
+
+def leer_preguntas_etiquetadas(ruta: Path) -> List[Dict]:
+    """Lista de {"pregunta", "fuente", "pagina"} (pagina None = cualquier página del archivo)."""
+    preguntas = []
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            if linea.strip():
+                datos = json.loads(linea)
+                preguntas.append({"pregunta": datos["pregunta"], "fuente": Path(datos["fuente"]).name,
+                                  "pagina": datos.get("pagina")})
+    return preguntas
+
+
+def preguntas_sinteticas(paginas: Sequence[Document], n: int) -> List[Dict]:
+    """Fragmentos de PALABRAS_CONSULTA palabras de páginas elegidas con semilla fija, etiquetados con su página."""
+    candidatas = [p for p in paginas if len(p.page_content.split()) >= 2 * PALABRAS_CONSULTA]
+    rng = np.random.default_rng(0)
+    preguntas = []
+    for i in rng.choice(len(candidatas), min(n, len(candidatas)), replace=False):
+        palabras = candidatas[i].page_content.split()
+        inicio = int(rng.integers(0, len(palabras) - PALABRAS_CONSULTA))
+        preguntas.append({"pregunta": " ".join(palabras[inicio:inicio + PALABRAS_CONSULTA]),
+                          "fuente": Path(candidatas[i].metadata["source"]).name,
+                          "pagina": candidatas[i].metadata.get("page")})
+    return preguntas
+
+
+def es_relevante(chunk: Document, pregunta: Dict) -> bool:
+    if Path(chunk.metadata.get("source", "")).name != pregunta["fuente"]:
+        return False
+    return pregunta["pagina"] is None or chunk.metadata.get("page") == pregunta["pagina"]
+
+
+# --- Barrido ---
+
+def evaluar_division(paginas: Sequence[Document], chunk_size: int, chunk_overlap: int, embeddings, config_indice,
+                     preguntas: List[Dict], vectores_preguntas: np.ndarray, valores_k: Sequence[int]) -> List[Dict]:
+    """Construye el índice de una división y lo evalúa para cada k; devuelve una fila por k."""
+    inicio = time.perf_counter()
+    chunks = crear_splitter(chunk_size, chunk_overlap).split_documents(paginas)
+    vectores = np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32)
+    index = crear_indice(vectores, config_indice)
+    index.add(vectores)
+    construccion_s = time.perf_counter() - inicio
+    bytes_indice = tamano_indice(index)
+
+    # Una sola búsqueda a k máximo: los primeros k de la lista sirven para cualquier k menor
+    _, ids = index.search(vectores_preguntas, max(valores_k))
+    relevantes = np.array([[i >= 0 and es_relevante(chunks[i], pregunta) for i in fila]
+                           for fila, pregunta in zip(ids, preguntas)])
+    longitudes = np.array([len(c.page_content) for c in chunks] + [0])  # id -1 (sin resultado) -> 0
+
+    filas = []
+    for k in valores_k:
+        index.search(vectores_preguntas[:1], k)  # calentamiento
+        latencias = []
+        for i in range(len(vectores_preguntas)):
+            t = time.perf_counter()
+            index.search(vectores_preguntas[i:i + 1], k)
+            latencias.append(time.perf_counter() - t)
+        filas.append({
+            "chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "k": k, "chunks": len(chunks),
+            "recall": float(relevantes[:, :k].any(axis=1).mean()),
+            "bytes_indice": bytes_indice,
+            "construccion_s": construccion_s,
+            "latencia_p50_ms": percentiles(latencias)["p50_ms"],
+            "caracteres_contexto": float(longitudes[ids[:, :k]].sum(axis=1).mean()),
+        })
+    logging.info(f"chunk_size={chunk_size} chunk_overlap={chunk_overlap}: {len(chunks)} chunks, "
+                 f"{bytes_indice / 1e6:.2f} MB, construcción {construccion_s:.1f}s, "
+                 + ", ".join(f"recall@{f['k']} {f['recall']:.2f}" for f in filas))
+    return filas
+
+
+def frente_pareto(filas: List[Dict]) -> List[Dict]:
+    """Filas no dominadas: ninguna otra es igual o mejor en todos los OBJETIVOS y mejor en alguno."""
+    def valores(fila):
+        return np.array([fila[m] if mayor else -fila[m] for m, mayor in OBJETIVOS])
+    matriz = np.array([valores(f) for f in filas])
+    return [fila for fila, v in zip(filas, matriz)
+            if not ((matriz >= v).all(axis=1) & (matriz > v).any(axis=1)).any()]
+
+
+def imprimir_tabla(filas: List[Dict]) -> None:
+    print(f"{'chunk_size':>10} {'overlap':>7} {'k':>3} {'chunks':>6} {'recall':>6} {'MB':>7} "
+          f"{'constr. s':>9} {'p50 ms':>7} {'contexto':>8}")
+    for f in sorted(filas, key=lambda f: (-f["recall"], f["caracteres_contexto"])):
+        print(f"{f['chunk_size']:>10} {f['chunk_overlap']:>7} {f['k']:>3} {f['chunks']:>6} {f['recall']:>6.2f} "
+              f"{f['bytes_indice'] / 1e6:>7.2f} {f['construccion_s']:>9.1f} {f['latencia_p50_ms']:>7.3f} "
+              f"{f['caracteres_contexto']:>8.0f}")
+
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Barrido de chunk_size, chunk_overlap y k con frente de Pareto.")
+    parser.add_argument("--preguntas", type=Path,
+                        help="JSONL con 'pregunta', 'fuente' y opcionalmente 'pagina' (sin él, preguntas sintéticas).")
+    parser.add_argument("--preguntas-sinteticas", type=int, default=PREGUNTAS_SINTETICAS,
+                        help="Preguntas a generar si no se da --preguntas.")
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[500, CHUNK_SIZE, 1500],
+                        help="Tamaños de chunk a probar (caracteres).")
+    parser.add_argument("--chunk-overlap", type=int, nargs="+", default=[0, 100, CHUNK_OVERLAP],
+                        help="Solapamientos a probar (caracteres).")
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5, 8], help="Valores de k a probar.")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para cargar los documentos.")
+    parser.add_argument("--salida", type=Path, help="Archivo JSON de resultados (por defecto en 'benchmarks/').")
+    agregar_argumentos_indice(parser)
+    agregar_argumentos_embeddings(parser)
+    agregar_argumentos_carga(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parsear_argumentos()
+    rutas = listar_documentos(DIR_DOCS, recursivo=True)
+    if not rutas:
+        logging.error(f"No hay documentos en {DIR_DOCS}.")
+        return
+
+    paginas = procesar_archivos(rutas, workers=args.workers, dividir=False, motor_pdf=args.motor_pdf,
+                                dir_cache_paginas=directorio_cache(args))
+    if args.preguntas:
+        preguntas = leer_preguntas_etiquetadas(args.preguntas)
+    else:
+        logging.warning("Sin --preguntas: se usan preguntas sintéticas (fragmentos literales de las páginas).")
+        preguntas = preguntas_sinteticas(paginas, args.preguntas_sinteticas)
+    if not preguntas:
+        logging.error("No hay preguntas con las que evaluar.")
+        return
+
+    embeddings = embeddings_desde_argumentos(args)
+    config_indice = config_desde_argumentos(args)
+    vectores_preguntas = np.asarray(embeddings.embed_queries([p["pregunta"] for p in preguntas]), dtype=np.float32)
+
+    combinaciones = [(tam, solape) for tam, solape in product(sorted(args.chunk_size), sorted(args.chunk_overlap))
+                     if solape < tam]
+    logging.info(f"{len(preguntas)} preguntas, {len(combinaciones)} divisiones x {len(args.k)} valores de k.")
+    filas: List[Dict] = []
+    for tam, solape in combinaciones:
+        filas += evaluar_division(paginas, tam, solape, embeddings, config_indice,
+                                  preguntas, vectores_preguntas, sorted(args.k))
+
+    pareto = frente_pareto(filas)
+    print(f"\nConfiguraciones óptimas de Pareto ({len(pareto)} de {len(filas)}):")
+    imprimir_tabla(pareto)
+
+    salida = args.salida or DIR_RESULTADOS / f"autoajuste_{datetime.now():%Y%m%d_%H%M%S}_{commit_actual()}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    with open(salida, "w") as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "commit": commit_actual(),
+                   "preguntas": len(preguntas), "sinteticas": args.preguntas is None,
+                   "resultados": filas, "pareto": pareto}, f, indent=4, ensure_ascii=False)
+    logging.info(f"Resultados guardados en: {salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Benchmark reproducible de la ingesta y de las consultas.
+
+Mide sobre el corpus de `documentos/` (y réplicas sintéticas del mismo):
+- carga de documentos (páginas/s), división y embeddings (chunks/s);
+- páginas/s de cada motor de extracción de PDF (ver `cargadores.py`);
+- construcción del índice (tiempo y tamaño), guardado y carga;
+- latencia p50/p95/p99 de la búsqueda para varios k y del pipeline RAG completo
+  con un LLM simulado y determinista, de modo que corre sin red;
+- sobrecoste de la recuperación con MMR y k adaptativo y cuántos chunks devuelve.
+
+El resultado se escribe en JSON para comparar ejecuciones entre commits:
+
+    python benchmark.py --escalas 1 10 --k 1 5 10 20
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+
+from almacen import guardar_base
+from cargadores import MOTORES_PDF, agregar_argumentos_carga, listar_documentos, medir_motores
+from diversidad import buscar_diverso
+from embeddings_cpu import agregar_argumentos_embeddings, embeddings_desde_argumentos
+from indices import agregar_argumentos_indice, config_desde_argumentos, crear_indice, guardar_config_indice, tamano_indice
+from ingesta import crear_base_vacia, crear_splitter, procesar_archivos
+from rag import PROMPT_TEMPLATE, LLMSimulado, format_docs
+from shards import cargar_indice_consultas
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RUTA_PROYECTO = Path(__file__).resolve().parent.parent
+DIR_DOCS = RUTA_PROYECTO / "documentos"
+DIR_RESULTADOS = RUTA_PROYECTO / "benchmarks"
+RUIDO_SINTETICO = 0.01  # desviación del ruido añadido a cada réplica de los vectores
+PALABRAS_CONSULTA = 12
+
+
+def percentiles(latencias_s: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99 y media en milisegundos."""
+    ms = np.asarray(latencias_s) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "media_ms": float(ms.mean())}
+
+
+def tamano_directorio(directorio: Path) -> int:
+    return sum(f.stat().st_size for f in Path(directorio).rglob("*") if f.is_file())
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RUTA_PROYECTO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+# --- Ingesta ---
+
+def medir_ingesta(rutas: List[str], embeddings, workers: int, motor_pdf: str):
+    """Carga, división y embeddings del corpus real; devuelve (chunks, vectores, métricas)."""
+    inicio = time.perf_counter()
+    paginas = procesar_archivos(rutas, workers=workers, dividir=False, motor_pdf=motor_pdf)
+    t_carga = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    chunks = crear_splitter().split_documents(paginas)
+    t_division = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    vectores = np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32)
+    t_embeddings = time.perf_counter() - inicio
+
+    metricas = {
+        "archivos": len(rutas),
+        "paginas": len(paginas),
+        "chunks": len(chunks),
+        "carga_s": t_carga,
+        "paginas_s": len(paginas) / t_carga if t_carga else 0.0,
+        "division_s": t_division,
+        "division_chunks_s": len(chunks) / t_division if t_division else 0.0,
+        "embeddings_s": t_embeddings,
+        "embeddings_chunks_s": len(chunks) / t_embeddings if t_embeddings else 0.0,
+    }
+    logging.info(f"Ingesta: {metricas['paginas_s']:.1f} páginas/s, división {metricas['division_chunks_s']:.0f} chunks/s, "
+                 f"embeddings {metricas['embeddings_chunks_s']:.1f} chunks/s")
+    return chunks, vectores, metricas
+
+
+def escalar(chunks: List[Document], vectores: np.ndarray, escala: int):
+    """Réplica sintética del corpus: cada copia perturba los vectores con ruido gaussiano fijo."""
+    if escala == 1:
+        return chunks, vectores
+    rng = np.random.default_rng(0)
+    copias_vectores = [vectores]
+    copias_chunks = list(chunks)
+    for copia in range(1, escala):
+        ruido = rng.normal(0, RUIDO_SINTETICO, vectores.shape).astype(np.float32)
+        copias_vectores.append(vectores + ruido)
+        copias_chunks += [Document(page_content=f"{c.page_content} [copia {copia}]", metadata=dict(c.metadata))
+                          for c in chunks]
+    return copias_chunks, np.vstack(copias_vectores)
+
+
+# --- Índice y consultas ---
+
+def medir_escala(chunks: List[Document], vectores: np.ndarray, consultas: List[str], vectores_consulta: np.ndarray,
+                 embeddings, config_indice, valores_k: Sequence[int], k_rag: int) -> Dict:
+    metricas: Dict = {"vectores": len(vectores)}
+
+    inicio = time.perf_counter()
+    db = crear_base_vacia(embeddings, crear_indice(vectores, config_indice))
+    db.add_embeddings(list(zip([c.page_content for c in chunks], vectores.tolist())),
+                      metadatas=[c.metadata for c in chunks])
+    metricas["construccion_s"] = time.perf_counter() - inicio
+    metricas["bytes_indice"] = tamano_indice(db.index)
+
+    directorio = Path(tempfile.mkdtemp(prefix="benchmark_indice_"))
+    try:
+        inicio = time.perf_counter()
+        guardar_base(db, directorio)
+        guardar_config_indice(directorio, config_indice)
+        metricas["guardado_s"] = time.perf_counter() - inicio
+        metricas["bytes_disco"] = tamano_directorio(directorio)
+        del db
+
+        inicio = time.perf_counter()
+        db = cargar_indice_consultas(directorio, embeddings)
+        metricas["carga_s"] = time.perf_counter() - inicio
+
+        db.similarity_search_with_score_by_vector(vectores_consulta[0].tolist(), k=max(valores_k))  # calentamiento
+        metricas["busqueda"] = {}
+        for k in valores_k:
+            latencias = []
+            for vector in vectores_consulta:
+                inicio = time.perf_counter()
+                db.similarity_search_with_score_by_vector(vector.tolist(), k=k)
+                latencias.append(time.perf_counter() - inicio)
+            metricas["busqueda"][f"k={k}"] = percentiles(latencias)
+
+        # Recuperación con diversidad a k_rag, frente a la búsqueda simple del mismo k
+        modos = {
+            "simple": lambda v: db.similarity_search_by_vector(v.tolist(), k=k_rag),
+            "mmr": lambda v: buscar_diverso(db, v, k_rag),
+            "k_adaptativo": lambda v: buscar_diverso(db, v, k_rag, usar_mmr=False, adaptativo=True),
+            "mmr_adaptativo": lambda v: buscar_diverso(db, v, k_rag, adaptativo=True),
+        }
+        metricas["diversidad"] = {}
+        for modo, buscar in modos.items():
+            latencias, chunks_devueltos, caracteres = [], [], []
+            for vector in vectores_consulta:
+                inicio = time.perf_counter()
+                docs = buscar(vector)
+                latencias.append(time.perf_counter() - inicio)
+                chunks_devueltos.append(len(docs))
+                caracteres.append(len(format_docs(docs)))
+            metricas["diversidad"][modo] = {"k_medio": float(np.mean(chunks_devueltos)),
+                                            "caracteres_contexto": float(np.mean(caracteres)), **percentiles(latencias)}
+
+        # Pipeline completo: embedding de la pregunta, búsqueda, contexto, prompt y LLM simulado
+        cadena = PromptTemplate.from_template(PROMPT_TEMPLATE) | LLMSimulado() | StrOutputParser()
+        latencias, caracteres = [], []
+        for pregunta in consultas:
+            inicio = time.perf_counter()
+            docs = db.similarity_search_by_vector(embeddings.embed_query(pregunta), k=k_rag)
+            contexto = format_docs(docs)
+            cadena.invoke({"context": contexto, "question": pregunta})
+            latencias.append(time.perf_counter() - inicio)
+            caracteres.append(len(contexto))
+        metricas["rag_simulado"] = {"k": k_rag, "caracteres_contexto": float(np.mean(caracteres)),
+                                    **percentiles(latencias)}
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    busqueda = metricas["busqueda"][f"k={valores_k[0]}"]
+    logging.info(f"{metricas['vectores']} vectores: construcción {metricas['construccion_s']:.2f}s, "
+                 f"{metricas['bytes_disco'] / 1e6:.2f} MB en disco, carga {metricas['carga_s'] * 1000:.1f} ms, "
+                 f"búsqueda k={valores_k[0]} p50 {busqueda['p50_ms']:.3f} ms / p99 {busqueda['p99_ms']:.3f} ms, "
+                 f"RAG simulado p50 {metricas['rag_simulado']['p50_ms']:.1f} ms, "
+                 f"MMR k={k_rag} p50 {metricas['diversidad']['mmr']['p50_ms']:.3f} ms")
+    return metricas
+
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta y consultas sobre 'documentos/'.")
+    parser.add_argument("--escalas", type=int, nargs="+", default=[1, 10],
+                        help="Multiplicadores del corpus para las réplicas sintéticas.")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10, 20], help="Valores de k a medir.")
+    parser.add_argument("--k-rag", type=int, default=5, help="Documentos por pregunta en el pipeline RAG simulado.")
+    parser.add_argument("--consultas", type=int, default=100, help="Preguntas de prueba por medición.")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para cargar los PDFs.")
+    parser.add_argument("--salida", type=Path, help="Archivo JSON de resultados (por defecto en 'benchmarks/').")
+    parser.add_argument("--motores-pdf", nargs="*", choices=list(MOTORES_PDF), default=list(MOTORES_PDF),
+                        help="Motores de PDF a comparar (los no instalados se omiten; vacío = no comparar).")
+    agregar_argumentos_indice(parser)
+    agregar_argumentos_embeddings(parser)
+    agregar_argumentos_carga(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parsear_argumentos()
+    rutas = listar_documentos(DIR_DOCS, recursivo=True)
+    if not rutas:
+        logging.error(f"No hay documentos en {DIR_DOCS}.")
+        return
+
+    motores_pdf = medir_motores(rutas, args.motores_pdf) if args.motores_pdf else {}
+    embeddings = embeddings_desde_argumentos(args)
+    config_indice = config_desde_argumentos(args)
+    chunks, vectores, ingesta = medir_ingesta(rutas, embeddings, args.workers, args.motor_pdf)
+    if not chunks:
+        logging.error("No se obtuvo ningún chunk de los documentos.")
+        return
+
+    # Preguntas deterministas: las primeras palabras de chunks elegidos con semilla fija
+    rng = np.random.default_rng(0)
+    elegidos = rng.choice(len(chunks), min(args.consultas, len(chunks)), replace=False)
+    consultas = [" ".join(chunks[i].page_content.split()[:PALABRAS_CONSULTA]) for i in elegidos]
+    latencias_embedding = []
+    vectores_consulta = []
+    for pregunta in consultas:
+        inicio = time.perf_counter()
+        vectores_consulta.append(embeddings.embed_query(pregunta))
+        latencias_embedding.append(time.perf_counter() - inicio)
+    vectores_consulta = np.asarray(vectores_consulta, dtype=np.float32)
+    ingesta["embedding_pregunta"] = percentiles(latencias_embedding)
+
+    resultados = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "maquina": {"plataforma": platform.platform(), "python": platform.python_version(),
+                    "nucleos": os.cpu_count()},
+        "configuracion": {clave: (str(valor) if isinstance(valor, Path) else valor)
+                          for clave, valor in vars(args).items()},
+        "ingesta": ingesta,
+        "motores_pdf": motores_pdf,
+        "escalas": {},
+    }
+    for escala in args.escalas:
+        chunks_escala, vectores_escala = escalar(chunks, vectores, escala)
+        resultados["escalas"][f"x{escala}"] = medir_escala(
+            chunks_escala, vectores_escala, consultas, vectores_consulta,
+            embeddings, config_indice, args.k, args.k_rag
+        )
+
+    salida = args.salida or DIR_RESULTADOS / f"benchmark_{datetime.now():%Y%m%d_%H%M%S}_{resultados['commit']}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    with open(salida, "w") as f:
+        json.dump(resultados, f, indent=4, ensure_ascii=False)
+    logging.info(f"Resultados guardados en: {salida}")
+
+
+if __name__ == "__main__":
+    main()
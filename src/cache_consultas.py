@@ -0,0 +1,149 @@
+"""
+Caché en proceso de embeddings de preguntas y resultados de búsqueda.
+
+Se vacía sola cuando cambia el índice FAISS en disco, así que nunca devuelve
+documentos de una versión anterior de la base de datos.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, List, Optional
+
+from langchain_core.documents import Document
+
+from lexico import buscar_hibrido
+
+
+def normalizar_pregunta(pregunta: str) -> str:
+    """Minúsculas, sin acentos, sin signos de puntuación y con espacios colapsados."""
+    texto = unicodedata.normalize("NFKD", pregunta.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
+
+
+def huella_indice(ruta_indice: Path) -> Optional[str]:
+    """
+    Huella barata (ruta, tamaño y mtime de cada archivo) del índice en disco, incluidos
+    los shards; se ignoran los directorios ocultos de una publicación en curso.
+    """
+    ruta_indice = Path(ruta_indice)
+    if not ruta_indice.exists():
+        return None
+    partes = []
+    for archivo in sorted(ruta_indice.rglob("*")):
+        relativa = archivo.relative_to(ruta_indice)
+        if archivo.is_file() and not any(parte.startswith(".") for parte in relativa.parts):
+            estado = archivo.stat()
+            partes.append(f"{relativa}:{estado.st_size}:{estado.st_mtime_ns}")
+    return "|".join(partes)
+
+
+def version_de_huella(huella: Optional[str]) -> str:
+    """Identificador corto de una huella del índice."""
+    return hashlib.sha1((huella or "").encode("utf-8")).hexdigest()[:12]
+
+
+class CacheLRU:
+    """Diccionario LRU con caducidad (TTL), seguro entre hilos."""
+
+    def __init__(self, max_entradas: int, ttl: float):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: Hashable) -> Any:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            guardado, valor = entrada
+            if time.monotonic() - guardado > self.ttl:
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave: Hashable, valor: Any) -> None:
+        with self._lock:
+            self._datos[clave] = (time.monotonic(), valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def vaciar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+
+class CacheConsultas:
+    """
+    Caché de embeddings de preguntas y de los top-k documentos recuperados.
+
+    Los resultados se indexan por (pregunta normalizada, k, híbrida); los embeddings sólo por
+    la pregunta, así que cambiar k reutiliza el vector y únicamente repite la búsqueda.
+    """
+
+    def __init__(self, ruta_indice: Path, max_entradas: int = 1000, ttl: float = 3600):
+        self.ruta_indice = Path(ruta_indice)
+        self.embeddings = CacheLRU(max_entradas, ttl)
+        self.resultados = CacheLRU(max_entradas, ttl)
+        self.aciertos = 0
+        self.fallos = 0
+        self._huella = huella_indice(self.ruta_indice)
+
+    def _verificar_indice(self) -> None:
+        huella = huella_indice(self.ruta_indice)
+        if huella != self._huella:
+            self.embeddings.vaciar()
+            self.resultados.vaciar()
+            self._huella = huella
+
+    def version_indice(self) -> str:
+        """Identificador corto de la versión del índice en disco."""
+        self._verificar_indice()
+        return version_de_huella(self._huella)
+
+    def vaciar(self) -> None:
+        """Descarta embeddings y resultados (p. ej. al cambiar de generación del índice)."""
+        self.embeddings.vaciar()
+        self.resultados.vaciar()
+
+    def embedding(self, db, pregunta: str) -> List[float]:
+        """Embedding de la pregunta, calculado una sola vez por pregunta normalizada."""
+        clave = normalizar_pregunta(pregunta)
+        vector = self.embeddings.obtener(clave)
+        if vector is None:
+            vector = db.embedding_function.embed_query(pregunta)
+            self.embeddings.guardar(clave, vector)
+        return vector
+
+    def buscar(self, db, pregunta: str, k: int, lexico=None) -> List[Document]:
+        """
+        Devuelve los k documentos más similares, usando la caché cuando es posible.
+        Con `lexico` (una BusquedaLexica) se fusionan los resultados vectoriales y BM25.
+        """
+        self._verificar_indice()
+        clave = (normalizar_pregunta(pregunta), k, lexico is not None)
+
+        documentos = self.resultados.obtener(clave)
+        if documentos is not None:
+            self.aciertos += 1
+            return documentos
+        self.fallos += 1
+
+        vector = self.embedding(db, pregunta)
+        if lexico is not None:
+            documentos = buscar_hibrido(db, lexico, vector, pregunta, k)
+        else:
+            documentos = db.similarity_search_by_vector(vector, k=k)
+        self.resultados.guardar(clave, documentos)
+        return documentos
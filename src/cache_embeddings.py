@@ -0,0 +1,176 @@
+"""
+Caché persistente de embeddings direccionada por contenido.
+
+Cada vector se guarda en un archivo binario float32 de tamaño fijo por fila y un
+índice SQLite relaciona el hash del texto del chunk con su fila. Hay un directorio
+por modelo, así que cambiar de modelo nunca devuelve vectores incompatibles.
+"""
+import hashlib
+import logging
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRADAS = 200_000  # ~300 MB con vectores de 384 dimensiones
+
+
+def hash_texto(texto: str) -> str:
+    """Clave de caché de un chunk: SHA-256 de su texto."""
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class CacheEmbeddings:
+    """Almacén en disco de vectores (archivo float32 + índice SQLite) con desalojo LRU."""
+
+    def __init__(self, directorio: Path, modelo: str, max_entradas: int = MAX_ENTRADAS):
+        self.directorio = Path(directorio) / re.sub(r"[^A-Za-z0-9_.-]", "_", modelo)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.modelo = modelo
+        self.max_entradas = max_entradas
+        self.ruta_vectores = self.directorio / "vectores.f32"
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+        self.conn = sqlite3.connect(str(self.directorio / "indice.sqlite"))
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+            CREATE TABLE IF NOT EXISTS entradas (
+                clave TEXT PRIMARY KEY, fila INTEGER UNIQUE NOT NULL, ultimo_uso REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entradas_uso ON entradas (ultimo_uso);
+            CREATE TABLE IF NOT EXISTS filas_libres (fila INTEGER PRIMARY KEY);
+        """)
+        fila = self.conn.execute("SELECT valor FROM meta WHERE clave = 'dimension'").fetchone()
+        self.dimension: Optional[int] = int(fila[0]) if fila else None
+
+    # --- Lectura ---
+
+    def obtener(self, claves: List[str]) -> Dict[str, np.ndarray]:
+        """Devuelve los vectores en caché para las claves dadas y actualiza su uso."""
+        if not claves or self.dimension is None or not self.ruta_vectores.exists():
+            return {}
+        filas: Dict[str, int] = {}
+        for inicio in range(0, len(claves), 900):  # límite de parámetros de SQLite
+            lote = claves[inicio:inicio + 900]
+            marcadores = ",".join("?" * len(lote))
+            filas.update(self.conn.execute(
+                f"SELECT clave, fila FROM entradas WHERE clave IN ({marcadores})", lote
+            ).fetchall())
+        if not filas:
+            return {}
+        matriz = np.memmap(self.ruta_vectores, dtype=np.float32, mode="r").reshape(-1, self.dimension)
+        ahora = time.time()
+        self.conn.executemany("UPDATE entradas SET ultimo_uso = ? WHERE clave = ?",
+                              [(ahora, clave) for clave in filas])
+        self.conn.commit()
+        return {clave: np.array(matriz[fila]) for clave, fila in filas.items()}
+
+    # --- Escritura ---
+
+    def guardar(self, vectores: Dict[str, List[float]]) -> None:
+        """Guarda vectores nuevos, desalojando los menos usados si se supera el límite."""
+        if not vectores:
+            return
+        if self.dimension is None:
+            self.dimension = len(next(iter(vectores.values())))
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('dimension', ?)", (str(self.dimension),))
+
+        self._desalojar(len(vectores))
+        filas = self._reservar_filas(len(vectores))
+        ahora = time.time()
+        with open(self.ruta_vectores, "r+b" if self.ruta_vectores.exists() else "w+b") as f:
+            for fila, vector in zip(filas, vectores.values()):
+                f.seek(fila * self.dimension * 4)
+                f.write(np.asarray(vector, dtype=np.float32).tobytes())
+        self.conn.executemany("INSERT OR REPLACE INTO entradas VALUES (?, ?, ?)",
+                              [(clave, fila, ahora) for clave, fila in zip(vectores, filas)])
+        self.conn.commit()
+
+    def _desalojar(self, nuevas: int) -> None:
+        total = self.conn.execute("SELECT COUNT(*) FROM entradas").fetchone()[0]
+        sobrantes = total + nuevas - self.max_entradas
+        if sobrantes <= 0:
+            return
+        # Se libera un 10% extra para no desalojar en cada lote.
+        sobrantes += self.max_entradas // 10
+        viejas = self.conn.execute(
+            "SELECT clave, fila FROM entradas ORDER BY ultimo_uso LIMIT ?", (sobrantes,)
+        ).fetchall()
+        self.conn.executemany("DELETE FROM entradas WHERE clave = ?", [(c,) for c, _ in viejas])
+        self.conn.executemany("INSERT OR IGNORE INTO filas_libres VALUES (?)", [(f,) for _, f in viejas])
+        self.desalojos += len(viejas)
+
+    def _reservar_filas(self, n: int) -> List[int]:
+        libres = [f for (f,) in self.conn.execute("SELECT fila FROM filas_libres ORDER BY fila LIMIT ?", (n,))]
+        self.conn.executemany("DELETE FROM filas_libres WHERE fila = ?", [(f,) for f in libres])
+        siguiente = self.conn.execute(
+            "SELECT MAX(m) FROM (SELECT MAX(fila) AS m FROM entradas UNION ALL SELECT MAX(fila) FROM filas_libres)"
+        ).fetchone()[0]
+        siguiente = -1 if siguiente is None else siguiente
+        siguiente = max([siguiente] + libres) + 1
+        return libres + list(range(siguiente, siguiente + n - len(libres)))
+
+    # --- Estadísticas ---
+
+    def estadisticas(self) -> Dict[str, float]:
+        """Aciertos/fallos de esta ejecución y tamaño actual de la caché."""
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": self.conn.execute("SELECT COUNT(*) FROM entradas").fetchone()[0],
+            "bytes": self.ruta_vectores.stat().st_size if self.ruta_vectores.exists() else 0,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+            "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+        }
+
+    def cerrar(self) -> None:
+        self.conn.close()
+
+
+class EmbeddingsCacheados(Embeddings):
+    """Envuelve un modelo de embeddings y sólo calcula los vectores de textos no vistos."""
+
+    def __init__(self, base: Embeddings, cache: CacheEmbeddings):
+        self.base = base
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        claves = [hash_texto(t) for t in texts]
+        encontrados = self.cache.obtener(list(dict.fromkeys(claves)))
+
+        # Textos repetidos dentro del lote se calculan una sola vez.
+        pendientes: Dict[str, str] = {}
+        for clave, texto in zip(claves, texts):
+            if clave not in encontrados:
+                pendientes.setdefault(clave, texto)
+        self.cache.aciertos += len(texts) - len(pendientes)
+        self.cache.fallos += len(pendientes)
+
+        nuevos: Dict[str, List[float]] = {}
+        if pendientes:
+            vectores = self.base.embed_documents(list(pendientes.values()))
+            nuevos = dict(zip(pendientes.keys(), vectores))
+            self.cache.guardar(nuevos)
+
+        return [nuevos[c] if c in nuevos else encontrados[c].tolist() for c in claves]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query(text)
+
+    def registrar_estadisticas(self) -> None:
+        """Escribe en el log el resumen de la caché."""
+        e = self.cache.estadisticas()
+        logger.info(
+            f"Caché de embeddings: {e['aciertos']} aciertos, {e['fallos']} fallos "
+            f"({e['tasa_aciertos']:.0%}), {e['desalojos']} desalojos, "
+            f"{e['entradas']} entradas ({e['bytes'] / 1e6:.1f} MB)"
+        )
@@ -0,0 +1,215 @@
+"""
+Caché persistente del texto extraído de cada página.
+
+Extraer el texto de los PDF es la parte más lenta de la carga, y el resultado sólo
+depende del contenido del archivo y del código que lo extrae. Cada archivo se
+identifica por el SHA-256 de sus bytes y la versión del extractor
+(`cargadores.version_extractor`); sus páginas se guardan en un SQLite con el texto
+comprimido con zlib. Cambiar `chunk_size`/`chunk_overlap` o reconstruir el índice
+después de un fallo reutiliza el texto sin volver a abrir los PDF. Un archivo
+renombrado o copiado también, porque la clave no depende de la ruta: el `source`
+se asigna al leer.
+
+    python cache_paginas.py           # tamaño de la caché
+    python cache_paginas.py --podar   # quitar las entradas de archivos que ya no existen
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+from cargadores import MOTOR_PDF, cargar_paginas, version_extractor
+
+logger = logging.getLogger(__name__)
+
+DIR_CACHE = Path(__file__).resolve().parent.parent / "cache_paginas"
+TAM_BLOQUE = 1 << 20  # bytes leídos por iteración al calcular el hash de un archivo
+
+
+def hash_archivo(ruta) -> str:
+    """SHA-256 del contenido del archivo."""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        while bloque := f.read(TAM_BLOQUE):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def directorio_cache(args: argparse.Namespace) -> Optional[Path]:
+    """Directorio de la caché de páginas según `--sin-cache-paginas` (None = desactivada)."""
+    return None if getattr(args, "sin_cache_paginas", False) else DIR_CACHE
+
+
+class CachePaginas:
+    """Páginas extraídas por (hash del archivo, versión del extractor) en SQLite."""
+
+    def __init__(self, directorio: Path = DIR_CACHE):
+        self.directorio = Path(directorio)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.ruta = self.directorio / "paginas.sqlite"
+        # Los workers de la carga escriben a la vez desde procesos distintos
+        self.conn = sqlite3.connect(str(self.ruta), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS archivos (
+                hash TEXT NOT NULL, extractor TEXT NOT NULL, ruta TEXT NOT NULL,
+                paginas INTEGER NOT NULL, caracteres INTEGER NOT NULL,
+                creada REAL NOT NULL, ultimo_uso REAL NOT NULL,
+                PRIMARY KEY (hash, extractor)
+            );
+            CREATE TABLE IF NOT EXISTS paginas (
+                hash TEXT NOT NULL, extractor TEXT NOT NULL, pagina INTEGER NOT NULL,
+                metadata TEXT NOT NULL, texto BLOB NOT NULL,
+                PRIMARY KEY (hash, extractor, pagina)
+            );
+        """)
+
+    # --- Lectura y escritura ---
+
+    def obtener(self, hash_: str, extractor: str, ruta: str) -> Optional[List[Document]]:
+        """Páginas guardadas del archivo (con `source` = ruta), o None si no está en la caché."""
+        if self.conn.execute("SELECT 1 FROM archivos WHERE hash = ? AND extractor = ?",
+                             (hash_, extractor)).fetchone() is None:
+            return None
+        filas = self.conn.execute(
+            "SELECT metadata, texto FROM paginas WHERE hash = ? AND extractor = ? ORDER BY pagina",
+            (hash_, extractor)
+        ).fetchall()
+        with self.conn:
+            self.conn.execute("UPDATE archivos SET ruta = ?, ultimo_uso = ? WHERE hash = ? AND extractor = ?",
+                              (ruta, time.time(), hash_, extractor))
+        return [Document(page_content=zlib.decompress(texto).decode("utf-8"),
+                         metadata={"source": ruta, **json.loads(metadata)})
+                for metadata, texto in filas]
+
+    def guardar(self, hash_: str, extractor: str, ruta: str, paginas: List[Document]) -> None:
+        """Guarda todas las páginas de un archivo en una sola transacción."""
+        ahora = time.time()
+        filas = [(hash_, extractor, i,
+                  json.dumps({k: v for k, v in pagina.metadata.items() if k != "source"}, default=str),
+                  zlib.compress(pagina.page_content.encode("utf-8")))
+                 for i, pagina in enumerate(paginas)]
+        with self.conn:
+            self.conn.execute("DELETE FROM paginas WHERE hash = ? AND extractor = ?", (hash_, extractor))
+            self.conn.executemany("INSERT INTO paginas VALUES (?, ?, ?, ?, ?)", filas)
+            self.conn.execute("INSERT OR REPLACE INTO archivos VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (hash_, extractor, ruta, len(paginas),
+                               sum(len(p.page_content) for p in paginas), ahora, ahora))
+
+    # --- Mantenimiento ---
+
+    def podar(self) -> int:
+        """
+        Quita las entradas cuyo archivo ya no existe o cambió de contenido; devuelve
+        cuántas se quitaron.
+        """
+        hashes: Dict[str, Optional[str]] = {}
+        obsoletas = []
+        for hash_, extractor, ruta in self.conn.execute("SELECT hash, extractor, ruta FROM archivos").fetchall():
+            if ruta not in hashes:
+                hashes[ruta] = hash_archivo(ruta) if Path(ruta).is_file() else None
+            if hashes[ruta] != hash_:
+                obsoletas.append((hash_, extractor))
+        with self.conn:
+            self.conn.executemany("DELETE FROM paginas WHERE hash = ? AND extractor = ?", obsoletas)
+            self.conn.executemany("DELETE FROM archivos WHERE hash = ? AND extractor = ?", obsoletas)
+        if obsoletas:
+            self.conn.execute("VACUUM")  # devolver el espacio al disco
+        logger.info(f"Caché de páginas: {len(obsoletas)} entradas obsoletas quitadas")
+        return len(obsoletas)
+
+    # --- Estadísticas ---
+
+    def estadisticas(self, desde: Optional[float] = None) -> Dict[str, float]:
+        """
+        Tamaño de la caché y, si se da `desde` (un time.time()), los archivos leídos de
+        ella (aciertos) y los extraídos y guardados (fallos) a partir de ese instante,
+        sumando todos los procesos.
+        """
+        archivos, paginas, caracteres = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(paginas), 0), COALESCE(SUM(caracteres), 0) FROM archivos"
+        ).fetchone()
+        resultado = {
+            "archivos": archivos,
+            "paginas": paginas,
+            "caracteres": caracteres,
+            "bytes": sum(r.stat().st_size for r in self.directorio.glob("paginas.sqlite*")),
+        }
+        if desde is not None:
+            resultado["aciertos"], resultado["fallos"] = self.conn.execute(
+                "SELECT COALESCE(SUM(creada < ?), 0), COALESCE(SUM(creada >= ?), 0) FROM archivos "
+                "WHERE ultimo_uso >= ?", (desde, desde, desde)
+            ).fetchone()
+        return resultado
+
+    def cerrar(self) -> None:
+        self.conn.close()
+
+
+def registrar_estadisticas(directorio: Optional[Path], desde: Optional[float] = None) -> None:
+    """Escribe en el log el resumen de la caché de páginas (si está activada)."""
+    if directorio is None or not (Path(directorio) / "paginas.sqlite").exists():
+        return
+    cache = CachePaginas(directorio)
+    try:
+        e = cache.estadisticas(desde)
+    finally:
+        cache.cerrar()
+    uso = f"{e['aciertos']} archivos leídos de la caché, {e['fallos']} extraídos; " if desde is not None else ""
+    logger.info(f"Caché de páginas: {uso}{e['archivos']} archivos, {e['paginas']} páginas "
+                f"({e['caracteres'] / 1e6:.1f} M caracteres en {e['bytes'] / 1e6:.1f} MB)")
+
+
+def cargar_paginas_cacheadas(ruta: str, motor: str = MOTOR_PDF,
+                             directorio: Optional[Path] = None) -> Iterator[Document]:
+    """
+    Igual que `cargadores.cargar_paginas`, pero lee las páginas de la caché si el
+    archivo ya se extrajo con el mismo extractor. Si no, las genera a medida que se
+    extraen y las guarda al terminar el archivo. Sin `directorio` no usa caché.
+    """
+    if directorio is None:
+        yield from cargar_paginas(ruta, motor)
+        return
+    cache = CachePaginas(directorio)
+    try:
+        clave = (hash_archivo(ruta), version_extractor(ruta, motor))
+        paginas = cache.obtener(*clave, str(ruta))
+        if paginas is not None:
+            logger.debug(f"{Path(ruta).name}: {len(paginas)} páginas leídas de la caché")
+            yield from paginas
+            return
+        paginas = []
+        for pagina in cargar_paginas(ruta, motor):
+            paginas.append(pagina)
+            yield pagina
+        cache.guardar(*clave, str(ruta), paginas)
+    finally:
+        cache.cerrar()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Muestra el tamaño de la caché de páginas y la poda.")
+    parser.add_argument("--directorio", type=Path, default=DIR_CACHE, help="Directorio de la caché.")
+    parser.add_argument("--podar", action="store_true",
+                        help="Quitar las entradas de archivos que ya no existen o cambiaron.")
+    args = parser.parse_args()
+
+    if args.podar:
+        cache = CachePaginas(args.directorio)
+        try:
+            cache.podar()
+        finally:
+            cache.cerrar()
+    registrar_estadisticas(args.directorio)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Caché semántica y persistente de respuestas.
+
+Guarda en SQLite cada respuesta junto con el embedding de su pregunta. Una pregunta
+nueva cuya similitud coseno con una anterior supere el umbral (mismo modelo y misma
+versión del índice) recibe la respuesta guardada sin llamar al LLM.
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+UMBRAL_SIMILITUD = 0.92
+MAX_ENTRADAS = 5000
+MAX_EDAD_DIAS = 30
+
+
+def _normalizar(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norma = np.linalg.norm(v)
+    return v / norma if norma > 0 else v
+
+
+class CacheSemantica:
+    """Caché de respuestas indexada por similitud de preguntas (SQLite + matriz NumPy en memoria)."""
+
+    def __init__(self, ruta_db: Path, max_entradas: int = MAX_ENTRADAS, max_edad_dias: float = MAX_EDAD_DIAS):
+        self.max_entradas = max_entradas
+        self.max_edad = max_edad_dias * 86400
+        self._lock = threading.Lock()
+        # Una matriz de vectores por (modelo, versión del índice), cargada bajo demanda
+        self._matrices: Dict[Tuple[str, str], Tuple[np.ndarray, List[int]]] = {}
+
+        self.conn = sqlite3.connect(str(ruta_db), check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS respuestas (
+                id INTEGER PRIMARY KEY,
+                pregunta TEXT NOT NULL,
+                modelo TEXT NOT NULL,
+                version_indice TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                respuesta TEXT NOT NULL,
+                fuentes TEXT NOT NULL,
+                creado REAL NOT NULL,
+                ultimo_uso REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_respuestas_clave ON respuestas (modelo, version_indice);
+            CREATE TABLE IF NOT EXISTS contadores (nombre TEXT PRIMARY KEY, valor INTEGER NOT NULL);
+            INSERT OR IGNORE INTO contadores VALUES ('aciertos', 0), ('fallos', 0);
+        """)
+        self.conn.commit()
+        self.desalojar()
+
+    # --- Consulta ---
+
+    def _matriz(self, modelo: str, version_indice: str) -> Tuple[np.ndarray, List[int]]:
+        clave = (modelo, version_indice)
+        if clave not in self._matrices:
+            filas = self.conn.execute(
+                "SELECT id, vector FROM respuestas WHERE modelo = ? AND version_indice = ?", clave
+            ).fetchall()
+            ids = [fila[0] for fila in filas]
+            matriz = (np.vstack([np.frombuffer(fila[1], dtype=np.float32) for fila in filas])
+                      if filas else np.empty((0, 0), dtype=np.float32))
+            self._matrices[clave] = (matriz, ids)
+        return self._matrices[clave]
+
+    def buscar(self, vector, modelo: str, version_indice: str,
+               umbral: float = UMBRAL_SIMILITUD) -> Optional[Dict[str, Any]]:
+        """Devuelve la respuesta guardada más parecida si su similitud supera el umbral."""
+        with self._lock:
+            matriz, ids = self._matriz(modelo, version_indice)
+            mejor = None
+            if ids:
+                similitudes = matriz @ _normalizar(vector)
+                i = int(np.argmax(similitudes))
+                if similitudes[i] >= umbral:
+                    mejor = (ids[i], float(similitudes[i]))
+
+            self._incrementar("aciertos" if mejor else "fallos")
+            if mejor is None:
+                return None
+
+            id_respuesta, similitud = mejor
+            fila = self.conn.execute(
+                "SELECT pregunta, respuesta, fuentes FROM respuestas WHERE id = ?", (id_respuesta,)
+            ).fetchone()
+            self.conn.execute("UPDATE respuestas SET ultimo_uso = ? WHERE id = ?", (time.time(), id_respuesta))
+            self.conn.commit()
+
+        pregunta, respuesta, fuentes = fila
+        return {
+            "pregunta": pregunta,
+            "respuesta": respuesta,
+            "similitud": similitud,
+            "docs": [Document(page_content=f["page_content"], metadata=f["metadata"]) for f in json.loads(fuentes)],
+        }
+
+    # --- Escritura ---
+
+    def guardar(self, pregunta: str, vector, modelo: str, version_indice: str,
+                respuesta: str, docs: List[Document]) -> None:
+        """Guarda una respuesta nueva y aplica la política de desalojo."""
+        fuentes = json.dumps(
+            [{"page_content": d.page_content, "metadata": d.metadata} for d in docs],
+            ensure_ascii=False, default=str
+        )
+        ahora = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO respuestas (pregunta, modelo, version_indice, vector, respuesta, fuentes, creado, ultimo_uso) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (pregunta, modelo, version_indice, _normalizar(vector).tobytes(), respuesta, fuentes, ahora, ahora)
+            )
+            self.conn.commit()
+            self._matrices.pop((modelo, version_indice), None)
+        self.desalojar()
+
+    def liberar_version(self, version_indice: str) -> None:
+        """Libera las matrices en memoria de una versión del índice que ya no se consulta."""
+        with self._lock:
+            for clave in [c for c in self._matrices if c[1] == version_indice]:
+                del self._matrices[clave]
+
+    def desalojar(self) -> None:
+        """Elimina entradas más viejas que la edad máxima y las menos usadas si se excede el tamaño."""
+        with self._lock:
+            borradas = self.conn.execute(
+                "DELETE FROM respuestas WHERE creado < ?", (time.time() - self.max_edad,)
+            ).rowcount
+            exceso = self.conn.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0] - self.max_entradas
+            if exceso > 0:
+                borradas += self.conn.execute(
+                    "DELETE FROM respuestas WHERE id IN (SELECT id FROM respuestas ORDER BY ultimo_uso LIMIT ?)",
+                    (exceso,)
+                ).rowcount
+            self.conn.commit()
+            if borradas:
+                self._matrices.clear()
+
+    # --- Estadísticas ---
+
+    def _incrementar(self, nombre: str) -> None:
+        self.conn.execute("UPDATE contadores SET valor = valor + 1 WHERE nombre = ?", (nombre,))
+        self.conn.commit()
+
+    def estadisticas(self) -> Dict[str, float]:
+        """Aciertos, fallos, tasa de aciertos y número de respuestas guardadas."""
+        with self._lock:
+            contadores = dict(self.conn.execute("SELECT nombre, valor FROM contadores").fetchall())
+            entradas = self.conn.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+        consultas = contadores["aciertos"] + contadores["fallos"]
+        return {
+            "aciertos": contadores["aciertos"],
+            "fallos": contadores["fallos"],
+            "tasa_aciertos": contadores["aciertos"] / consultas if consultas else 0.0,
+            "entradas": entradas,
+        }
@@ -0,0 +1,110 @@
+"""
+Prueba de carga del servicio de consultas (`servidor.py`).
+
+Lanza N peticiones con C clientes concurrentes y mide el rendimiento (peticiones/s),
+la latencia total y hasta el primer texto (p50/p95/p99) y el tamaño medio de los
+micro-lotes de embeddings que formó el servidor:
+
+    python servidor.py --llm-simulado --segundos-por-token 0.01 &
+    python carga_servidor.py --concurrencia 1 8 32 --peticiones 256
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+from benchmark import percentiles
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+URL = "http://127.0.0.1:8000"
+TEMAS = ["óptica", "astrofísica", "electrónica", "ciencias computacionales", "visión por computadora",
+         "aprendizaje automático", "telescopios", "fotónica", "procesamiento de señales", "robótica"]
+
+
+def generar_preguntas(n: int) -> List[str]:
+    """Preguntas distintas entre sí, para que la caché de consultas del servidor no las resuelva."""
+    return [f"¿Qué investigaciones sobre {TEMAS[i % len(TEMAS)]} se describen en el documento {i}?"
+            for i in range(n)]
+
+
+async def una_peticion(cliente: httpx.AsyncClient, pregunta: str, cuerpo: Dict) -> Dict[str, float]:
+    inicio = time.perf_counter()
+    primer_texto = None
+    async with cliente.stream("POST", "/preguntar", json={"pregunta": pregunta, **cuerpo}) as respuesta:
+        respuesta.raise_for_status()
+        async for linea in respuesta.aiter_lines():
+            if primer_texto is None and linea and json.loads(linea)["tipo"] == "texto":
+                primer_texto = time.perf_counter() - inicio
+    total = time.perf_counter() - inicio
+    return {"total": total, "primer_texto": primer_texto if primer_texto is not None else total}
+
+
+async def medir(url: str, preguntas: List[str], concurrencia: int, cuerpo: Dict) -> Dict:
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+    async with httpx.AsyncClient(base_url=url, timeout=300, limits=limites) as cliente:
+        antes = (await cliente.get("/estado")).json()["micro_lotes"]
+        semaforo = asyncio.Semaphore(concurrencia)
+
+        async def limitada(pregunta: str):
+            async with semaforo:
+                return await una_peticion(cliente, pregunta, cuerpo)
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(limitada(p) for p in preguntas))
+        duracion = time.perf_counter() - inicio
+        despues = (await cliente.get("/estado")).json()["micro_lotes"]
+
+    lotes = despues["lotes"] - antes["lotes"]
+    metricas = {
+        "concurrencia": concurrencia,
+        "peticiones": len(preguntas),
+        "peticiones_s": len(preguntas) / duracion,
+        "latencia": percentiles([r["total"] for r in resultados]),
+        "primer_texto": percentiles([r["primer_texto"] for r in resultados]),
+        "tamano_medio_lote": (despues["preguntas"] - antes["preguntas"]) / lotes if lotes else 0.0,
+    }
+    logging.info(f"Concurrencia {concurrencia:>3}: {metricas['peticiones_s']:7.1f} peticiones/s, "
+                 f"latencia p50 {metricas['latencia']['p50_ms']:7.1f} ms / p99 {metricas['latencia']['p99_ms']:7.1f} ms, "
+                 f"primer texto p50 {metricas['primer_texto']['p50_ms']:7.1f} ms, "
+                 f"lote medio {metricas['tamano_medio_lote']:.1f}")
+    return metricas
+
+
+async def ejecutar(args) -> List[Dict]:
+    cuerpo = {"k": args.k, "hibrida": not args.solo_vectorial}
+    if args.modelo:
+        cuerpo["modelo"] = args.modelo
+    resultados = []
+    for i, concurrencia in enumerate(args.concurrencia):
+        # Preguntas nuevas en cada ronda: ninguna se resuelve desde la caché de la anterior
+        preguntas = generar_preguntas(args.peticiones * (i + 1))[args.peticiones * i:]
+        resultados.append(await medir(args.url, preguntas, concurrencia, cuerpo))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio de consultas.")
+    parser.add_argument("--url", default=URL)
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 8, 32], help="Clientes simultáneos.")
+    parser.add_argument("--peticiones", type=int, default=256, help="Peticiones por nivel de concurrencia.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--modelo", help="Modelo a usar (por defecto el primero de MODEL_CONFIG).")
+    parser.add_argument("--solo-vectorial", action="store_true", help="Desactiva la búsqueda híbrida.")
+    parser.add_argument("--salida", type=Path, help="Archivo JSON donde guardar los resultados.")
+    args = parser.parse_args()
+
+    resultados = asyncio.run(ejecutar(args))
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=4, ensure_ascii=False)
+        logging.info(f"Resultados guardados en: {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
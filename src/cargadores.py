@@ -0,0 +1,202 @@
+"""
+Registro de cargadores por tipo de archivo.
+
+Cada extensión tiene una función que genera un `Document` por página con los
+metadatos `source` (la ruta recibida), `page` (desde 0) y `total_pages`:
+
+- `.pdf`: con el motor de extracción elegido en `--motor-pdf`:
+  - "pypdf": `PyPDFLoader` de LangChain, en Python puro (el comportamiento
+    original; añade los metadatos del PDF como título y autor).
+  - "pymupdf": MuPDF, escrito en C (`pip install pymupdf`).
+  - "pypdfium2": PDFium, el motor de Chrome, escrito en C++ (`pip install pypdfium2`).
+- `.txt` y `.md`: se leen tal cual como una sola página.
+
+Para añadir un tipo basta con decorar su función con `@cargador(".ext")`.
+"""
+import argparse
+import importlib.metadata
+import logging
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+MOTOR_PDF = "pypdf"
+VERSION_CARGADORES = 1  # subir al cambiar el texto o los metadatos que produce algún cargador
+
+FuncionCarga = Callable[[str, str], Iterator[Document]]
+CARGADORES: Dict[str, FuncionCarga] = {}
+MOTORES_PDF: Dict[str, Callable[[str], Iterator[Document]]] = {}
+PAQUETES_MOTOR: Dict[str, str] = {}  # motor -> paquete cuya versión determina el texto extraído
+
+
+def cargador(*extensiones: str) -> Callable[[FuncionCarga], FuncionCarga]:
+    """Registra la función como cargador de las extensiones dadas."""
+    def registrar(funcion: FuncionCarga) -> FuncionCarga:
+        for extension in extensiones:
+            CARGADORES[extension.lower()] = funcion
+        return funcion
+    return registrar
+
+
+def motor_pdf(nombre: str, paquete: str) -> Callable:
+    """Registra un motor de extracción de PDF y el paquete que hace la extracción."""
+    def registrar(funcion):
+        MOTORES_PDF[nombre] = funcion
+        PAQUETES_MOTOR[nombre] = paquete
+        return funcion
+    return registrar
+
+
+def extensiones_soportadas() -> List[str]:
+    return sorted(CARGADORES)
+
+
+def es_soportado(ruta) -> bool:
+    return Path(ruta).suffix.lower() in CARGADORES
+
+
+def listar_documentos(directorio: Path, recursivo: bool = False) -> List[str]:
+    """Rutas de los archivos con cargador en el directorio (y subcarpetas si recursivo), ordenadas."""
+    archivos = Path(directorio).rglob("*") if recursivo else Path(directorio).glob("*")
+    return sorted(str(ruta) for ruta in archivos if ruta.is_file() and es_soportado(ruta))
+
+
+def cargar_paginas(ruta: str, motor: str = MOTOR_PDF) -> Iterator[Document]:
+    """Genera las páginas del archivo, una a una, con el cargador de su extensión."""
+    extension = Path(ruta).suffix.lower()
+    if extension not in CARGADORES:
+        raise ValueError(f"No hay cargador para '{extension}'. Tipos soportados: {', '.join(extensiones_soportadas())}")
+    return CARGADORES[extension](str(ruta), motor)
+
+
+@lru_cache(maxsize=None)
+def _version_paquete(paquete: str) -> str:
+    try:
+        return importlib.metadata.version(paquete)
+    except importlib.metadata.PackageNotFoundError:
+        return "?"
+
+
+def version_extractor(ruta: str, motor: str = MOTOR_PDF) -> str:
+    """Identifica el código que extrae el texto del archivo: su cargador, el motor y la versión de la biblioteca."""
+    extension = Path(ruta).suffix.lower()
+    if extension != ".pdf":
+        return f"{extension}/v{VERSION_CARGADORES}"
+    paquete = PAQUETES_MOTOR.get(motor, motor)
+    return f".pdf/{motor}/{paquete}-{_version_paquete(paquete)}/v{VERSION_CARGADORES}"
+
+
+def _pagina(texto: str, ruta: str, pagina: int, total: int, etiqueta: str = "") -> Document:
+    metadata = {"source": ruta, "total_pages": total, "page": pagina}
+    if etiqueta:
+        metadata["page_label"] = etiqueta
+    return Document(page_content=texto, metadata=metadata)
+
+
+# --- PDF ---
+
+@cargador(".pdf")
+def cargar_pdf(ruta: str, motor: str = MOTOR_PDF) -> Iterator[Document]:
+    if motor not in MOTORES_PDF:
+        raise ValueError(f"Motor de PDF desconocido: '{motor}'. Opciones: {', '.join(MOTORES_PDF)}")
+    return MOTORES_PDF[motor](ruta)
+
+
+@motor_pdf("pypdf", "pypdf")
+def _pdf_pypdf_langchain(ruta: str) -> Iterator[Document]:
+    from langchain_community.document_loaders import PyPDFLoader
+
+    return PyPDFLoader(ruta).lazy_load()
+
+
+@motor_pdf("pymupdf", "pymupdf")
+def _pdf_pymupdf(ruta: str) -> Iterator[Document]:
+    try:
+        import pymupdf
+    except ImportError as e:
+        raise ImportError(f"El motor 'pymupdf' requiere PyMuPDF: pip install pymupdf ({e})") from e
+
+    with pymupdf.open(ruta) as documento:
+        for i, pagina in enumerate(documento):
+            yield _pagina(pagina.get_text("text"), ruta, i, documento.page_count, pagina.get_label())
+
+
+@motor_pdf("pypdfium2", "pypdfium2")
+def _pdf_pypdfium2(ruta: str) -> Iterator[Document]:
+    try:
+        import pypdfium2
+    except ImportError as e:
+        raise ImportError(f"El motor 'pypdfium2' requiere pypdfium2: pip install pypdfium2 ({e})") from e
+
+    documento = pypdfium2.PdfDocument(ruta)
+    try:
+        total = len(documento)
+        for i in range(total):
+            pagina = documento[i]
+            texto_pagina = pagina.get_textpage()
+            try:
+                texto = texto_pagina.get_text_bounded().replace("\r\n", "\n")
+            finally:
+                texto_pagina.close()
+                pagina.close()
+            yield _pagina(texto, ruta, i, total)
+    finally:
+        documento.close()
+
+
+# --- Texto ---
+
+@cargador(".txt", ".md")
+def cargar_texto(ruta: str, motor: str = MOTOR_PDF) -> Iterator[Document]:
+    """Un archivo de texto o markdown es una sola página."""
+    yield _pagina(Path(ruta).read_text(encoding="utf-8", errors="replace"), ruta, 0, 1)
+
+
+# --- Comparación de motores ---
+
+def medir_motores(rutas: Sequence[str], motores: Iterable[str] = ()) -> Dict[str, Dict[str, float]]:
+    """
+    Páginas/s y caracteres extraídos de cada motor de PDF sobre los archivos dados.
+    Los motores no instalados se omiten con un aviso.
+    """
+    pdfs = [str(r) for r in rutas if Path(r).suffix.lower() == ".pdf"]
+    resultados: Dict[str, Dict[str, float]] = {}
+    for motor in (motores or MOTORES_PDF):
+        try:
+            if pdfs:
+                next(iter(cargar_pdf(pdfs[0], motor)), None)  # calentamiento: importaciones del motor
+        except ImportError as e:
+            logger.warning(f"Motor '{motor}' no disponible: {e}")
+            continue
+        except Exception:
+            pass  # el error del archivo se cuenta abajo
+        paginas, caracteres, errores = 0, 0, 0
+        inicio = time.perf_counter()
+        for ruta in pdfs:
+            try:
+                for pagina in cargar_pdf(ruta, motor):
+                    paginas += 1
+                    caracteres += len(pagina.page_content)
+            except Exception as e:
+                errores += 1
+                logger.warning(f"[{motor}] Error cargando {Path(ruta).name}: {e}")
+        segundos = max(time.perf_counter() - inicio, 1e-9)
+        resultados[motor] = {"archivos": len(pdfs), "paginas": paginas, "segundos": segundos,
+                             "paginas_por_s": paginas / segundos, "caracteres": caracteres, "errores": errores}
+        logger.info(f"Motor {motor}: {paginas} páginas en {segundos:.2f}s ({paginas / segundos:.1f} páginas/s), "
+                    f"{caracteres} caracteres, {errores} errores")
+    return resultados
+
+
+def agregar_argumentos_carga(parser: argparse.ArgumentParser) -> None:
+    """Añade a un script la opción para elegir el motor de extracción de PDF."""
+    grupo = parser.add_argument_group("carga de documentos")
+    grupo.add_argument("--motor-pdf", choices=list(MOTORES_PDF), default=MOTOR_PDF,
+                       help="Motor de extracción de texto de los PDF.")
+    grupo.add_argument("--sin-cache-paginas", action="store_true",
+                       help="No leer ni guardar el texto extraído en 'cache_paginas/'.")
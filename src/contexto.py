@@ -0,0 +1,163 @@
+"""
+Construcción del contexto del prompt con un presupuesto de tokens.
+
+Los chunks se solapan `CHUNK_OVERLAP` caracteres, así que cuando se recuperan dos
+chunks contiguos de la misma página el prompt repite ese texto. Aquí:
+
+1. Se fusionan los chunks de una misma fuente y página que se solapan o son contiguos
+   (por `start_index` si el índice lo guarda; si no, buscando el texto repetido).
+2. Se descartan los fragmentos repetidos (idénticos o contenidos en otro).
+3. Se empaquetan por relevancia hasta el presupuesto de tokens del modelo.
+"""
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from rag import MODEL_CONFIG
+from trazas import estimar_tokens
+
+PRESUPUESTO_POR_DEFECTO = 3000   # tokens de contexto si el modelo no define el suyo
+VENTANA_SOLAPE = 400             # caracteres en que se busca el solape (el doble de CHUNK_OVERLAP)
+MIN_SOLAPE = 20                  # solapes más cortos se consideran coincidencias casuales
+MAX_HUECO = 2                    # caracteres (espacios recortados) entre chunks contiguos
+SEPARADOR = "\n\n"
+
+
+def presupuesto_modelo(modelo: str, respaldo: Optional[str] = None) -> int:
+    """
+    Tokens de contexto configurados para el modelo en MODEL_CONFIG. Con un modelo de
+    respaldo, el menor de los dos: el contexto se construye antes de saber cuál responde.
+    """
+    presupuesto = MODEL_CONFIG.get(modelo, {}).get("presupuesto_contexto", PRESUPUESTO_POR_DEFECTO)
+    if respaldo is not None:
+        presupuesto = min(presupuesto, presupuesto_modelo(respaldo))
+    return presupuesto
+
+
+def _normalizar(texto: str) -> str:
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def solapamiento(anterior: str, siguiente: str, ventana: int = VENTANA_SOLAPE, minimo: int = MIN_SOLAPE) -> int:
+    """Longitud del mayor final de `anterior` con el que empieza `siguiente` (0 si no se solapan)."""
+    cola = anterior[-ventana:]
+    inicio = siguiente[:minimo]
+    if len(inicio) < minimo:
+        return 0
+    posicion = cola.find(inicio)
+    while posicion != -1:
+        if siguiente.startswith(cola[posicion:]):
+            return len(cola) - posicion
+        posicion = cola.find(inicio, posicion + 1)
+    return 0
+
+
+class _Pieza:
+    """Texto continuo de una página, formado por uno o varios chunks."""
+
+    def __init__(self, doc: Document, rango: int):
+        self.texto = doc.page_content
+        self.metadata = dict(doc.metadata)
+        self.rango = rango  # posición del chunk más relevante que contiene
+        self.chunks = 1
+        self.inicio: Optional[int] = doc.metadata.get("start_index")
+        self.fin: Optional[int] = self.inicio + len(self.texto) if self.inicio is not None else None
+
+    def unir(self, otra: "_Pieza") -> bool:
+        """Añade `otra` si se solapa o es contigua con esta pieza (en cualquier orden)."""
+        if self.inicio is not None and otra.inicio is not None:
+            if otra.inicio < self.inicio:
+                primera, segunda = otra, self
+            else:
+                primera, segunda = self, otra
+            if segunda.inicio > primera.fin + MAX_HUECO:
+                return False
+            if segunda.fin <= primera.fin:
+                texto = primera.texto
+            elif segunda.inicio >= primera.fin:
+                texto = primera.texto + " " + segunda.texto
+            else:
+                texto = primera.texto + segunda.texto[primera.fin - segunda.inicio:]
+            self.inicio, self.fin = primera.inicio, max(primera.fin, segunda.fin)
+        elif otra.texto in self.texto:
+            texto = self.texto
+        elif self.texto in otra.texto:
+            texto = otra.texto
+        elif (n := solapamiento(self.texto, otra.texto)):
+            texto = self.texto + otra.texto[n:]
+        elif (n := solapamiento(otra.texto, self.texto)):
+            texto = otra.texto + self.texto[n:]
+        else:
+            return False
+        self.texto = texto
+        self.rango = min(self.rango, otra.rango)
+        self.chunks += otra.chunks
+        return True
+
+    def como_documento(self) -> Document:
+        return Document(page_content=self.texto, metadata={**self.metadata, "chunks_fusionados": self.chunks})
+
+
+def fusionar_contiguos(docs: Sequence[Document]) -> List[_Pieza]:
+    """Une los chunks solapados o contiguos de cada (fuente, página); las piezas quedan por relevancia."""
+    por_pagina: Dict[Tuple, List[_Pieza]] = {}
+    for rango, doc in enumerate(docs):
+        clave = (doc.metadata.get("source"), doc.metadata.get("page"))
+        pieza = _Pieza(doc, rango)
+        piezas = por_pagina.setdefault(clave, [])
+        # Una pieza nueva puede tender un puente entre dos existentes: se repite hasta que no una nada
+        unida = True
+        while unida:
+            unida = False
+            for existente in piezas:
+                if existente.unir(pieza):
+                    piezas.remove(existente)
+                    pieza = existente
+                    unida = True
+                    break
+        piezas.append(pieza)
+    return sorted((p for piezas in por_pagina.values() for p in piezas), key=lambda p: p.rango)
+
+
+def quitar_repetidos(piezas: Sequence[_Pieza]) -> List[_Pieza]:
+    """Descarta las piezas cuyo texto ya aparece (igual o contenido) en otra más relevante."""
+    elegidas: List[_Pieza] = []
+    textos: List[str] = []
+    for pieza in piezas:
+        texto = _normalizar(pieza.texto)
+        if any(texto in otro for otro in textos):
+            continue
+        elegidas.append(pieza)
+        textos.append(texto)
+    return elegidas
+
+
+def empaquetar_contexto(docs: Sequence[Document], presupuesto_tokens: int) -> Tuple[List[Document], Dict[str, int]]:
+    """
+    Documentos para `format_docs`: fusionados, sin repeticiones y, en orden de relevancia,
+    sólo los que caben en `presupuesto_tokens`. Si el más relevante no cabe se recorta.
+    """
+    piezas = quitar_repetidos(fusionar_contiguos(docs))
+    seleccion: List[Document] = []
+    usados = 0
+    coste_separador = estimar_tokens(SEPARADOR)
+    for pieza in piezas:
+        tokens = estimar_tokens(pieza.texto) + (coste_separador if seleccion else 0)
+        if usados + tokens <= presupuesto_tokens:
+            seleccion.append(pieza.como_documento())
+            usados += tokens
+        elif not seleccion:
+            doc = pieza.como_documento()
+            caracteres = len(pieza.texto) * presupuesto_tokens // max(tokens, 1)
+            seleccion.append(Document(page_content=pieza.texto[:caracteres], metadata=doc.metadata))
+            usados = estimar_tokens(seleccion[0].page_content)
+        # si no cabe se prueba con las siguientes, que pueden ser más cortas
+    estadisticas = {
+        "chunks": len(docs),
+        "piezas": len(piezas),
+        "incluidas": len(seleccion),
+        "tokens_originales": sum(estimar_tokens(d.page_content) for d in docs),
+        "tokens": usados,
+    }
+    return seleccion, estadisticas
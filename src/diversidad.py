@@ -0,0 +1,132 @@
+"""
+Recuperación con diversidad (MMR) y k adaptativo.
+
+Se piden más candidatos de los necesarios (k·FACTOR_CANDIDATOS) junto con sus vectores
+reconstruidos del índice, y sobre esa matriz:
+
+- MMR (maximal marginal relevance): en cada paso se elige el candidato que maximiza
+  λ·sim(pregunta, d) − (1−λ)·máx sim(d, elegidos). Las similitudes entre candidatos
+  se calculan de una vez con un producto de matrices y el máximo frente a los ya
+  elegidos se actualiza con una operación vectorial por paso.
+- k adaptativo: se corta la lista donde la similitud con la pregunta cae de golpe
+  (un salto mayor que FACTOR_CAIDA veces el salto medio entre candidatos).
+"""
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from shards import BaseFragmentada
+
+logger = logging.getLogger(__name__)
+
+FACTOR_CANDIDATOS = 4  # se recuperan k·4 candidatos con sus vectores
+LAMBDA_MMR = 0.5        # 1 = sólo relevancia, 0 = sólo diversidad
+FACTOR_CAIDA = 3.0      # un salto de similitud 3 veces mayor que el medio corta la lista
+K_MINIMO = 2
+
+
+def _vectores_candidatos(db, posiciones: np.ndarray, docs: Sequence[Document]) -> np.ndarray:
+    """
+    Vectores guardados en el índice para esas posiciones (o recalculados si el índice no los guarda).
+    Los IVF necesitan el mapa directo que `cargar_indice_consultas` construye al cargarlos.
+    """
+    try:
+        return db.index.reconstruct_batch(posiciones)
+    except RuntimeError:
+        return np.asarray(db.embedding_function.embed_documents([d.page_content for d in docs]), dtype=np.float32)
+
+
+def candidatos_con_vectores(db, vector: Sequence[float], n: int) -> Tuple[List[Document], np.ndarray]:
+    """Los n vecinos más cercanos (de todos los shards) y sus vectores, por distancia ascendente."""
+    consulta = np.asarray([vector], dtype=np.float32)
+    resultados = []
+    for base in (db.shards if isinstance(db, BaseFragmentada) else [db]):
+        distancias, posiciones = base.index.search(consulta, n)
+        validas = posiciones[0] >= 0
+        posiciones, distancias = posiciones[0][validas], distancias[0][validas]
+        docs = [base.docstore.search(base.index_to_docstore_id[int(p)]) for p in posiciones]
+        vectores = _vectores_candidatos(base, posiciones, docs)
+        resultados += [(float(d), doc, v) for d, doc, v in zip(distancias, docs, vectores) if isinstance(doc, Document)]
+    resultados.sort(key=lambda r: r[0])
+    resultados = resultados[:n]
+    if not resultados:
+        return [], np.empty((0, len(vector)), dtype=np.float32)
+    return [doc for _, doc, _ in resultados], np.vstack([v for _, _, v in resultados]).astype(np.float32)
+
+
+def _normalizar(matriz: np.ndarray) -> np.ndarray:
+    return matriz / (np.linalg.norm(matriz, axis=-1, keepdims=True) + 1e-12)
+
+
+def mmr(relevancia: np.ndarray, vectores: np.ndarray, k: int, lambda_mmr: float = LAMBDA_MMR) -> List[int]:
+    """Índices de los k candidatos elegidos por MMR, en orden de elección."""
+    n = len(relevancia)
+    if n <= 1 or k <= 0:
+        return list(range(min(n, k)))
+    unitarios = _normalizar(vectores)
+    similitudes = unitarios @ unitarios.T                 # (n, n) en una sola operación
+    maximo_elegidos = np.full(n, -np.inf, dtype=np.float32)
+    disponibles = np.ones(n, dtype=bool)
+    elegidos: List[int] = []
+    for _ in range(min(k, n)):
+        penalizacion = maximo_elegidos if elegidos else 0.0
+        puntuacion = lambda_mmr * relevancia - (1 - lambda_mmr) * penalizacion
+        puntuacion[~disponibles] = -np.inf
+        i = int(np.argmax(puntuacion))
+        elegidos.append(i)
+        disponibles[i] = False
+        np.maximum(maximo_elegidos, similitudes[i], out=maximo_elegidos)
+    return elegidos
+
+
+def corte_adaptativo(similitudes: np.ndarray, k_maximo: int, k_minimo: int = K_MINIMO,
+                     factor_caida: float = FACTOR_CAIDA) -> int:
+    """Cuántos candidatos (ordenados de más a menos similar) quedan antes de la primera caída brusca."""
+    n = min(len(similitudes), k_maximo)
+    if n <= k_minimo or len(similitudes) < 2:
+        return n
+    saltos = -np.diff(similitudes)
+    salto_medio = (similitudes[0] - similitudes[-1]) / (len(similitudes) - 1)
+    if salto_medio <= 0:
+        return n
+    # Un salto tras la posición i deja fuera los candidatos i+1 en adelante
+    bruscos = np.nonzero(saltos[k_minimo - 1:n - 1] > factor_caida * salto_medio)[0]
+    return k_minimo + int(bruscos[0]) if len(bruscos) else n
+
+
+def buscar_diverso(db, vector: Sequence[float], k: int, usar_mmr: bool = True, adaptativo: bool = False,
+                   lambda_mmr: float = LAMBDA_MMR, factor: int = FACTOR_CANDIDATOS,
+                   estadisticas: Optional[Dict[str, float]] = None) -> List[Document]:
+    """
+    Hasta k documentos: con `adaptativo` se descartan los que quedan tras una caída brusca de
+    similitud y con `usar_mmr` se eligen por MMR entre los candidatos restantes.
+    """
+    inicio = time.perf_counter()
+    docs, vectores = candidatos_con_vectores(db, vector, k * factor)
+    medio = time.perf_counter()
+    if not docs:
+        return []
+    relevancia = _normalizar(vectores) @ _normalizar(np.asarray(vector, dtype=np.float32))
+    # Los candidatos ya vienen por distancia; la similitud coseno mantiene el orden con vectores normalizados
+    orden = np.argsort(-relevancia, kind="stable")
+    docs, vectores, relevancia = [docs[i] for i in orden], vectores[orden], relevancia[orden]
+
+    k_efectivo = corte_adaptativo(relevancia, k) if adaptativo else min(k, len(docs))
+    if usar_mmr:
+        # Sólo compiten los candidatos por encima de la caída (o todos sin k adaptativo)
+        limite = len(docs) if not adaptativo else max(k_efectivo, corte_adaptativo(relevancia, len(docs)))
+        elegidos = mmr(relevancia[:limite], vectores[:limite], k_efectivo, lambda_mmr)
+    else:
+        elegidos = list(range(k_efectivo))
+    fin = time.perf_counter()
+
+    if estadisticas is not None:
+        estadisticas.update(candidatos=len(docs), k=len(elegidos),
+                            busqueda_ms=(medio - inicio) * 1000, seleccion_ms=(fin - medio) * 1000)
+    logger.debug(f"Recuperación {'MMR' if usar_mmr else 'top-k'}{' adaptativa' if adaptativo else ''}: "
+                f"{len(elegidos)} de {len(docs)} candidatos; búsqueda {(medio - inicio) * 1000:.2f} ms, "
+                f"selección {(fin - medio) * 1000:.2f} ms")
+    return [docs[i] for i in elegidos]
@@ -0,0 +1,208 @@
+"""
+Backends de embeddings para CPU.
+
+- "torch": sentence-transformers en PyTorch float32 (el comportamiento original).
+- "torch-int8": las capas lineales se cuantizan dinámicamente a int8 con PyTorch.
+- "onnx": ONNX Runtime con las optimizaciones de grafo activadas.
+- "onnx-int8": modelo ONNX cuantizado a int8; se exporta una vez en `DIR_MODELOS`.
+
+Los backends ONNX requieren `optimum[onnxruntime]`. Como cada backend produce
+vectores ligeramente distintos, `validar_contra_referencia` compara la similitud
+coseno con los vectores de "torch" antes de usarlo para construir un índice.
+"""
+import argparse
+import json
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+MODELO_EMBEDDINGS = "all-MiniLM-L6-v2"
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+TAM_LOTE_EMBEDDINGS = 64
+UMBRAL_COSENO = 0.99
+ARCHIVO_CONFIG_EMBEDDINGS = "config_embeddings.json"
+DIR_MODELOS = Path(__file__).resolve().parent.parent / "modelos_onnx"
+
+
+def nombre_en_cache(modelo: str, backend: str) -> str:
+    """Nombre del modelo para la caché de embeddings: cada backend tiene sus propios vectores."""
+    return modelo if backend == "torch" else f"{modelo}-{backend}"
+
+
+def _opciones_onnx(hilos: int) -> Dict:
+    import onnxruntime
+
+    opciones = onnxruntime.SessionOptions()
+    opciones.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if hilos > 0:
+        opciones.intra_op_num_threads = hilos
+    return {"provider": "CPUExecutionProvider", "session_options": opciones}
+
+
+def _cargar_onnx_int8(modelo: str, hilos: int):
+    """Carga la versión int8 del modelo, exportándola y cuantizándola la primera vez."""
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+    destino = DIR_MODELOS / re.sub(r"[^A-Za-z0-9_.-]", "_", modelo)
+    archivo = "onnx/model_qint8.onnx"
+    if not (destino / archivo).exists():
+        logger.info(f"Exportando {modelo} a ONNX int8 en {destino} (sólo la primera vez)...")
+        base = SentenceTransformer(modelo, device="cpu", backend="onnx")
+        base.save_pretrained(str(destino))
+        export_dynamic_quantized_onnx_model(base, "avx2", str(destino), file_suffix="qint8")
+    return SentenceTransformer(str(destino), device="cpu", backend="onnx",
+                               model_kwargs={"file_name": archivo, **_opciones_onnx(hilos)})
+
+
+def cargar_modelo(modelo: str = MODELO_EMBEDDINGS, backend: str = "torch", hilos: int = 0,
+                  device: str = "cpu"):
+    """SentenceTransformer listo para el backend pedido."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de embeddings desconocido: '{backend}'. Opciones: {', '.join(BACKENDS)}")
+    if backend.startswith("torch"):
+        import torch
+
+        if hilos > 0:
+            torch.set_num_threads(hilos)
+        st_modelo = SentenceTransformer(modelo, device=device if backend == "torch" else "cpu")
+        if backend == "torch-int8":
+            st_modelo = torch.ao.quantization.quantize_dynamic(st_modelo, {torch.nn.Linear}, dtype=torch.qint8)
+        return st_modelo
+
+    try:
+        if backend == "onnx-int8":
+            return _cargar_onnx_int8(modelo, hilos)
+        return SentenceTransformer(modelo, device="cpu", backend="onnx", model_kwargs=_opciones_onnx(hilos))
+    except ImportError as e:
+        raise ImportError(f"El backend '{backend}' requiere optimum: pip install 'optimum[onnxruntime]' ({e})") from e
+
+
+class EmbeddingsCPU(Embeddings):
+    """
+    Embeddings de sentence-transformers con backend seleccionable y estadísticas de rendimiento.
+
+    Los textos se ordenan por longitud y se agrupan en lotes de `tam_lote`, de modo que
+    cada lote rellena (padding) sólo hasta el texto más largo de textos de tamaño similar;
+    los vectores se devuelven en el orden original.
+    """
+
+    def __init__(self, modelo: str = MODELO_EMBEDDINGS, backend: str = "torch",
+                 tam_lote: int = TAM_LOTE_EMBEDDINGS, hilos: int = 0, device: str = "cpu"):
+        self.modelo = modelo
+        self.backend = backend
+        self.tam_lote = tam_lote
+        self.st_modelo = cargar_modelo(modelo, backend, hilos, device)
+        self.chunks = 0
+        self.segundos = 0.0
+
+    def _codificar(self, textos: Sequence[str]) -> np.ndarray:
+        # encode() también ordena por longitud dentro de cada llamada; aquí se hace
+        # sobre toda la entrada para que los lotes agrupen textos de longitud parecida.
+        return self.st_modelo.encode(list(textos), batch_size=self.tam_lote, show_progress_bar=False,
+                                     convert_to_numpy=True)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        inicio = time.perf_counter()
+        orden = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectores = None
+        for desde in range(0, len(orden), self.tam_lote):
+            indices = orden[desde:desde + self.tam_lote]
+            lote = self._codificar([texts[i] for i in indices])
+            if vectores is None:
+                vectores = np.empty((len(texts), lote.shape[1]), dtype=np.float32)
+            vectores[indices] = lote
+        self.segundos += time.perf_counter() - inicio
+        self.chunks += len(texts)
+        return vectores.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._codificar([text])[0].tolist()
+
+    def embed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        """Varias preguntas en una sola llamada a encode (no cuenta en las estadísticas de indexación)."""
+        return self._codificar(texts).tolist() if texts else []
+
+    def rendimiento(self) -> float:
+        """Chunks por segundo acumulados en embed_documents."""
+        return self.chunks / self.segundos if self.segundos else 0.0
+
+    def registrar_estadisticas(self) -> None:
+        if self.chunks:
+            logger.info(f"Embeddings ({self.backend}): {self.chunks} chunks en {self.segundos:.1f}s "
+                        f"({self.rendimiento():.1f} chunks/s)")
+
+
+def validar_contra_referencia(embeddings: EmbeddingsCPU, textos: Sequence[str],
+                              umbral: float = UMBRAL_COSENO) -> Dict[str, float]:
+    """
+    Compara los vectores del backend con los de PyTorch float32 sobre los mismos textos.
+    Devuelve similitud coseno media y mínima, y el rendimiento de ambos en chunks/s.
+    """
+    referencia = EmbeddingsCPU(embeddings.modelo, "torch", embeddings.tam_lote)
+    # La validación no cuenta en las estadísticas de la indexación
+    chunks, segundos = embeddings.chunks, embeddings.segundos
+    a = np.asarray(embeddings.embed_documents(list(textos)), dtype=np.float32)
+    rendimiento = len(textos) / (embeddings.segundos - segundos) if embeddings.segundos > segundos else 0.0
+    embeddings.chunks, embeddings.segundos = chunks, segundos
+    b = np.asarray(referencia.embed_documents(list(textos)), dtype=np.float32)
+    cosenos = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12)
+    reporte = {
+        "coseno_medio": float(cosenos.mean()),
+        "coseno_minimo": float(cosenos.min()),
+        "chunks_s": rendimiento,
+        "chunks_s_referencia": referencia.rendimiento(),
+        "valido": bool(cosenos.min() >= umbral),
+    }
+    logger.info(
+        f"Validación de '{embeddings.backend}' contra 'torch' ({len(textos)} textos): "
+        f"coseno medio {reporte['coseno_medio']:.4f}, mínimo {reporte['coseno_minimo']:.4f}; "
+        f"{reporte['chunks_s']:.1f} chunks/s frente a {reporte['chunks_s_referencia']:.1f} chunks/s"
+    )
+    if not reporte["valido"]:
+        logger.warning(f"La similitud mínima ({reporte['coseno_minimo']:.4f}) está por debajo de {umbral}.")
+    return reporte
+
+
+def agregar_argumentos_embeddings(parser: argparse.ArgumentParser) -> None:
+    """Añade a un script las opciones del backend de embeddings."""
+    grupo = parser.add_argument_group("embeddings")
+    grupo.add_argument("--backend-embeddings", choices=BACKENDS, default="torch",
+                       help="Runtime para calcular los embeddings en CPU.")
+    grupo.add_argument("--tam-lote-embeddings", type=int, default=TAM_LOTE_EMBEDDINGS,
+                       help="Textos por lote al calcular embeddings.")
+    grupo.add_argument("--hilos", type=int, default=0, help="Hilos de cómputo (0 = valor por defecto del runtime).")
+    grupo.add_argument("--validar-embeddings", type=int, default=0, metavar="N",
+                       help="Compara N chunks con el backend de referencia antes de indexar (0 = no validar).")
+
+
+def embeddings_desde_argumentos(args: argparse.Namespace) -> EmbeddingsCPU:
+    return EmbeddingsCPU(MODELO_EMBEDDINGS, args.backend_embeddings, args.tam_lote_embeddings, args.hilos)
+
+
+# --- Persistencia de la configuración ---
+
+def guardar_config_embeddings(directorio: Path, embeddings: EmbeddingsCPU) -> None:
+    """Registra con qué modelo y backend se calcularon los vectores del índice."""
+    with open(Path(directorio) / ARCHIVO_CONFIG_EMBEDDINGS, "w") as f:
+        json.dump({"modelo": embeddings.modelo, "backend": embeddings.backend}, f, indent=4)
+
+
+def leer_config_embeddings(directorio: Path) -> Dict[str, str]:
+    """Modelo y backend del índice; los índices antiguos usan PyTorch float32."""
+    ruta = Path(directorio) / ARCHIVO_CONFIG_EMBEDDINGS
+    if not ruta.exists():
+        return {"modelo": MODELO_EMBEDDINGS, "backend": "torch"}
+    with open(ruta) as f:
+        return json.load(f)
@@ -0,0 +1,154 @@
+"""
+Generaciones del índice publicado y recarga en caliente.
+
+Cada vez que un script de ingesta termina de publicar el índice escribe
+`generacion.json` en la raíz de `indice_faiss/` con un número creciente. Un
+`IndiceVivo` sondea ese manifiesto en un hilo de fondo; cuando cambia, carga la
+nueva generación sin tocar la que está en uso y después la reemplaza con una sola
+asignación. Cada consulta toma la generación vigente al empezar y la usa hasta el
+final.
+
+Una generación es dueña de sus recursos: el índice mapeado en memoria y la conexión
+a su docstore se abren al cargarla y mantienen abiertos los archivos con los que se
+cargó. Publicar otro índice encima (renombrando el directorio o reemplazando los
+archivos) no cambia lo que lee una generación ya cargada, desde ningún hilo, así que
+una consulta nunca mezcla dos versiones del índice.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cache_consultas import huella_indice, version_de_huella
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_GENERACION = "generacion.json"
+INTERVALO_COMPROBACION = 2.0  # segundos entre lecturas del manifiesto
+INTENTOS_CARGA = 3            # si se publica otra generación mientras se carga, se vuelve a cargar
+
+
+# --- Manifiesto ---
+
+def leer_generacion(ruta_db: Path) -> Optional[Dict[str, Any]]:
+    """Manifiesto de la generación publicada; None si el índice no tiene (o se está reescribiendo)."""
+    try:
+        with open(Path(ruta_db) / ARCHIVO_GENERACION, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def registrar_generacion(ruta_db: Path, anterior: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Escribe el manifiesto de una generación nueva (la anterior + 1) de forma atómica.
+
+    `anterior` es el manifiesto leído antes de publicar: al reemplazar el directorio
+    completo del índice, el de la generación anterior desaparece con él.
+    """
+    anterior = anterior if anterior is not None else leer_generacion(ruta_db)
+    manifiesto = {
+        "generacion": (anterior or {}).get("generacion", 0) + 1,
+        "publicada": datetime.now().isoformat(timespec="seconds"),
+    }
+    temporal = Path(ruta_db) / f".{ARCHIVO_GENERACION}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=4)
+    os.replace(temporal, Path(ruta_db) / ARCHIVO_GENERACION)
+    logger.info(f"Publicada la generación {manifiesto['generacion']} del índice.")
+    return manifiesto
+
+
+# --- Recarga en caliente ---
+
+@dataclass
+class Generacion:
+    """Una versión cargada del índice: vectorstore, búsqueda léxica e identificadores, con sus archivos abiertos."""
+    numero: int                 # 0 = índice sin manifiesto
+    publicada: Optional[str]
+    version: str                # huella corta de los archivos, para las claves de las cachés
+    db: Any
+    lexico: Any = None
+    cargada: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+
+
+class IndiceVivo:
+    """
+    Generación del índice en uso y recarga en segundo plano de las nuevas.
+
+    `cargar(ruta_db, anterior)` abre el índice y devuelve (db, lexico), con todos sus
+    archivos ya abiertos o leídos (nada que se abra más tarde por ruta); recibe la
+    generación en uso para poder reutilizar lo que no cambia (p. ej. el modelo de
+    embeddings). Las funciones registradas con `al_cambiar` reciben (anterior, nueva)
+    después del reemplazo, para liberar las cachés de la generación anterior.
+    """
+
+    def __init__(self, ruta_db: Path, cargar: Callable[[Path, Optional[Generacion]], Tuple[Any, Any]],
+                 intervalo: float = INTERVALO_COMPROBACION, vigilar: bool = True):
+        self.ruta_db = Path(ruta_db)
+        self._cargar = cargar
+        self.intervalo = intervalo
+        self._al_cambiar: List[Callable[[Generacion, Generacion], None]] = []
+        self.cargando: Optional[int] = None  # generación que se está cargando en segundo plano
+        self.error: Optional[str] = None
+        self.recargas = 0
+        self.actual = self._cargar_generacion(None)
+        if vigilar:
+            threading.Thread(target=self._vigilar, daemon=True).start()
+
+    def al_cambiar(self, funcion: Callable[[Generacion, Generacion], None]) -> None:
+        self._al_cambiar.append(funcion)
+
+    def obtener(self) -> Generacion:
+        """Generación vigente; quien la toma la usa durante toda la consulta."""
+        return self.actual
+
+    def _cargar_generacion(self, anterior: Optional[Generacion]) -> Generacion:
+        for _ in range(INTENTOS_CARGA):
+            manifiesto = leer_generacion(self.ruta_db) or {}
+            huella = huella_indice(self.ruta_db)
+            db, lexico = self._cargar(self.ruta_db, anterior)
+            # Si los archivos cambiaron durante la carga, lo cargado podría mezclar dos publicaciones
+            if huella_indice(self.ruta_db) == huella:
+                break
+            logger.info("El índice cambió mientras se cargaba; se vuelve a cargar.")
+        return Generacion(manifiesto.get("generacion", 0), manifiesto.get("publicada"),
+                          version_de_huella(huella), db, lexico)
+
+    def comprobar(self) -> bool:
+        """Carga y activa la generación publicada si es distinta de la vigente; True si hubo cambio."""
+        manifiesto = leer_generacion(self.ruta_db)
+        if manifiesto is None or manifiesto.get("generacion") == self.actual.numero:
+            return False
+        self.cargando = manifiesto.get("generacion")
+        inicio = time.perf_counter()
+        try:
+            nueva = self._cargar_generacion(self.actual)
+        except Exception as e:
+            # La generación en uso sigue sirviendo; se reintenta en la siguiente comprobación
+            self.error = str(e)
+            logger.error(f"No se pudo cargar la generación {self.cargando} del índice: {e}")
+            return False
+        finally:
+            self.cargando = None
+        anterior, self.actual = self.actual, nueva  # las consultas nuevas ya ven la nueva generación
+        self.error = None
+        self.recargas += 1
+        logger.info(f"Generación {nueva.numero} del índice activa (cargada en {time.perf_counter() - inicio:.2f}s; "
+                    f"antes {anterior.numero}).")
+        for funcion in self._al_cambiar:
+            try:
+                funcion(anterior, nueva)
+            except Exception as e:
+                logger.warning(f"Error al liberar la generación {anterior.numero}: {e}")
+        return True
+
+    def _vigilar(self) -> None:
+        while True:
+            time.sleep(self.intervalo)
+            self.comprobar()
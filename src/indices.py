@@ -0,0 +1,300 @@
+"""
+Construcción de índices FAISS aproximados (IVF, HNSW, PQ) y evaluación contra búsqueda exacta.
+
+El tipo de índice y sus parámetros de búsqueda se guardan en `config_indice.json`
+junto al índice, para que la aplicación los aplique al cargarlo.
+"""
+import argparse
+import json
+import logging
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TIPOS_INDICE = ("Flat", "IVF-Flat", "HNSW", "IVF-PQ")
+ARCHIVO_CONFIG = "config_indice.json"
+MAX_MUESTRA_ENTRENAMIENTO = 50_000
+PUNTOS_POR_CENTROIDE = 39  # mínimo que FAISS recomienda para entrenar k-means
+TAM_BLOQUE_EXACTO = 16_384  # vectores de la base que la búsqueda exacta del reporte tiene en memoria a la vez
+
+
+@dataclass
+class ConfigIndice:
+    """Especificación del índice: tipo, parámetros de construcción y de búsqueda."""
+    tipo: str = "Flat"
+    nlist: int = 0          # listas IVF (0 = automático, ~4·√n)
+    pq_m: int = 48          # subcuantizadores PQ (debe dividir la dimensión)
+    hnsw_m: int = 32        # vecinos por nodo en HNSW
+    nprobe: int = 16        # listas IVF visitadas por consulta
+    ef_search: int = 64     # candidatos explorados por consulta en HNSW
+
+    def requiere_entrenamiento(self) -> bool:
+        return self.tipo.startswith("IVF")
+
+    def cadena_factory(self, n_total: int, n_muestra: int, dimension: int) -> str:
+        """
+        Cadena de `faiss.index_factory` para un corpus de n_total vectores entrenado con
+        n_muestra; degrada a un índice más simple si no hay datos suficientes para entrenar.
+        """
+        if self.tipo == "Flat":
+            return "Flat"
+        if self.tipo == "HNSW":
+            return f"HNSW{self.hnsw_m}"
+        if self.tipo not in TIPOS_INDICE:
+            raise ValueError(f"Tipo de índice desconocido: '{self.tipo}'. Opciones: {', '.join(TIPOS_INDICE)}")
+
+        nlist = self.nlist or int(4 * math.sqrt(n_total))
+        nlist = min(nlist, n_muestra // PUNTOS_POR_CENTROIDE)
+        if nlist < 1:
+            logger.warning(f"Sólo hay {n_muestra} vectores: insuficientes para entrenar {self.tipo}; se usa Flat.")
+            return "Flat"
+        if self.tipo == "IVF-Flat":
+            return f"IVF{nlist},Flat"
+        if self.tipo == "IVF-PQ":
+            if dimension % self.pq_m != 0:
+                raise ValueError(f"pq_m={self.pq_m} debe dividir la dimensión de los embeddings ({dimension}).")
+            if n_muestra < 256:  # cada subcuantizador tiene 2^8 centroides
+                logger.warning(f"Sólo hay {n_muestra} vectores: insuficientes para entrenar PQ; se usa IVF{nlist},Flat.")
+                return f"IVF{nlist},Flat"
+        return f"IVF{nlist},PQ{self.pq_m}"
+
+
+def crear_indice(vectores: np.ndarray, config: ConfigIndice, n_total: Optional[int] = None) -> faiss.Index:
+    """
+    Crea (y entrena si hace falta) un índice vacío para los vectores dados.
+
+    `vectores` es la muestra de entrenamiento; `n_total` el tamaño esperado del
+    corpus, usado para dimensionar nlist (por defecto, el tamaño de la muestra).
+    """
+    vectores = np.ascontiguousarray(vectores, dtype=np.float32)
+    n, dimension = vectores.shape
+    factory = config.cadena_factory(n_total or n, min(n, MAX_MUESTRA_ENTRENAMIENTO), dimension)
+    index = faiss.index_factory(dimension, factory, faiss.METRIC_L2)
+
+    if not index.is_trained:
+        if n > MAX_MUESTRA_ENTRENAMIENTO:
+            muestra = vectores[np.random.default_rng(0).choice(n, MAX_MUESTRA_ENTRENAMIENTO, replace=False)]
+        else:
+            muestra = vectores
+        inicio = time.perf_counter()
+        index.train(muestra)
+        logger.info(f"Índice {factory} entrenado con {len(muestra)} vectores en {time.perf_counter() - inicio:.1f}s")
+
+    aplicar_parametros_busqueda(index, config)
+    logger.info(f"Tipo de índice: {factory}")
+    return index
+
+
+def aplicar_parametros_busqueda(index: faiss.Index, config: ConfigIndice) -> None:
+    """Ajusta nprobe (IVF) o efSearch (HNSW) según la configuración."""
+    parametros = faiss.ParameterSpace()
+    if faiss.try_extract_index_ivf(index) is not None:
+        parametros.set_index_parameter(index, "nprobe", config.nprobe)
+    elif hasattr(faiss.downcast_index(index), "hnsw"):
+        parametros.set_index_parameter(index, "efSearch", config.ef_search)
+
+
+def activar_reconstruccion(index: faiss.Index) -> None:
+    """
+    Construye el mapa directo de los IVF para que `reconstruct` funcione en las consultas (MMR).
+    Se llama al cargar el índice y nunca desde una consulta, porque el índice cargado se
+    comparte entre hilos. Vive sólo en memoria (8 bytes por vector).
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+
+
+def agregar_argumentos_indice(parser: argparse.ArgumentParser) -> None:
+    """Añade a un script las opciones para elegir el tipo de índice."""
+    defecto = ConfigIndice()
+    grupo = parser.add_argument_group("tipo de índice")
+    grupo.add_argument("--indice", choices=TIPOS_INDICE, default=defecto.tipo,
+                       help="Tipo de índice FAISS a construir.")
+    grupo.add_argument("--nlist", type=int, default=defecto.nlist, help="Listas IVF (0 = automático).")
+    grupo.add_argument("--pq-m", type=int, default=defecto.pq_m, help="Subcuantizadores de IVF-PQ.")
+    grupo.add_argument("--hnsw-m", type=int, default=defecto.hnsw_m, help="Vecinos por nodo en HNSW.")
+    grupo.add_argument("--nprobe", type=int, default=defecto.nprobe, help="Listas IVF visitadas por consulta.")
+    grupo.add_argument("--ef-search", type=int, default=defecto.ef_search, help="Candidatos por consulta en HNSW.")
+
+
+def config_desde_argumentos(args: argparse.Namespace) -> ConfigIndice:
+    return ConfigIndice(tipo=args.indice, nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m,
+                        nprobe=args.nprobe, ef_search=args.ef_search)
+
+
+# --- Persistencia de la configuración ---
+
+def guardar_config_indice(directorio: Path, config: ConfigIndice) -> None:
+    """Escribe la configuración del índice junto a los archivos de FAISS."""
+    with open(Path(directorio) / ARCHIVO_CONFIG, "w") as f:
+        json.dump(asdict(config), f, indent=4)
+
+
+def leer_config_indice(directorio: Path) -> ConfigIndice:
+    """Lee la configuración guardada; los índices antiguos sin archivo se consideran Flat."""
+    ruta = Path(directorio) / ARCHIVO_CONFIG
+    if not ruta.exists():
+        return ConfigIndice()
+    with open(ruta) as f:
+        return ConfigIndice(**json.load(f))
+
+
+# --- Evaluación ---
+
+def tamano_indice(index: faiss.Index) -> int:
+    """Bytes que ocupa el índice serializado (≈ memoria que necesita cargado), sin copiarlo."""
+    total = 0
+
+    def contar(datos: bytes) -> int:
+        nonlocal total
+        total += len(datos)
+        return len(datos)
+
+    faiss.write_index(index, faiss.PyCallbackIOWriter(contar))
+    return total
+
+
+def admite_borrado(index: faiss.Index) -> bool:
+    """
+    True sólo para los índices Flat, cuyo `remove_ids` compacta los vectores y renumera las
+    posiciones como hace `FAISS.delete`. El grafo HNSW no permite quitar nodos, y los IVF
+    conservan las etiquetas antiguas, que dejarían de coincidir con `index_to_docstore_id`.
+    """
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+
+
+@contextmanager
+def vectores_accesibles(index: faiss.Index) -> Iterator[bool]:
+    """
+    Permite `reconstruct` en el índice mientras dura el bloque e indica si los vectores
+    que devuelve son exactos (los índices PQ sólo guardan una aproximación comprimida).
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        yield True
+        return
+    ivf.make_direct_map()
+    try:
+        yield isinstance(faiss.downcast_index(ivf), faiss.IndexIVFFlat)
+    finally:
+        ivf.make_direct_map(False)  # no guardar el mapa en disco
+
+
+def reconstruir_vectores(index: faiss.Index) -> Tuple[Optional[np.ndarray], bool]:
+    """Recupera todos los vectores guardados en el índice y si son exactos."""
+    if index.ntotal == 0:
+        return None, False
+    with vectores_accesibles(index) as exactos:
+        try:
+            return index.reconstruct_n(0, index.ntotal), exactos
+        except RuntimeError:
+            return None, False
+
+
+def bloques_reconstruidos(index: faiss.Index, tam_bloque: int = TAM_BLOQUE_EXACTO) -> Iterator[np.ndarray]:
+    """Vectores del índice en orden, de `tam_bloque` en `tam_bloque` (dentro de `vectores_accesibles`)."""
+    for inicio in range(0, index.ntotal, tam_bloque):
+        yield index.reconstruct_n(inicio, min(tam_bloque, index.ntotal - inicio))
+
+
+def vecinos_exactos(consultas: np.ndarray, bloques: Iterable[np.ndarray], k: int,
+                    metrica: int = faiss.METRIC_L2) -> np.ndarray:
+    """Posiciones de los k vecinos exactos de cada consulta, recorriendo la base por bloques."""
+    heap = faiss.ResultHeap(len(consultas), k, keep_max=metrica == faiss.METRIC_INNER_PRODUCT)
+    inicio = 0
+    for bloque in bloques:
+        bloque = np.ascontiguousarray(bloque, dtype=np.float32)
+        distancias, ids = faiss.knn(consultas, bloque, min(k, len(bloque)), metric=metrica)
+        heap.add_result(distancias, ids + inicio)
+        inicio += len(bloque)
+    heap.finalize()
+    return heap.I
+
+
+def evaluar_indice(index: faiss.Index, consultas: np.ndarray,
+                   base_exacta: Union[np.ndarray, Iterable[np.ndarray], None] = None,
+                   k: int = 10, max_consultas: int = 200) -> Dict[str, float]:
+    """
+    Mide tamaño, latencia por consulta y, si se da la base exacta (mismos vectores y
+    mismo orden que el índice, como array o por bloques), el recall@k frente a una
+    búsqueda exacta.
+    """
+    if len(consultas) > max_consultas:
+        consultas = consultas[np.random.default_rng(0).choice(len(consultas), max_consultas, replace=False)]
+    consultas = np.ascontiguousarray(consultas, dtype=np.float32)
+    reporte: Dict[str, float] = {"tipo": type(faiss.downcast_index(index)).__name__,
+                                 "vectores": index.ntotal, "bytes": tamano_indice(index)}
+    if len(consultas) == 0 or index.ntotal == 0:
+        return reporte
+
+    latencias = []
+    resultados = []
+    for i in range(len(consultas)):
+        inicio = time.perf_counter()
+        _, ids = index.search(consultas[i:i + 1], k)
+        latencias.append(time.perf_counter() - inicio)
+        resultados.append(ids[0])
+    latencias_ms = np.array(latencias) * 1000
+    reporte["latencia_p50_ms"] = float(np.percentile(latencias_ms, 50))
+    reporte["latencia_p95_ms"] = float(np.percentile(latencias_ms, 95))
+
+    if base_exacta is not None:
+        bloques = base_exacta
+        if isinstance(base_exacta, np.ndarray):
+            bloques = (base_exacta[i:i + TAM_BLOQUE_EXACTO] for i in range(0, len(base_exacta), TAM_BLOQUE_EXACTO))
+        exactos = vecinos_exactos(consultas, bloques, k, index.metric_type)
+        aciertos = [len(set(r[r >= 0]) & set(e[e >= 0])) / min(k, index.ntotal) for r, e in zip(resultados, exactos)]
+        reporte[f"recall@{k}"] = float(np.mean(aciertos))
+    return reporte
+
+
+def reportar_indice(index: faiss.Index, vectores: Optional[np.ndarray] = None, k: int = 10,
+                    max_consultas: int = 200) -> Dict[str, float]:
+    """
+    Evalúa el índice usando como consultas una muestra de sus propios vectores.
+
+    Si no se dan los vectores originales sólo se reconstruyen las consultas, y la
+    búsqueda exacta recorre el índice por bloques de TAM_BLOQUE_EXACTO: la memoria
+    extra no crece con el corpus. En índices PQ no hay base exacta y se omite el recall.
+    """
+    if vectores is not None:
+        reporte = evaluar_indice(index, vectores, vectores, k=k, max_consultas=max_consultas)
+        registrar_reporte(reporte)
+        return reporte
+
+    reporte = None
+    if index.ntotal:
+        n_consultas = min(max_consultas, index.ntotal)
+        posiciones = np.sort(np.random.default_rng(0).choice(index.ntotal, n_consultas, replace=False))
+        with vectores_accesibles(index) as exactos:
+            try:
+                consultas = np.vstack([index.reconstruct(int(pos)) for pos in posiciones])
+            except RuntimeError:
+                consultas = None
+            if consultas is not None:
+                base = bloques_reconstruidos(index) if exactos else None
+                reporte = evaluar_indice(index, consultas, base, k=k, max_consultas=max_consultas)
+        if reporte is not None:
+            reporte["bytes"] = tamano_indice(index)  # sin el mapa directo de los IVF
+    if reporte is None:
+        reporte = evaluar_indice(index, np.empty((0, index.d), dtype=np.float32), k=k)
+    registrar_reporte(reporte)
+    return reporte
+
+
+def registrar_reporte(reporte: Dict[str, float]) -> None:
+    """Escribe en el log el reporte de `evaluar_indice`."""
+    partes = [f"{reporte['tipo']} con {reporte['vectores']} vectores", f"{reporte['bytes'] / 1e6:.2f} MB"]
+    if "latencia_p50_ms" in reporte:
+        partes.append(f"latencia p50 {reporte['latencia_p50_ms']:.3f} ms / p95 {reporte['latencia_p95_ms']:.3f} ms")
+    partes += [f"{clave} {valor:.3f}" for clave, valor in reporte.items() if clave.startswith("recall@")]
+    logger.info("Reporte del índice: " + ", ".join(partes))
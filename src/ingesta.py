@@ -0,0 +1,320 @@
+"""
+Funciones de ingesta compartidas por los scripts de procesamiento de documentos.
+"""
+import logging
+import os
+import resource
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from cache_paginas import cargar_paginas_cacheadas
+from cargadores import MOTOR_PDF
+from indices import (MAX_MUESTRA_ENTRENAMIENTO, ConfigIndice, admite_borrado, crear_indice, reconstruir_vectores,
+                     reportar_indice)
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+TAM_LOTE = 256
+
+# Resultado de un archivo: (ruta, páginas leídas, documentos, error)
+ResultadoArchivo = Tuple[str, int, List[Document], Optional[str]]
+
+
+def crear_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> RecursiveCharacterTextSplitter:
+    """Crea el divisor de texto con la configuración del proyecto."""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        add_start_index=True  # posición en la página, para fusionar chunks contiguos al armar el contexto
+    )
+
+
+def resolver_workers(workers: int) -> int:
+    """Convierte el número de workers pedido en uno válido (0 = todos los núcleos)."""
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def procesar_archivo(ruta: str, dividir: bool = True, chunk_size: int = CHUNK_SIZE,
+                     chunk_overlap: int = CHUNK_OVERLAP, motor_pdf: str = MOTOR_PDF,
+                     dir_cache_paginas: Optional[Path] = None) -> ResultadoArchivo:
+    """
+    Carga un archivo con el cargador de su tipo (ver `cargadores.py`) y, opcionalmente, lo divide en chunks.
+    Con `dir_cache_paginas` el texto de un archivo ya extraído se lee de la caché de páginas.
+
+    Se ejecuta dentro de los procesos del pool, así que nunca lanza excepciones:
+    el error se devuelve para que un archivo dañado no detenga el lote.
+    """
+    try:
+        paginas = list(cargar_paginas_cacheadas(ruta, motor_pdf, dir_cache_paginas))
+        if dividir and paginas:
+            return ruta, len(paginas), crear_splitter(chunk_size, chunk_overlap).split_documents(paginas), None
+        return ruta, len(paginas), paginas, None
+    except Exception as e:
+        return ruta, 0, [], str(e)
+
+
+def procesar_archivos(rutas: Sequence[str], workers: int = 1, dividir: bool = True,
+                      chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                      motor_pdf: str = MOTOR_PDF, dir_cache_paginas: Optional[Path] = None,
+                      fallidos: Optional[List[str]] = None) -> List[Document]:
+    """
+    Carga (y divide) una lista de archivos, en serie o con un pool de procesos.
+
+    El resultado conserva el orden de `rutas`, por lo que es idéntico al de una
+    ejecución en serie sin importar el orden en que terminen los workers.
+    Los archivos que no se pueden cargar se saltan; si se da `fallidos`, se les añaden sus rutas.
+    """
+    rutas = [str(r) for r in rutas]
+    workers = min(resolver_workers(workers), max(len(rutas), 1))
+    resultados: List[Optional[List[Document]]] = [None] * len(rutas)
+    total_paginas = 0
+    inicio = time.perf_counter()
+
+    def registrar(completados: int, resultado: ResultadoArchivo) -> None:
+        nonlocal total_paginas
+        ruta, n_paginas, _, error = resultado
+        if error is not None:
+            logger.error(f"Error cargando el archivo {ruta}: {error}")
+            if fallidos is not None:
+                fallidos.append(ruta)
+            return
+        total_paginas += n_paginas
+        transcurrido = max(time.perf_counter() - inicio, 1e-9)
+        logger.info(
+            f"[{completados}/{len(rutas)}] Cargado: {Path(ruta).name} ({n_paginas} páginas) "
+            f"- {total_paginas / transcurrido:.1f} páginas/s"
+        )
+
+    if workers <= 1:
+        for i, ruta in enumerate(rutas):
+            resultado = procesar_archivo(ruta, dividir, chunk_size, chunk_overlap, motor_pdf, dir_cache_paginas)
+            resultados[i] = resultado[2]
+            registrar(i + 1, resultado)
+    else:
+        logger.info(f"Procesando {len(rutas)} archivos con {workers} procesos...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futuros = {
+                pool.submit(procesar_archivo, ruta, dividir, chunk_size, chunk_overlap, motor_pdf, dir_cache_paginas): i
+                for i, ruta in enumerate(rutas)
+            }
+            for completados, futuro in enumerate(as_completed(futuros), start=1):
+                i = futuros[futuro]
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    # El proceso del worker murió (p. ej. sin memoria); sólo se pierde ese archivo.
+                    resultado = (rutas[i], 0, [], f"el proceso del worker falló: {e}")
+                resultados[i] = resultado[2]
+                registrar(completados, resultado)
+
+    transcurrido = max(time.perf_counter() - inicio, 1e-9)
+    logger.info(
+        f"Carga terminada: {total_paginas} páginas en {transcurrido:.1f}s "
+        f"({total_paginas / transcurrido:.1f} páginas/s)"
+    )
+    return [doc for docs in resultados if docs for doc in docs]
+
+
+# --- Ingesta en streaming ---
+
+def pico_memoria_mb() -> float:
+    """Pico de memoria residente (RSS) del proceso y sus hijos, en MB."""
+    factor = 1 if sys.platform == "darwin" else 1024  # Linux reporta KB, macOS bytes
+    pico = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return pico * factor / 1e6
+
+
+def iterar_chunks(rutas: Sequence[str], workers: int = 1, chunk_size: int = CHUNK_SIZE,
+                  chunk_overlap: int = CHUNK_OVERLAP, motor_pdf: str = MOTOR_PDF,
+                  dir_cache_paginas: Optional[Path] = None, fallidos: Optional[List[str]] = None) -> Iterator[Document]:
+    """
+    Genera los chunks de los archivos sin acumular el corpus en memoria.
+
+    En serie, las páginas se leen una a una a medida que el cargador las genera. Con un pool, sólo se
+    mantienen `2 * workers` archivos en vuelo: no se envía otro hasta que el
+    consumidor termina con el más antiguo, y el orden es el mismo que en serie.
+    Los archivos que fallan se saltan y, si se da `fallidos`, se añaden a esa lista; en serie,
+    las páginas que un archivo haya generado antes del error ya se entregaron.
+    """
+    rutas = [str(r) for r in rutas]
+    workers = min(resolver_workers(workers), max(len(rutas), 1))
+    splitter = crear_splitter(chunk_size, chunk_overlap)
+
+    if workers <= 1:
+        for ruta in rutas:
+            try:
+                for pagina in cargar_paginas_cacheadas(ruta, motor_pdf, dir_cache_paginas):
+                    yield from splitter.split_documents([pagina])
+                logger.info(f"Cargado: {Path(ruta).name}")
+            except Exception as e:
+                logger.error(f"Error cargando el archivo {ruta}: {e}")
+                if fallidos is not None:
+                    fallidos.append(ruta)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pendientes = iter(rutas)
+        en_vuelo = deque(
+            (ruta, pool.submit(procesar_archivo, ruta, True, chunk_size, chunk_overlap, motor_pdf, dir_cache_paginas))
+            for ruta in islice(pendientes, 2 * workers)
+        )
+        while en_vuelo:
+            ruta, futuro = en_vuelo.popleft()
+            try:
+                _, _, chunks, error = futuro.result()
+            except Exception as e:
+                chunks, error = [], f"el proceso del worker falló: {e}"
+            siguiente = next(pendientes, None)
+            if siguiente is not None:
+                futuro = pool.submit(procesar_archivo, siguiente, True, chunk_size, chunk_overlap, motor_pdf,
+                                     dir_cache_paginas)
+                en_vuelo.append((siguiente, futuro))
+            if error is not None:
+                logger.error(f"Error cargando el archivo {ruta}: {error}")
+                if fallidos is not None:
+                    fallidos.append(ruta)
+                continue
+            logger.info(f"Cargado: {Path(ruta).name}")
+            yield from chunks
+
+
+def lotes(iterable: Iterable[Document], tam_lote: int) -> Iterator[List[Document]]:
+    """Agrupa un iterable en listas de tamaño fijo (la última puede ser menor)."""
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tam_lote)):
+        yield lote
+
+
+def crear_base_vacia(embeddings: Embeddings, index) -> FAISS:
+    """Envuelve un índice FAISS (ya entrenado) en un vectorstore de LangChain vacío."""
+    return FAISS(embedding_function=embeddings, index=index,
+                 docstore=InMemoryDocstore(), index_to_docstore_id={})
+
+
+def reconstruir_base(db: FAISS, config: ConfigIndice, excluir: Iterable[str] = ()) -> Optional[FAISS]:
+    """
+    Índice nuevo del tipo de `config` con los chunks de `db` salvo los de `excluir`, a partir de
+    los vectores guardados. Reentrena los IVF y rehace el grafo HNSW. Los índices que sólo guardan
+    una aproximación (IVF-PQ) recalculan los embeddings de los chunks que se conservan.
+    Devuelve None si no queda ningún chunk.
+    """
+    excluir = set(excluir)
+    posiciones = [pos for pos, id_doc in sorted(db.index_to_docstore_id.items()) if id_doc not in excluir]
+    if not posiciones:
+        return None
+    ids = [db.index_to_docstore_id[pos] for pos in posiciones]
+    docs = [db.docstore.search(id_doc) for id_doc in ids]
+    textos = [d.page_content for d in docs]
+    vectores, exactos = reconstruir_vectores(db.index)
+    if vectores is not None and exactos:
+        vectores = vectores[posiciones]
+    else:
+        logger.info(f"El índice no guarda los vectores exactos; se recalculan {len(textos)} embeddings")
+        vectores = np.asarray(db.embedding_function.embed_documents(textos), dtype=np.float32)
+    nueva = crear_base_vacia(db.embedding_function, crear_indice(vectores, config))
+    nueva.add_embeddings(list(zip(textos, vectores.tolist())), metadatas=[d.metadata for d in docs], ids=ids)
+    return nueva
+
+
+def quitar_chunks(db: FAISS, ids: Sequence[str], config: ConfigIndice) -> Optional[FAISS]:
+    """
+    Borra los chunks del índice editable y lo devuelve (None si queda vacío). Sólo los índices
+    Flat borran en su sitio; los demás (IVF, HNSW) se reconstruyen sin ellos.
+    """
+    if not ids:
+        return db
+    if not admite_borrado(db.index):
+        logger.info(f"El índice no admite borrar vectores; se reconstruye sin los {len(ids)} chunks quitados")
+        return reconstruir_base(db, config, excluir=ids)
+    db.delete(list(ids))
+    logger.info(f"Quitados {len(ids)} chunks de archivos modificados o eliminados")
+    return db if db.index.ntotal else None
+
+
+def construir_base_vectorial(chunks: Sequence[Document], embeddings: Embeddings,
+                             config: Optional[ConfigIndice] = None, reportar: bool = True) -> FAISS:
+    """Calcula los embeddings, crea el índice del tipo pedido, inserta los chunks y, si se pide, reporta su calidad."""
+    textos = [doc.page_content for doc in chunks]
+    vectores = np.asarray(embeddings.embed_documents(textos), dtype=np.float32)
+    db = crear_base_vacia(embeddings, crear_indice(vectores, config or ConfigIndice()))
+    db.add_embeddings(list(zip(textos, vectores.tolist())), metadatas=[doc.metadata for doc in chunks])
+    if reportar:
+        reportar_indice(db.index, vectores)
+    return db
+
+
+def indexar_en_streaming(rutas: Sequence[str], embeddings: Embeddings, db: Optional[FAISS] = None,
+                         workers: int = 1, tam_lote: int = TAM_LOTE,
+                         config: Optional[ConfigIndice] = None, motor_pdf: str = MOTOR_PDF,
+                         dir_cache_paginas: Optional[Path] = None,
+                         fallidos: Optional[List[str]] = None, reportar: bool = True) -> Optional[FAISS]:
+    """
+    Ejecuta carga → división → embeddings por lotes → inserción en FAISS como un pipeline.
+
+    Cada lote se inserta en el índice antes de pedir el siguiente, así que la memoria
+    de trabajo es la de un lote y no la del corpus; sólo crece el propio índice.
+    Si `db` es None se crea un índice nuevo del tipo indicado en `config`; los tipos
+    que requieren entrenamiento retienen hasta MAX_MUESTRA_ENTRENAMIENTO vectores
+    para entrenarse antes de la primera inserción. Las rutas que no se pudieron cargar
+    se añaden a `fallidos`, como en `iterar_chunks`. Con `reportar` se evalúa el índice
+    al terminar y se vuelve a registrar el pico de memoria tras la evaluación.
+    """
+    config = config or ConfigIndice()
+    inicio = time.perf_counter()
+    total = 0
+    retenidos: List[Tuple[List[str], List[List[float]], List[dict]]] = []
+
+    def volcar_retenidos() -> FAISS:
+        muestra = np.asarray([v for _, vectores, _ in retenidos for v in vectores], dtype=np.float32)
+        nueva = crear_base_vacia(embeddings, crear_indice(muestra, config))
+        for textos, vectores, metadatos in retenidos:
+            nueva.add_embeddings(list(zip(textos, vectores)), metadatas=metadatos)
+        retenidos.clear()
+        return nueva
+
+    chunks = iterar_chunks(rutas, workers, motor_pdf=motor_pdf, dir_cache_paginas=dir_cache_paginas, fallidos=fallidos)
+    for lote in lotes(chunks, tam_lote):
+        textos = [doc.page_content for doc in lote]
+        metadatos = [doc.metadata for doc in lote]
+        vectores = embeddings.embed_documents(textos)
+        if db is None:
+            retenidos.append((textos, vectores, metadatos))
+            n_retenidos = sum(len(t) for t, _, _ in retenidos)
+            if not config.requiere_entrenamiento() or n_retenidos >= MAX_MUESTRA_ENTRENAMIENTO:
+                db = volcar_retenidos()
+        else:
+            db.add_embeddings(list(zip(textos, vectores)), metadatas=metadatos)
+        total += len(lote)
+        transcurrido = max(time.perf_counter() - inicio, 1e-9)
+        logger.info(f"Indexados {total} chunks ({total / transcurrido:.1f} chunks/s)")
+
+    if db is None and retenidos:
+        db = volcar_retenidos()
+
+    transcurrido = max(time.perf_counter() - inicio, 1e-9)
+    logger.info(
+        f"Ingesta en streaming terminada: {total} chunks en {transcurrido:.1f}s "
+        f"({total / transcurrido:.1f} chunks/s), pico de memoria {pico_memoria_mb():.0f} MB"
+    )
+    if db is not None and reportar:
+        reportar_indice(db.index)
+        logger.info(f"Pico de memoria tras el reporte del índice: {pico_memoria_mb():.0f} MB")
+    return db
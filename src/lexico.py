@@ -0,0 +1,198 @@
+"""
+Índice invertido BM25 sobre los mismos chunks que el índice FAISS y fusión híbrida.
+
+El índice se construye en la ingesta y se guarda en `lexico.npz` junto a `index.faiss`.
+Cada posting ya lleva su peso BM25 precalculado, así que una consulta sólo suma los
+pesos de sus términos: no se vuelve a recorrer el texto. Los documentos se identifican
+por su posición en el índice FAISS, de modo que ambos índices comparten el docstore.
+"""
+import logging
+import re
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_LEXICO = "lexico.npz"
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60                # constante de Reciprocal Rank Fusion
+CANDIDATOS_POR_LISTA = 4  # cada búsqueda aporta k·4 candidatos a la fusión
+
+
+def tokenizar(texto: str) -> List[str]:
+    """
+    Minúsculas y sin acentos. Los identificadores compuestos ("IAC-2016", "v2.1",
+    "CONIELECOMP2013_Submission34") se conservan enteros y además se añaden sus partes
+    de letras y de dígitos.
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    tokens = []
+    for palabra in re.findall(r"\w+(?:[-.]\w+)*", texto):
+        tokens.append(palabra)
+        if not palabra.isalpha() and not palabra.isdigit():
+            tokens.extend(re.findall(r"[^\W\d_]+|\d+", palabra))
+    return [t for t in tokens if len(t) > 1 or t.isdigit()]
+
+
+def texto_indexable(doc: Document) -> str:
+    """Texto del chunk más el nombre de su archivo, que suele contener el término buscado."""
+    fuente = doc.metadata.get("source")
+    return f"{Path(fuente).stem} {doc.page_content}" if fuente else doc.page_content
+
+
+class IndiceLexico:
+    """Postings en formato CSR: `offsets[t]:offsets[t+1]` son las posiciones y pesos del término t."""
+
+    def __init__(self, terminos: Sequence[str], offsets: np.ndarray, posiciones: np.ndarray, pesos: np.ndarray):
+        self.vocabulario: Dict[str, int] = {termino: i for i, termino in enumerate(terminos)}
+        self.offsets = offsets
+        self.posiciones = posiciones
+        self.pesos = pesos
+
+    def buscar(self, consulta: str, k: int = 4) -> List[Tuple[int, float]]:
+        """Las k posiciones con mayor puntuación BM25 para la consulta, de mayor a menor."""
+        ids = [self.vocabulario[t] for t in dict.fromkeys(tokenizar(consulta)) if t in self.vocabulario]
+        if not ids:
+            return []
+        posiciones = np.concatenate([self.posiciones[self.offsets[i]:self.offsets[i + 1]] for i in ids])
+        pesos = np.concatenate([self.pesos[self.offsets[i]:self.offsets[i + 1]] for i in ids])
+        unicas, inversa = np.unique(posiciones, return_inverse=True)
+        puntuaciones = np.bincount(inversa, weights=pesos)
+        if len(unicas) > k:
+            mejores = np.argpartition(-puntuaciones, k)[:k]
+        else:
+            mejores = np.arange(len(unicas))
+        mejores = mejores[np.argsort(-puntuaciones[mejores], kind="stable")]
+        return [(int(unicas[i]), float(puntuaciones[i])) for i in mejores]
+
+    def guardar(self, directorio: Path) -> None:
+        # Sin pickle: el vocabulario se guarda como arreglo de cadenas
+        terminos = np.array(sorted(self.vocabulario, key=self.vocabulario.get))
+        np.savez(Path(directorio) / ARCHIVO_LEXICO, terminos=terminos, offsets=self.offsets,
+                 posiciones=self.posiciones, pesos=self.pesos)
+
+    def __len__(self) -> int:
+        return len(self.vocabulario)
+
+
+def construir_indice_lexico(chunks: Iterable[Tuple[int, str]]) -> IndiceLexico:
+    """Construye el índice BM25 a partir de pares (posición en FAISS, texto)."""
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    longitudes: Dict[int, int] = {}
+    for pos, texto in chunks:
+        tokens = tokenizar(texto)
+        longitudes[pos] = len(tokens)
+        frecuencias: Dict[str, int] = {}
+        for token in tokens:
+            frecuencias[token] = frecuencias.get(token, 0) + 1
+        for token, tf in frecuencias.items():
+            postings.setdefault(token, []).append((pos, tf))
+
+    n_docs = len(longitudes)
+    longitud_media = (sum(longitudes.values()) / n_docs) if n_docs else 0.0
+    terminos = sorted(postings)
+    offsets = np.zeros(len(terminos) + 1, dtype=np.int64)
+    posiciones = np.empty(sum(len(p) for p in postings.values()), dtype=np.int64)
+    pesos = np.empty(len(posiciones), dtype=np.float32)
+
+    inicio = 0
+    for i, termino in enumerate(terminos):
+        lista = postings[termino]
+        idf = np.log(1 + (n_docs - len(lista) + 0.5) / (len(lista) + 0.5))
+        pos = np.array([p for p, _ in lista], dtype=np.int64)
+        tf = np.array([f for _, f in lista], dtype=np.float32)
+        dl = np.array([longitudes[p] for p in pos], dtype=np.float32)
+        norma = BM25_K1 * (1 - BM25_B + BM25_B * dl / max(longitud_media, 1e-9))
+        posiciones[inicio:inicio + len(lista)] = pos
+        pesos[inicio:inicio + len(lista)] = idf * tf * (BM25_K1 + 1) / (tf + norma)
+        inicio += len(lista)
+        offsets[i + 1] = inicio
+    return IndiceLexico(terminos, offsets, posiciones, pesos)
+
+
+def cargar_indice_lexico(directorio: Path) -> Optional[IndiceLexico]:
+    """Carga el índice léxico; None si el índice se generó antes de que existiera."""
+    ruta = Path(directorio) / ARCHIVO_LEXICO
+    if not ruta.exists():
+        return None
+    with np.load(ruta, allow_pickle=False) as datos:
+        return IndiceLexico(datos["terminos"].tolist(), datos["offsets"], datos["posiciones"], datos["pesos"])
+
+
+def reportar_indice_lexico(indice: IndiceLexico, textos: Sequence[str], max_consultas: int = 200) -> None:
+    """Escribe en el log el tamaño del índice y la latencia de consultas con términos de los propios chunks."""
+    rng = np.random.default_rng(0)
+    consultas = []
+    muestra = rng.choice(len(textos), min(len(textos), max_consultas), replace=False) if textos else []
+    for i in muestra:
+        tokens = tokenizar(textos[i])
+        if tokens:
+            consultas.append(" ".join(rng.choice(tokens, min(len(tokens), 6), replace=False)))
+    latencias = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        indice.buscar(consulta, 10)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    mb = (indice.offsets.nbytes + indice.posiciones.nbytes + indice.pesos.nbytes) / 1e6
+    partes = [f"{len(indice)} términos", f"{len(indice.posiciones)} postings", f"{mb:.2f} MB"]
+    if latencias:
+        partes.append(f"latencia p50 {np.percentile(latencias, 50):.3f} ms / p95 {np.percentile(latencias, 95):.3f} ms")
+    logger.info("Índice léxico (BM25): " + ", ".join(partes))
+
+
+# --- Búsqueda híbrida ---
+
+class BusquedaLexica:
+    """Búsqueda BM25 sobre uno o varios índices (shards), devolviendo los documentos del docstore."""
+
+    def __init__(self, pares: Sequence[Tuple[IndiceLexico, object]]):
+        # Cada par es (índice léxico, vectorstore FAISS del que sale su docstore)
+        self.pares = list(pares)
+
+    def buscar(self, consulta: str, k: int = 4) -> List[Tuple[Document, float]]:
+        resultados = []
+        for indice, db in self.pares:
+            for pos, puntuacion in indice.buscar(consulta, k):
+                doc = db.docstore.search(db.index_to_docstore_id[pos])
+                if isinstance(doc, Document):
+                    resultados.append((doc, puntuacion))
+        # Con shards las puntuaciones no son del todo comparables (IDF por shard), pero sí su orden
+        return sorted(resultados, key=lambda par: -par[1])[:k]
+
+
+def clave_documento(doc: Document) -> str:
+    return doc.id or f"{doc.metadata.get('source')}:{doc.metadata.get('page')}:{doc.page_content}"
+
+
+def fusionar_rrf(listas: Sequence[Sequence[Document]], k: int, constante: int = RRF_K) -> List[Document]:
+    """Reciprocal Rank Fusion: cada documento suma 1/(constante + rango) por cada lista en la que aparece."""
+    puntuaciones: Dict[str, float] = {}
+    documentos: Dict[str, Document] = {}
+    for lista in listas:
+        for rango, doc in enumerate(lista, start=1):
+            clave = clave_documento(doc)
+            puntuaciones[clave] = puntuaciones.get(clave, 0.0) + 1.0 / (constante + rango)
+            documentos.setdefault(clave, doc)
+    orden = sorted(puntuaciones, key=lambda clave: -puntuaciones[clave])
+    return [documentos[clave] for clave in orden[:k]]
+
+
+def buscar_hibrido(db, lexico: BusquedaLexica, vector: List[float], pregunta: str, k: int) -> List[Document]:
+    """Fusiona con RRF los candidatos de la búsqueda vectorial y de BM25, devolviendo k documentos."""
+    candidatos = k * CANDIDATOS_POR_LISTA
+    inicio = time.perf_counter()
+    por_vector = db.similarity_search_by_vector(vector, k=candidatos)
+    medio = time.perf_counter()
+    por_lexico = [doc for doc, _ in lexico.buscar(pregunta, candidatos)]
+    fin = time.perf_counter()
+    documentos = fusionar_rrf([por_vector, por_lexico], k)
+    logger.info(f"Búsqueda híbrida: vectorial {(medio - inicio) * 1000:.2f} ms, "
+                f"BM25 {(fin - medio) * 1000:.2f} ms, fusión total {(time.perf_counter() - inicio) * 1000:.2f} ms")
+    return documentos
@@ -0,0 +1,57 @@
+"""
+Límites de uso de los proveedores de LLM.
+
+Cada proveedor tiene un máximo de peticiones por minuto (la cuota gratuita de Gemini
+flash es de 15) y de peticiones simultáneas. `LimitadorTasa` es un token bucket que
+se llena a razón de `por_minuto / 60` fichas por segundo hasta `rafaga`; sirve tanto
+desde hilos (`adquirir`) como desde asyncio (`esperar`).
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+LIMITES_PROVEEDOR: Dict[str, Dict[str, Optional[int]]] = {
+    "google": {"por_minuto": 15, "concurrencia": 4},
+    "ollama": {"por_minuto": None, "concurrencia": 1},  # local: genera una respuesta a la vez
+    "simulado": {"por_minuto": None, "concurrencia": 16},
+}
+
+
+class LimitadorTasa:
+    """Token bucket; `por_minuto=None` no limita."""
+
+    def __init__(self, por_minuto: Optional[float], rafaga: int = 1):
+        self.por_minuto = por_minuto
+        self.rafaga = max(1, rafaga)
+        self._fichas = float(self.rafaga)
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self, max_espera: Optional[float] = None) -> Optional[float]:
+        """
+        Reserva una ficha y devuelve cuántos segundos hay que esperar para usarla.
+        Las reservas se atienden en orden de llegada. Con `max_espera`, si la espera
+        sería mayor no se reserva nada y se devuelve None.
+        """
+        if not self.por_minuto:
+            return 0.0
+        with self._lock:
+            ahora = time.monotonic()
+            self._fichas = min(self.rafaga, self._fichas + (ahora - self._ultima) * self.por_minuto / 60)
+            self._ultima = ahora
+            espera = max(0.0, (1 - self._fichas) * 60 / self.por_minuto)
+            if max_espera is not None and espera > max_espera:
+                return None
+            self._fichas -= 1
+            return espera
+
+    def adquirir(self) -> None:
+        """Bloquea el hilo hasta que le toque su ficha."""
+        time.sleep(self.reservar())
+
+    async def esperar(self) -> None:
+        """Como `adquirir`, sin bloquear el bucle de eventos."""
+        espera = self.reservar()
+        if espera:
+            await asyncio.sleep(espera)
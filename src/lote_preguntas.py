@@ -0,0 +1,207 @@
+"""
+Respuestas en lote para un archivo de preguntas (evaluaciones, sin pasar por la app).
+
+1. Los embeddings de todas las preguntas se calculan en una sola pasada por lotes.
+2. Se hace una única búsqueda matricial en FAISS (opcionalmente fusionada con BM25).
+3. Las llamadas al LLM se lanzan en paralelo respetando los límites del proveedor
+   (peticiones por minuto y simultáneas, ver `limites.py`).
+
+Cada respuesta se añade al JSONL de salida en cuanto llega, así que si la ejecución se
+interrumpe basta con relanzar el mismo comando: las preguntas ya respondidas se saltan
+y las que fallaron se reintentan.
+
+    python lote_preguntas.py preguntas.txt --modelo gemini-1.5-flash --salida respuestas.jsonl
+
+La entrada es un archivo de texto (una pregunta por línea) o un JSONL con los campos
+`pregunta` y, opcionalmente, `id`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+
+from contexto import empaquetar_contexto, presupuesto_modelo
+from embeddings_cpu import EmbeddingsCPU, leer_config_embeddings
+from lexico import CANDIDATOS_POR_LISTA, fusionar_rrf
+from limites import LIMITES_PROVEEDOR, LimitadorTasa
+from rag import (MODEL_CONFIG, PROMPT_TEMPLATE, LLMNoDisponible, LLMSimulado, format_docs, get_llm,
+                 leer_api_key_google)
+from shards import buscar_lote, cargar_busqueda_lexica, cargar_indice_consultas
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RUTA_PROYECTO = Path(__file__).resolve().parent.parent
+RUTA_DB = RUTA_PROYECTO / "indice_faiss"
+INTENTOS = 3
+ESPERA_REINTENTO = 5.0  # segundos; se duplica en cada intento
+
+
+def leer_preguntas(ruta: Path) -> List[Dict[str, str]]:
+    """Lista de {"id", "pregunta"}; sin id explícito se usa el número de línea."""
+    preguntas = []
+    with open(ruta, encoding="utf-8") as f:
+        for numero, linea in enumerate(f, start=1):
+            linea = linea.strip()
+            if not linea:
+                continue
+            if ruta.suffix == ".jsonl":
+                datos = json.loads(linea)
+                preguntas.append({"id": str(datos.get("id", numero)), "pregunta": datos["pregunta"]})
+            else:
+                preguntas.append({"id": str(numero), "pregunta": linea})
+    return preguntas
+
+
+def leer_completadas(ruta_salida: Path) -> Set[str]:
+    """Ids ya respondidos en una ejecución anterior (las líneas con error se reintentan)."""
+    completadas = set()
+    if not ruta_salida.exists():
+        return completadas
+    with open(ruta_salida, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                datos = json.loads(linea)
+            except json.JSONDecodeError:
+                continue  # última línea a medio escribir si el proceso se cortó
+            if "respuesta" in datos:
+                completadas.add(datos["id"])
+    return completadas
+
+
+# --- Recuperación vectorizada ---
+
+def recuperar_contextos(preguntas: List[str], ruta_db: Path, k: int, hibrida: bool) -> List[List]:
+    config_embeddings = leer_config_embeddings(ruta_db)
+    embeddings = EmbeddingsCPU(config_embeddings["modelo"], config_embeddings["backend"])
+    db = cargar_indice_consultas(ruta_db, embeddings)
+    lexico = cargar_busqueda_lexica(ruta_db, db) if hibrida else None
+
+    inicio = time.perf_counter()
+    vectores = np.asarray(embeddings.embed_queries(preguntas), dtype=np.float32)
+    medio = time.perf_counter()
+    candidatos = k * CANDIDATOS_POR_LISTA if lexico is not None else k
+    resultados = [[doc for doc, _ in pares] for pares in buscar_lote(db, vectores, candidatos)]
+    if lexico is not None:
+        resultados = [fusionar_rrf([por_vector, [doc for doc, _ in lexico.buscar(pregunta, candidatos)]], k)
+                      for pregunta, por_vector in zip(preguntas, resultados)]
+    fin = time.perf_counter()
+    logging.info(f"{len(preguntas)} preguntas: embeddings en {medio - inicio:.2f}s, "
+                 f"búsqueda{' híbrida' if lexico is not None else ''} en {(fin - medio) * 1000:.1f} ms")
+    return resultados
+
+
+# --- Llamadas al LLM ---
+
+async def responder_todas(preguntas: List[Dict[str, str]], contextos: List[List], llm, modelo: str,
+                          ruta_salida: Path, por_minuto, concurrencia: int,
+                          presupuesto_contexto: Optional[int] = None) -> int:
+    """Responde en paralelo bajo los límites del proveedor; devuelve cuántas fallaron."""
+    cadena = PromptTemplate.from_template(PROMPT_TEMPLATE) | llm | StrOutputParser()
+    limitador = LimitadorTasa(por_minuto)
+    semaforo = asyncio.Semaphore(concurrencia)
+    fallidas = 0
+    hechas = 0
+
+    with open(ruta_salida, "a", encoding="utf-8") as salida:
+
+        def escribir(registro: Dict) -> None:
+            salida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            salida.flush()  # cada línea es un punto de control
+
+        async def responder(pregunta: Dict[str, str], docs: List) -> None:
+            nonlocal fallidas, hechas
+            fuentes = [{"fuente": Path(d.metadata.get("source", "")).name, "pagina": d.metadata.get("page")}
+                       for d in docs]
+            registro = {**pregunta, "modelo": modelo, "fuentes": fuentes}
+            if presupuesto_contexto:
+                docs, _ = empaquetar_contexto(docs, presupuesto_contexto)
+            entrada = {"context": format_docs(docs), "question": pregunta["pregunta"]}
+            async with semaforo:
+                for intento in range(INTENTOS):
+                    await limitador.esperar()
+                    inicio = time.perf_counter()
+                    try:
+                        registro["respuesta"] = await cadena.ainvoke(entrada)
+                        registro["llm_ms"] = (time.perf_counter() - inicio) * 1000
+                        break
+                    except Exception as e:  # cuota agotada, timeout, error de red...
+                        registro["error"] = str(e)
+                        if intento < INTENTOS - 1:
+                            await asyncio.sleep(ESPERA_REINTENTO * 2 ** intento)
+            if "respuesta" in registro:
+                registro.pop("error", None)
+            else:
+                fallidas += 1
+                logging.warning(f"Pregunta {pregunta['id']} sin respuesta: {registro['error']}")
+            escribir(registro)
+            hechas += 1
+            if hechas % 10 == 0 or hechas == len(preguntas):
+                logging.info(f"{hechas}/{len(preguntas)} preguntas respondidas")
+
+        await asyncio.gather(*(responder(p, docs) for p, docs in zip(preguntas, contextos)))
+    return fallidas
+
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Responde en lote un archivo de preguntas.")
+    parser.add_argument("entrada", type=Path, help="Archivo .txt (una pregunta por línea) o .jsonl.")
+    parser.add_argument("--salida", type=Path, help="JSONL de respuestas (por defecto <entrada>_respuestas.jsonl).")
+    parser.add_argument("--indice", type=Path, default=RUTA_DB, help="Directorio del índice FAISS.")
+    parser.add_argument("--modelo", choices=list(MODEL_CONFIG), default=next(iter(MODEL_CONFIG)))
+    parser.add_argument("--temperature", type=float, default=0.2)
+    parser.add_argument("--k", type=int, default=5, help="Documentos de contexto por pregunta.")
+    parser.add_argument("--solo-vectorial", action="store_true", help="Desactiva la fusión con BM25.")
+    parser.add_argument("--presupuesto-contexto", type=int,
+                        help="Tokens de contexto por pregunta (por defecto, el del modelo; 0 = sin empaquetar).")
+    parser.add_argument("--por-minuto", type=float, help="Peticiones por minuto (por defecto, el límite del proveedor).")
+    parser.add_argument("--concurrencia", type=int, help="Peticiones simultáneas (por defecto, el límite del proveedor).")
+    parser.add_argument("--llm-simulado", action="store_true", help="Usa el LLM simulado (pruebas sin red).")
+    return parser.parse_args()
+
+
+def main():
+    args = parsear_argumentos()
+    salida = args.salida or args.entrada.with_name(f"{args.entrada.stem}_respuestas.jsonl")
+    preguntas = leer_preguntas(args.entrada)
+    completadas = leer_completadas(salida)
+    pendientes = [p for p in preguntas if p["id"] not in completadas]
+    logging.info(f"{len(preguntas)} preguntas, {len(preguntas) - len(pendientes)} ya respondidas en {salida}")
+    if not pendientes:
+        return
+    if not args.indice.exists():
+        logging.error(f"No se encontró el índice en {args.indice}. Ejecuta primero: python procesar_docs.py")
+        return
+
+    proveedor = "simulado" if args.llm_simulado else MODEL_CONFIG[args.modelo]["provider"]
+    try:
+        llm = LLMSimulado() if args.llm_simulado else get_llm(args.modelo, args.temperature,
+                                                               google_api_key=leer_api_key_google())
+    except LLMNoDisponible as e:
+        logging.error(str(e))
+        return
+    limites = LIMITES_PROVEEDOR.get(proveedor, {})
+    por_minuto = args.por_minuto if args.por_minuto is not None else limites.get("por_minuto")
+    concurrencia = args.concurrencia or limites.get("concurrencia") or 1
+
+    contextos = recuperar_contextos([p["pregunta"] for p in pendientes], args.indice, args.k,
+                                    not args.solo_vectorial)
+    logging.info(f"Llamadas a '{args.modelo}' ({proveedor}): {concurrencia} simultáneas, "
+                 f"{f'{por_minuto:g} por minuto' if por_minuto else 'sin límite por minuto'}")
+    inicio = time.perf_counter()
+    presupuesto = (args.presupuesto_contexto if args.presupuesto_contexto is not None
+                   else presupuesto_modelo(args.modelo))
+    fallidas = asyncio.run(responder_todas(pendientes, contextos, llm, args.modelo, salida, por_minuto,
+                                           concurrencia, presupuesto))
+    logging.info(f"{len(pendientes) - fallidas} respuestas en {time.perf_counter() - inicio:.1f}s; "
+                 f"{fallidas} fallidas (se reintentan al relanzar). Resultados en: {salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Manifiesto de cada índice: qué versión de cada archivo contiene y con qué chunks.
+
+`manifiesto.sqlite` vive junto a `index.faiss` (en el índice único o en cada shard) y
+se publica con él, así que nunca describe otro estado del índice que el publicado:
+
+- `archivos`: ruta, SHA-256 del contenido, tamaño y mtime de cada archivo indexado;
+- `chunks`: id en el docstore de cada chunk y la ruta de la que salió.
+
+Un archivo se considera modificado sólo si cambia su hash (el tamaño y el mtime
+evitan leerlo cuando no han cambiado). Al actualizar, los chunks de las versiones
+anteriores se localizan por id en el manifiesto en lugar de recorrer el docstore.
+"""
+import logging
+import os
+import shutil
+import sqlite3
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from langchain_community.vectorstores import FAISS
+
+from cache_paginas import hash_archivo
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_MANIFIESTO = "manifiesto.sqlite"
+
+Huella = Dict[str, object]  # {"hash", "tamano", "mtime"}
+
+
+def huella_archivo(ruta, anterior: Optional[Huella] = None) -> Huella:
+    """Hash, tamaño y mtime del archivo; si tamaño y mtime coinciden con `anterior`, reutiliza su hash."""
+    estado = os.stat(ruta)
+    if anterior and anterior["tamano"] == estado.st_size and anterior["mtime"] == estado.st_mtime:
+        return dict(anterior)
+    return {"hash": hash_archivo(ruta), "tamano": estado.st_size, "mtime": estado.st_mtime}
+
+
+def ids_por_fuente(db: FAISS, ids: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+    """Ids de los chunks agrupados por el archivo del que salieron (todos, o sólo los de `ids`)."""
+    agrupados: Dict[str, List[str]] = defaultdict(list)
+    for id_doc in (db.index_to_docstore_id.values() if ids is None else ids):
+        fuente = getattr(db.docstore.search(id_doc), "metadata", {}).get("source")
+        if fuente is not None:
+            agrupados[str(fuente)].append(id_doc)
+    return dict(agrupados)
+
+
+class Manifiesto:
+    """Acceso al `manifiesto.sqlite` de un directorio de índice."""
+
+    def __init__(self, directorio: Path):
+        self.ruta = Path(directorio) / ARCHIVO_MANIFIESTO
+        self.conn = sqlite3.connect(str(self.ruta))
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS archivos (
+                ruta TEXT PRIMARY KEY, hash TEXT NOT NULL, tamano INTEGER NOT NULL, mtime REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, ruta TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_chunks_ruta ON chunks (ruta);
+        """)
+
+    def archivos(self) -> Dict[str, Huella]:
+        return {ruta: {"hash": h, "tamano": tamano, "mtime": mtime}
+                for ruta, h, tamano, mtime in self.conn.execute("SELECT ruta, hash, tamano, mtime FROM archivos")}
+
+    def ids_de(self, rutas: Iterable[str]) -> List[str]:
+        """Ids de los chunks de los archivos dados."""
+        rutas = list(rutas)
+        ids = []
+        for inicio in range(0, len(rutas), 900):  # límite de parámetros de SQLite
+            lote = rutas[inicio:inicio + 900]
+            ids += [i for (i,) in self.conn.execute(
+                f"SELECT id FROM chunks WHERE ruta IN ({','.join('?' * len(lote))})", lote)]
+        return ids
+
+    def ids_por_ruta(self) -> Dict[str, List[str]]:
+        agrupados: Dict[str, List[str]] = defaultdict(list)
+        for id_doc, ruta in self.conn.execute("SELECT id, ruta FROM chunks"):
+            agrupados[ruta].append(id_doc)
+        return dict(agrupados)
+
+    def actualizar(self, huellas: Mapping[str, Huella], ids_nuevos: Mapping[str, List[str]],
+                   quitados: Iterable[str] = ()) -> None:
+        """
+        En una sola transacción: olvida los archivos quitados y la versión anterior de
+        los de `huellas`, y registra la nueva versión de éstos con sus chunks.
+        """
+        rutas = list(huellas) + list(quitados)
+        with self.conn:
+            self.conn.executemany("DELETE FROM chunks WHERE ruta = ?", [(r,) for r in rutas])
+            self.conn.executemany("DELETE FROM archivos WHERE ruta = ?", [(r,) for r in rutas])
+            self.conn.executemany("INSERT INTO archivos VALUES (?, ?, ?, ?)",
+                                  [(r, h["hash"], h["tamano"], h["mtime"]) for r, h in huellas.items()])
+            self.conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?)",
+                                  [(i, r) for r, ids in ids_nuevos.items() for i in ids])
+
+    def cerrar(self) -> None:
+        self.conn.close()
+
+
+def leer_manifiesto(directorio: Path) -> Optional[Dict[str, Huella]]:
+    """Archivos registrados en el manifiesto del índice; None si el índice no tiene (índices anteriores)."""
+    if not (Path(directorio) / ARCHIVO_MANIFIESTO).exists():
+        return None
+    manifiesto = Manifiesto(directorio)
+    try:
+        return manifiesto.archivos()
+    finally:
+        manifiesto.cerrar()
+
+
+def escribir_manifiesto(destino: Path, huellas: Mapping[str, Huella], ids_nuevos: Mapping[str, List[str]],
+                        quitados: Iterable[str] = (), origen: Optional[Path] = None) -> None:
+    """
+    Escribe el manifiesto de `destino` partiendo del de `origen` (el índice publicado,
+    si tiene) y aplicándole los cambios; sin `origen` se crea desde cero.
+    """
+    ruta = Path(destino) / ARCHIVO_MANIFIESTO
+    ruta.unlink(missing_ok=True)
+    if origen is not None and (Path(origen) / ARCHIVO_MANIFIESTO).exists():
+        shutil.copyfile(Path(origen) / ARCHIVO_MANIFIESTO, ruta)
+    manifiesto = Manifiesto(destino)
+    try:
+        manifiesto.actualizar(huellas, ids_nuevos, quitados)
+    finally:
+        manifiesto.cerrar()
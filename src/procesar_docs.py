@@ -1,69 +1,219 @@
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-import os
+import argparse
+import shutil
+import time
 from pathlib import Path
 import logging
+from itertools import islice
+
+from almacen import guardar_base
+from cache_embeddings import CacheEmbeddings, EmbeddingsCacheados, MAX_ENTRADAS
+from cache_paginas import directorio_cache, registrar_estadisticas
+from cargadores import agregar_argumentos_carga, listar_documentos
+from embeddings_cpu import (MODELO_EMBEDDINGS, EmbeddingsCPU, agregar_argumentos_embeddings,
+                            embeddings_desde_argumentos, guardar_config_embeddings, nombre_en_cache,
+                            validar_contra_referencia)
+from generaciones import leer_generacion, registrar_generacion
+from indices import agregar_argumentos_indice, config_desde_argumentos, guardar_config_indice
+from ingesta import (TAM_LOTE, construir_base_vectorial, crear_splitter, indexar_en_streaming, iterar_chunks,
+                     procesar_archivos)
+from manifiesto import escribir_manifiesto, huella_archivo, ids_por_fuente
+from shards import (PARTICIONES, agrupar_por_shard, guardar_config_shards, limpiar_indice_unico, listar_shards,
+                    publicar_directorio, ruta_shard, ruta_temporal_shard)
 
 
 # --- Configuración ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def cargar_documentos(directorio_docs):
-    """Carga todos los PDFs del directorio especificado."""
-    documentos = []
-    for archivo in os.listdir(directorio_docs):
-        if archivo.endswith('.pdf'):
-            ruta_completa = os.path.join(directorio_docs, archivo)
-            loader = PyPDFLoader(ruta_completa)
-            logging.info(f"Cargando documento: {archivo}")
-            documentos.extend(loader.load())
-    return documentos
+def listar_pdfs(directorio_docs, recursivo=False):
+    """
+    Devuelve las rutas de los documentos del directorio especificado (y sus subcarpetas si recursivo):
+    PDFs y los demás tipos con cargador registrado en `cargadores.py` (.txt, .md).
+    """
+    return listar_documentos(directorio_docs, recursivo)
+
+def cargar_documentos(directorio_docs, workers=1, dir_cache_paginas=None):
+    """
+    Carga todos los PDFs del directorio especificado (en paralelo si workers > 1).
+    Con dir_cache_paginas, el texto ya extraído se lee de la caché de páginas.
+    """
+    return procesar_archivos(listar_pdfs(directorio_docs), workers=workers, dividir=False,
+                             dir_cache_paginas=dir_cache_paginas)
 
 def dividir_texto(documentos):
     """Divide los documentos en chunks más pequeños."""
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    return splitter.split_documents(documentos)
-
-def crear_base_vectorial(chunks):
-    """Crea una base de datos vectorial con los chunks de texto."""
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    db = FAISS.from_documents(chunks, embeddings)
-    return db
+    return crear_splitter().split_documents(documentos)
+
+def crear_embeddings(dir_cache=None, max_entradas_cache=MAX_ENTRADAS, base=None):
+    """
+    Crea el modelo de embeddings (por defecto PyTorch float32, o el backend dado en `base`).
+    Si se indica dir_cache, sólo se calculan los embeddings de chunks que no estén en la caché.
+    """
+    embeddings = base or EmbeddingsCPU(MODELO_EMBEDDINGS)
+    if dir_cache is None:
+        return embeddings
+    nombre = nombre_en_cache(embeddings.modelo, embeddings.backend)
+    return EmbeddingsCacheados(embeddings, CacheEmbeddings(dir_cache, nombre, max_entradas_cache))
+
+def cerrar_embeddings(embeddings):
+    """Registra el rendimiento y las estadísticas de la caché de embeddings (si la hay) y la cierra."""
+    if isinstance(embeddings, EmbeddingsCacheados):
+        embeddings.registrar_estadisticas()
+        embeddings.cache.cerrar()
+        embeddings = embeddings.base
+    if isinstance(embeddings, EmbeddingsCPU):
+        embeddings.registrar_estadisticas()
+
+def crear_base_vectorial(chunks, embeddings=None, config_indice=None):
+    """Crea una base de datos vectorial con los chunks de texto (índice Flat por defecto)."""
+    if embeddings is None:
+        embeddings = crear_embeddings()
+    return construir_base_vectorial(chunks, embeddings, config_indice)
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Construye el índice FAISS a partir de los PDFs de 'documentos/'.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos para cargar y dividir los PDFs (1 = en serie, 0 = todos los núcleos).")
+    parser.add_argument("--cache-max-entradas", type=int, default=MAX_ENTRADAS,
+                        help="Tamaño máximo de la caché de embeddings en vectores (0 = sin caché).")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Cargar, dividir, calcular embeddings e indexar por lotes con memoria acotada.")
+    parser.add_argument("--tam-lote", type=int, default=TAM_LOTE,
+                        help="Chunks por lote en el modo --streaming.")
+    agregar_argumentos_indice(parser)
+    agregar_argumentos_embeddings(parser)
+    agregar_argumentos_carga(parser)
+    parser.add_argument("--shards", choices=PARTICIONES,
+                        help="Fragmentar el índice por subcarpeta de 'documentos/' o por hash del nombre de archivo.")
+    parser.add_argument("--num-shards", type=int, default=4, help="Número de shards con --shards hash.")
+    parser.add_argument("--shard", help="Reconstruir sólo este shard, sin tocar los demás.")
+    return parser.parse_args()
+
+def construir_indice(rutas, embeddings, config_indice, args, fallidos=None):
+    """
+    Carga, divide e indexa una lista de PDFs según el modo elegido (normal o streaming).
+    Las rutas que no se pudieron cargar se añaden a `fallidos` (si se da).
+    """
+    if args.streaming:
+        # Pipeline por lotes: nunca se tiene el corpus completo en memoria
+        logging.info(f"Procesando documentos en streaming (lotes de {args.tam_lote} chunks)...")
+        return indexar_en_streaming(rutas, embeddings, workers=args.workers,
+                                    tam_lote=args.tam_lote, config=config_indice, motor_pdf=args.motor_pdf,
+                                    dir_cache_paginas=directorio_cache(args), fallidos=fallidos)
+
+    # Cargar y dividir en chunks (cada worker procesa archivos completos)
+    logging.info("Cargando y dividiendo documentos...")
+    chunks = procesar_archivos(rutas, workers=args.workers, motor_pdf=args.motor_pdf,
+                               dir_cache_paginas=directorio_cache(args), fallidos=fallidos)
+    if not chunks:
+        return None
+
+    # Crear la base vectorial
+    logging.info(f"Creando base de datos vectorial con {len(chunks)} chunks...")
+    return crear_base_vectorial(chunks, embeddings, config_indice)
+
+def huellas_cargadas(huellas, fallidos):
+    """
+    Huellas de los archivos que sí se cargaron. Los fallidos quedan fuera del manifiesto, así que
+    procesar_docs2.py los trata como nuevos y los reintenta (quitando lo que hubieran llegado a añadir).
+    """
+    if fallidos:
+        logging.warning(f"{len(fallidos)} archivos no se pudieron cargar; se reintentarán con procesar_docs2.py.")
+    return {ruta: huella for ruta, huella in huellas.items() if ruta not in fallidos}
+
+def construir_shards(dir_docs, ruta_db_local, embeddings, config_indice, args):
+    """Construye y publica cada shard por separado; con --shard sólo el indicado."""
+    grupos = agrupar_por_shard(listar_pdfs(dir_docs, recursivo=True), dir_docs, args.shards, args.num_shards)
+    if args.shard:
+        if args.shard not in grupos:
+            logging.error(f"El shard '{args.shard}' no existe. Shards disponibles: {', '.join(sorted(grupos))}")
+            return
+        grupos = {args.shard: grupos[args.shard]}
+
+    for nombre, rutas in grupos.items():
+        logging.info(f"📦 Shard '{nombre}': {len(rutas)} archivos")
+        huellas = {ruta: huella_archivo(ruta) for ruta in rutas}  # antes de leerlos: un cambio posterior se detecta
+        fallidos = []
+        db = construir_indice(rutas, embeddings, config_indice, args, fallidos)
+        if db is None:
+            logging.warning(f"El shard '{nombre}' no tiene contenido; se omite.")
+            continue
+        temporal = ruta_temporal_shard(ruta_db_local, nombre)
+        if temporal.exists():
+            shutil.rmtree(temporal)
+        guardar_base(db, temporal)
+        guardar_config_indice(temporal, config_indice)
+        escribir_manifiesto(temporal, huellas_cargadas(huellas, fallidos), ids_por_fuente(db))
+        publicar_directorio(temporal, ruta_shard(ruta_db_local, nombre))
+
+    if not args.shard:
+        # Reconstrucción completa: quitar shards de carpetas que ya no existen y el índice único anterior
+        for directorio in listar_shards(ruta_db_local):
+            if directorio.name not in grupos:
+                logging.info(f"Eliminando shard obsoleto: {directorio.name}")
+                shutil.rmtree(directorio)
+        limpiar_indice_unico(ruta_db_local)
+    guardar_config_shards(ruta_db_local, args.shards, args.num_shards)
 
 def main():
+    args = parsear_argumentos()
+    inicio = time.time()
     # Usar pathlib para un manejo de rutas más robusto y legible
     ruta_proyecto = Path(__file__).resolve().parent.parent
     dir_docs = ruta_proyecto / "documentos"
     ruta_db_local = ruta_proyecto / "indice_faiss"
+    dir_cache = ruta_proyecto / "cache_embeddings" if args.cache_max_entradas > 0 else None
     
     logging.info(f"Buscando documentos en: {dir_docs}")
 
-    if not dir_docs.exists() or not any(dir_docs.glob("*.pdf")):
-        logging.error(f"La carpeta '{dir_docs}' no existe o no contiene archivos PDF.")
+    if not dir_docs.exists() or not listar_pdfs(dir_docs, recursivo=bool(args.shards)):
+        logging.error(f"La carpeta '{dir_docs}' no existe o no contiene documentos (PDF, .txt o .md).")
         logging.info("Por favor, crea la carpeta 'documentos' en la raíz del proyecto y añade tus archivos PDF.")
         return
     
-    # Cargar documentos
-    logging.info("Cargando documentos...")
-    docs = cargar_documentos(dir_docs)
-    if not docs:
+    base_embeddings = embeddings_desde_argumentos(args)
+    if args.validar_embeddings > 0 and args.backend_embeddings != "torch":
+        # Comparar con PyTorch float32 sobre los primeros chunks reales antes de indexar
+        rutas = listar_pdfs(dir_docs, recursivo=bool(args.shards))
+        chunks = iterar_chunks(rutas, motor_pdf=args.motor_pdf, dir_cache_paginas=directorio_cache(args))
+        muestra = [doc.page_content for doc in islice(chunks, args.validar_embeddings)]
+        if not validar_contra_referencia(base_embeddings, muestra)["valido"]:
+            logging.error("El backend de embeddings no supera la validación; usa otro o '--backend-embeddings torch'.")
+            return
+    embeddings = crear_embeddings(dir_cache, args.cache_max_entradas, base_embeddings)
+    config_indice = config_desde_argumentos(args)
+
+    if args.shards:
+        construir_shards(dir_docs, ruta_db_local, embeddings, config_indice, args)
+        guardar_config_embeddings(ruta_db_local, base_embeddings)
+        registrar_generacion(ruta_db_local)
+        cerrar_embeddings(embeddings)
+        registrar_estadisticas(directorio_cache(args), inicio)
+        logging.info(f"¡Proceso completado! Shards guardados en: {ruta_db_local / 'shards'}")
+        return
+
+    rutas = listar_pdfs(dir_docs)
+    huellas = {ruta: huella_archivo(ruta) for ruta in rutas}  # antes de leerlos: un cambio posterior se detecta
+    fallidos = []
+    db = construir_indice(rutas, embeddings, config_indice, args, fallidos)
+    cerrar_embeddings(embeddings)
+    registrar_estadisticas(directorio_cache(args), inicio)
+
+    if db is None:
         logging.warning("No se pudo cargar ningún contenido de los archivos PDF.")
         return
-    
-    # Dividir en chunks
-    logging.info(f"Dividiendo {len(docs)} páginas en chunks...")
-    chunks = dividir_texto(docs)
-    
-    # Crear y guardar la base vectorial
-    logging.info(f"Creando base de datos vectorial con {len(chunks)} chunks...")
-    db = crear_base_vectorial(chunks)
-    db.save_local(str(ruta_db_local))
+    # Se construye aparte y se publica con renombrados: la aplicación en marcha tiene mapeado el
+    # index.faiss publicado, y reescribirlo en su sitio le cambiaría lo que lee a media consulta
+    dir_temp = ruta_proyecto / "indice_faiss_temp"
+    if dir_temp.exists():
+        shutil.rmtree(dir_temp)
+    guardar_base(db, dir_temp)
+    guardar_config_indice(dir_temp, config_indice)
+    guardar_config_embeddings(dir_temp, base_embeddings)
+    escribir_manifiesto(dir_temp, huellas_cargadas(huellas, fallidos), ids_por_fuente(db))
+    # Un índice único reemplaza también a los shards de una construcción anterior
+    generacion_anterior = leer_generacion(ruta_db_local)
+    publicar_directorio(dir_temp, ruta_db_local)
+    registrar_generacion(ruta_db_local, generacion_anterior)
     
     logging.info(f"¡Proceso completado! Base de datos guardada en: {ruta_db_local}")
 
@@ -1,14 +1,29 @@
 # procesar_docs_mejorado.py
 
-import os
-import json
 import logging
+import time
+import argparse
 from pathlib import Path
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 import shutil
+from itertools import islice
+
+import faiss
+
+from almacen import cargar_base_editable, guardar_base
+from cache_embeddings import CacheEmbeddings, EmbeddingsCacheados, MAX_ENTRADAS
+from cache_paginas import directorio_cache, registrar_estadisticas
+from cargadores import MOTOR_PDF, agregar_argumentos_carga, listar_documentos
+from embeddings_cpu import (EmbeddingsCPU, agregar_argumentos_embeddings, guardar_config_embeddings,
+                            leer_config_embeddings, nombre_en_cache, validar_contra_referencia)
+from generaciones import leer_generacion, registrar_generacion
+from indices import (agregar_argumentos_indice, config_desde_argumentos, guardar_config_indice,
+                     leer_config_indice, reportar_indice)
+from ingesta import (TAM_LOTE, construir_base_vectorial, crear_base_vacia, indexar_en_streaming, iterar_chunks,
+                     pico_memoria_mb, procesar_archivos, quitar_chunks, reconstruir_base)
+from manifiesto import (ARCHIVO_MANIFIESTO, Manifiesto, escribir_manifiesto, huella_archivo, ids_por_fuente,
+                        leer_manifiesto)
+from shards import (agrupar_por_shard, leer_config_shards, listar_shards, publicar_directorio, ruta_shard,
+                    ruta_temporal_shard)
 
 # --- Configuración Centralizada ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,123 +33,392 @@ RUTA_PROYECTO = Path(__file__).resolve().parent.parent
 DIR_DOCS = RUTA_PROYECTO / "documentos"
 DIR_DB_FAISS = RUTA_PROYECTO / "indice_faiss"
 DIR_DB_TEMP = RUTA_PROYECTO / "indice_faiss_temp"
-ARCHIVO_REGISTRO = RUTA_PROYECTO / "processed_files.json"
+DIR_CACHE_EMBEDDINGS = RUTA_PROYECTO / "cache_embeddings"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
 # --- Funciones de Ayuda ---
 
+
+def directorios_indice():
+    """Directorios con un índice publicado: cada shard o el índice único."""
+    if leer_config_shards(DIR_DB_FAISS) is not None:
+        return listar_shards(DIR_DB_FAISS)
+    return [DIR_DB_FAISS] if DIR_DB_FAISS.exists() else []
+
+
 def cargar_registro_archivos():
-    """Carga el registro de archivos procesados desde un JSON."""
-    if not ARCHIVO_REGISTRO.exists():
-        return {}
-    with open(ARCHIVO_REGISTRO, 'r') as f:
-        return json.load(f)
-
-def guardar_registro_archivos(registro):
-    """Guarda el registro actualizado de archivos procesados."""
-    with open(ARCHIVO_REGISTRO, 'w') as f:
-        json.dump(registro, f, indent=4)
-
-def obtener_archivos_a_procesar(registro):
-    """Determina qué archivos son nuevos o han sido modificados."""
+    """
+    Archivos indexados y su huella (hash, tamaño y mtime), leídos de los manifiestos
+    del índice publicado. Un índice sin manifiesto no aporta archivos, así que todos
+    sus documentos se vuelven a indexar una vez.
+    """
+    registro = {}
+    for directorio in directorios_indice():
+        archivos = leer_manifiesto(directorio)
+        if archivos is None:
+            logging.warning(f"El índice {directorio} no tiene manifiesto; se reindexarán sus documentos.")
+            continue
+        registro.update(archivos)
+    return registro
+
+
+def obtener_archivos_a_procesar(registro, recursivo=False):
+    """
+    Determina qué archivos son nuevos o han cambiado de contenido (también en subcarpetas si recursivo)
+    y guarda su huella nueva en el registro. Un archivo con otro mtime pero el mismo hash no se reprocesa.
+    """
     archivos_nuevos = []
     if not DIR_DOCS.exists():
         logging.error(f"El directorio de documentos '{DIR_DOCS}' no existe.")
         return []
-        
-    for archivo_pdf in DIR_DOCS.glob("*.pdf"):
-        nombre_archivo = str(archivo_pdf)
-        ultima_modificacion = os.path.getmtime(nombre_archivo)
-        
-        if nombre_archivo not in registro or registro[nombre_archivo] < ultima_modificacion:
+
+    for nombre_archivo in listar_documentos(DIR_DOCS, recursivo):
+        anterior = registro.get(nombre_archivo)
+        huella = huella_archivo(nombre_archivo, anterior)
+
+        if anterior is None or anterior["hash"] != huella["hash"]:
             archivos_nuevos.append(nombre_archivo)
-            registro[nombre_archivo] = ultima_modificacion
-            
+        registro[nombre_archivo] = huella
+
     return archivos_nuevos
 
-def procesar_lote_documentos(rutas_archivos):
-    """Carga y divide en chunks un lote de documentos PDF."""
-    documentos = []
-    for ruta in rutas_archivos:
-        try:
-            loader = PyPDFLoader(ruta)
-            documentos.extend(loader.load())
-            logging.info(f"Cargado: {Path(ruta).name}")
-        except Exception as e:
-            logging.error(f"Error cargando el archivo {ruta}: {e}")
-            continue # Salta al siguiente archivo si uno falla
-    
-    if not documentos:
-        return []
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    return splitter.split_documents(documentos)
+def obtener_archivos_eliminados(registro):
+    """Archivos registrados que ya no existen; se quitan del registro."""
+    eliminados = [nombre for nombre in registro if not Path(nombre).exists()]
+    for nombre in eliminados:
+        del registro[nombre]
+    return eliminados
+
+
+def procesar_lote_documentos(rutas_archivos, workers=1, motor_pdf=MOTOR_PDF, dir_cache_paginas=None, fallidos=None):
+    """
+    Carga y divide en chunks un lote de documentos (PDF, .txt o .md).
+    Con workers > 1 cada archivo se procesa en un proceso distinto; si uno falla, se salta
+    y su ruta se añade a `fallidos` (si se da).
+    """
+    return procesar_archivos(rutas_archivos, workers=workers, motor_pdf=motor_pdf,
+                             dir_cache_paginas=dir_cache_paginas, fallidos=fallidos)
+
+
+def crear_parser(descripcion="Actualiza de forma incremental el índice FAISS."):
+    parser = argparse.ArgumentParser(description=descripcion)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos para cargar y dividir los PDFs (1 = en serie, 0 = todos los núcleos).")
+    parser.add_argument("--cache-max-entradas", type=int, default=MAX_ENTRADAS,
+                        help="Tamaño máximo de la caché de embeddings en vectores (0 = sin caché).")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Cargar, dividir, calcular embeddings e indexar por lotes con memoria acotada.")
+    parser.add_argument("--tam-lote", type=int, default=TAM_LOTE,
+                        help="Chunks por lote en el modo --streaming.")
+    parser.add_argument("--reportar-indice", action="store_true",
+                        help="Medir tamaño, latencia y recall@10 del índice tras cada actualización.")
+    agregar_argumentos_indice(parser)
+    agregar_argumentos_embeddings(parser)
+    agregar_argumentos_carga(parser)
+    return parser
+
+
+def parsear_argumentos():
+    parser = crear_parser()
+    parser.add_argument("--compactar", action="store_true",
+                        help="Purgar los chunks que el manifiesto no reconoce y reconstruir el índice, sin indexar.")
+    return parser.parse_args()
+
+
+def crear_embeddings(args):
+    """
+    Modelo de embeddings para actualizar el índice (y su caché, si está activada).
+    Devuelve (modelo base, embeddings a usar).
+    """
+    # Los vectores nuevos deben salir del mismo backend que los del índice existente
+    backend = args.backend_embeddings
+    if DIR_DB_FAISS.exists():
+        backend_indice = leer_config_embeddings(DIR_DB_FAISS)["backend"]
+        if backend_indice != backend:
+            logging.warning(f"El índice existente usa embeddings '{backend_indice}'; se mantiene ese backend.")
+            backend = backend_indice
+    base_embeddings = EmbeddingsCPU(EMBEDDING_MODEL, backend, args.tam_lote_embeddings, args.hilos)
+    embeddings = base_embeddings
+    if args.cache_max_entradas > 0:
+        # Los chunks ya vistos (p. ej. páginas sin cambios de un PDF modificado) no se recalculan
+        embeddings = EmbeddingsCacheados(
+            embeddings,
+            CacheEmbeddings(DIR_CACHE_EMBEDDINGS, nombre_en_cache(EMBEDDING_MODEL, backend), args.cache_max_entradas)
+        )
+    return base_embeddings, embeddings
+
+
+def actualizar_base(archivos_a_procesar, archivos_eliminados, base_embeddings, embeddings, args, huellas=None):
+    """
+    Aplica al índice (o a los shards afectados) los archivos nuevos, modificados y eliminados.
+    `huellas` (el registro) da el hash de cada archivo tomado al detectar el cambio.
+    Cada índice se actualiza aunque falle otro: los que fallan no se modifican y, como sus
+    archivos no entran en su manifiesto, se reintentan en la siguiente ejecución.
+    Devuelve False si falló algún índice.
+    """
+    config_shards = leer_config_shards(DIR_DB_FAISS)
+    generacion_anterior = leer_generacion(DIR_DB_FAISS)  # el índice único se reemplaza con su manifiesto
+    # Con shards sólo se reescriben los shards que reciben archivos nuevos, modificados o eliminados
+    if config_shards is not None:
+        grupos = agrupar_por_shard(archivos_a_procesar, DIR_DOCS, config_shards["particion"],
+                                   config_shards["num_shards"])
+        grupos_eliminados = agrupar_por_shard(archivos_eliminados, DIR_DOCS, config_shards["particion"],
+                                              config_shards["num_shards"])
+        objetivos = [(ruta_shard(DIR_DB_FAISS, nombre), ruta_temporal_shard(DIR_DB_FAISS, nombre),
+                      grupos.get(nombre, []), grupos_eliminados.get(nombre, []))
+                     for nombre in {**grupos, **grupos_eliminados}]
+    else:
+        objetivos = [(DIR_DB_FAISS, DIR_DB_TEMP, archivos_a_procesar, archivos_eliminados)]
+
+    resultados = [actualizar_indice(destino, temporal, rutas, embeddings, args, eliminados, huellas)
+                  for destino, temporal, rutas, eliminados in objetivos]
+    if any(resultados) and DIR_DB_FAISS.exists():
+        guardar_config_embeddings(DIR_DB_FAISS, base_embeddings)
+        # Avisa a la aplicación en marcha de que hay un índice nuevo que cargar
+        registrar_generacion(DIR_DB_FAISS, generacion_anterior)
+    return all(resultados)
 
 # --- Flujo Principal ---
 
+
 def main():
     """
     Flujo principal para procesar documentos de forma robusta e incremental.
     """
+    args = parsear_argumentos()
+    inicio = time.time()
     logging.info("🚀 Iniciando proceso de actualización de la base de datos vectorial.")
-    
+
+    if args.compactar:
+        base_embeddings, embeddings = crear_embeddings(args)
+        if compactar(base_embeddings, embeddings):
+            logging.info(f"🎉 ¡Compactación completada! Base de datos guardada en: {DIR_DB_FAISS}")
+        if isinstance(embeddings, EmbeddingsCacheados):
+            embeddings.cache.cerrar()
+        return
+
+    config_shards = leer_config_shards(DIR_DB_FAISS)
     registro_archivos = cargar_registro_archivos()
-    archivos_a_procesar = obtener_archivos_a_procesar(registro_archivos)
-    
-    if not archivos_a_procesar and DIR_DB_FAISS.exists():
+    archivos_a_procesar = obtener_archivos_a_procesar(registro_archivos, recursivo=config_shards is not None)
+    archivos_eliminados = obtener_archivos_eliminados(registro_archivos)
+
+    if not archivos_a_procesar and not archivos_eliminados and DIR_DB_FAISS.exists():
         logging.info("✅ No hay documentos nuevos o modificados. La base de datos está actualizada.")
         return
 
+    logging.info(f"Se encontraron {len(archivos_a_procesar)} archivos para procesar"
+                 f" y {len(archivos_eliminados)} eliminados.")
+    base_embeddings, embeddings = crear_embeddings(args)
+    if args.validar_embeddings > 0 and base_embeddings.backend != "torch":
+        chunks = iterar_chunks(archivos_a_procesar, motor_pdf=args.motor_pdf,
+                               dir_cache_paginas=directorio_cache(args))
+        muestra = [doc.page_content for doc in islice(chunks, args.validar_embeddings)]
+        if not validar_contra_referencia(base_embeddings, muestra)["valido"]:
+            logging.error("El backend de embeddings no supera la validación. La base de datos no se modificó.")
+            return
+
+    exito = actualizar_base(archivos_a_procesar, archivos_eliminados, base_embeddings, embeddings, args,
+                            registro_archivos)
+
+    if isinstance(embeddings, EmbeddingsCacheados):
+        embeddings.registrar_estadisticas()
+        embeddings.cache.cerrar()
+    base_embeddings.registrar_estadisticas()
+    registrar_estadisticas(directorio_cache(args), inicio)
+
+    if exito:
+        # El registro de archivos procesados viaja en el manifiesto publicado con cada índice
+        logging.info(f"🎉 ¡Proceso completado! Base de datos guardada en: {DIR_DB_FAISS}")
+
+
+def ids_versiones_anteriores(dir_destino, rutas, ids_anteriores):
+    """
+    Ids de los chunks que el índice publicado tiene de las rutas, localizados en su manifiesto.
+    Un índice sin manifiesto (anterior a él) se vacía: sus documentos se están reindexando todos.
+    """
+    if not (dir_destino / ARCHIVO_MANIFIESTO).exists():
+        logging.warning(f"{dir_destino} no tiene manifiesto: se quitan sus {len(ids_anteriores)} chunks "
+                        "y se reindexan sus documentos.")
+        return list(ids_anteriores)
+    manifiesto = Manifiesto(dir_destino)
     try:
-        # Paso 1: Cargar y procesar los documentos nuevos/modificados
-        logging.info(f"Se encontraron {len(archivos_a_procesar)} archivos para procesar.")
-        chunks_nuevos = procesar_lote_documentos(archivos_a_procesar)
-        
-        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-        
+        return manifiesto.ids_de(rutas)
+    finally:
+        manifiesto.cerrar()
+
+
+def actualizar_indice(dir_destino, dir_temp, archivos_a_procesar, embeddings, args, archivos_eliminados=(),
+                      huellas=None):
+    """
+    Añade los archivos a un índice (el único o un shard) y lo publica de forma atómica junto con su manifiesto.
+    Se quitan los chunks de la versión anterior de los archivos modificados y los de los eliminados.
+    Un archivo que no se puede cargar conserva sus chunks y su entrada anteriores en el manifiesto,
+    así que se reintenta en la siguiente ejecución. Un índice que se queda sin documentos se publica vacío.
+    Devuelve False si hubo un error; en ese caso el índice original no se modifica.
+    """
+    huellas = huellas or {}
+    fallidos = []
+    try:
+        # Un índice existente conserva su tipo; el pedido sólo se aplica al crear uno nuevo
+        config_indice = leer_config_indice(dir_destino) if dir_destino.exists() else config_desde_argumentos(args)
+        if config_indice.tipo != args.indice:
+            logging.warning(f"El índice existente es {config_indice.tipo}; para cambiarlo a {args.indice} "
+                            "reconstrúyelo con procesar_docs.py.")
+
         # Eliminar el directorio temporal si existe de una ejecución anterior fallida
-        if DIR_DB_TEMP.exists():
-            shutil.rmtree(DIR_DB_TEMP)
+        if dir_temp.exists():
+            shutil.rmtree(dir_temp)
 
-        # Paso 2: Cargar la base de datos existente o crear una nueva
-        if DIR_DB_FAISS.exists() and chunks_nuevos:
+        db_final, ids_anteriores, dimension = None, set(), None
+        if dir_destino.exists():
             logging.info("Cargando base de datos existente para fusionar...")
-            db_existente = FAISS.load_local(str(DIR_DB_FAISS), embeddings, allow_dangerous_deserialization=True)
-            db_existente.add_documents(chunks_nuevos)
-            db_final = db_existente
-        elif chunks_nuevos:
-            logging.info("Creando una nueva base de datos vectorial...")
-            db_final = FAISS.from_documents(chunks_nuevos, embeddings)
+            db_final = cargar_base_editable(dir_destino, embeddings)
+            ids_anteriores = set(db_final.index_to_docstore_id.values())
+            dimension = db_final.index.d
+            if not db_final.index.ntotal:
+                db_final = None  # índice publicado vacío: los documentos nuevos crean uno del tipo configurado
+        if args.streaming:
+            # Pasos 1 y 2 en un solo pipeline por lotes sobre la base existente (si la hay)
+            logging.info(f"Procesando documentos en streaming (lotes de {args.tam_lote} chunks)...")
+            db_final = indexar_en_streaming(archivos_a_procesar, embeddings, db=db_final,
+                                            workers=args.workers, tam_lote=args.tam_lote, config=config_indice,
+                                            motor_pdf=args.motor_pdf, dir_cache_paginas=directorio_cache(args),
+                                            fallidos=fallidos, reportar=args.reportar_indice)
         else:
-            logging.info("No hay chunks para procesar. Finalizando.")
-            return
+            # Paso 1: Cargar y procesar los documentos nuevos/modificados
+            chunks_nuevos = procesar_lote_documentos(archivos_a_procesar, workers=args.workers,
+                                                     motor_pdf=args.motor_pdf,
+                                                     dir_cache_paginas=directorio_cache(args), fallidos=fallidos)
+
+            # Paso 2: Añadir los chunks nuevos a la base existente (o crear una)
+            if chunks_nuevos and db_final is not None:
+                db_final.add_documents(chunks_nuevos)
+                if args.reportar_indice:
+                    reportar_indice(db_final.index)
+                    logging.info(f"Pico de memoria tras el reporte del índice: {pico_memoria_mb():.0f} MB")
+            elif chunks_nuevos:
+                logging.info("Creando una nueva base de datos vectorial...")
+                db_final = construir_base_vectorial(chunks_nuevos, embeddings, config_indice,
+                                                    reportar=args.reportar_indice)
+
+        # Quitar las versiones anteriores de los archivos cargados y de los eliminados, y lo que un
+        # archivo fallido llegó a añadir en streaming; los archivos fallidos conservan sus chunks
+        if fallidos:
+            logging.warning(f"{len(fallidos)} archivos no se pudieron cargar; conservan su versión anterior "
+                            "en el índice y se reintentarán.")
+        cargados = [ruta for ruta in archivos_a_procesar if ruta not in fallidos]
+        ids_a_quitar = ids_versiones_anteriores(dir_destino, cargados + list(archivos_eliminados),
+                                                ids_anteriores) if ids_anteriores else []
+        if fallidos and db_final is not None:
+            ids_nuevos = [i for i in db_final.index_to_docstore_id.values() if i not in ids_anteriores]
+            ids_a_quitar += [i for ruta, ids in ids_por_fuente(db_final, ids_nuevos).items()
+                             if ruta in fallidos for i in ids]
+        if db_final is not None:
+            db_final = quitar_chunks(db_final, ids_a_quitar, config_indice)
+
+        if db_final is None:
+            if dimension is None:
+                logging.info("No hay chunks para procesar. Finalizando.")
+                return True
+            # Se publica un índice vacío (con su manifiesto y una generación nueva) en lugar de borrar el
+            # directorio, para que la aplicación en marcha y el modo vigilancia vean la purga
+            logging.warning(f"{dir_destino} se queda sin documentos; se publica vacío.")
+            db_final = crear_base_vacia(embeddings, faiss.IndexFlatL2(dimension))
+
+        # Paso 3: Guardar en un directorio temporal (Principio de Atomicidad), con el manifiesto actualizado
+        logging.info(f"Guardando índice actualizado en directorio temporal: {dir_temp}")
+        guardar_base(db_final, dir_temp)
+        guardar_config_indice(dir_temp, config_indice)
+        ids_nuevos = [i for i in db_final.index_to_docstore_id.values() if i not in ids_anteriores]
+        escribir_manifiesto(dir_temp, {ruta: huellas.get(ruta) or huella_archivo(ruta) for ruta in cargados},
+                            ids_por_fuente(db_final, ids_nuevos), archivos_eliminados, origen=dir_destino)
 
-        # Paso 3: Guardar en un directorio temporal (Principio de Atomicidad)
-        logging.info(f"Guardando índice actualizado en directorio temporal: {DIR_DB_TEMP}")
-        db_final.save_local(str(DIR_DB_TEMP))
-        
         # Paso 4: Reemplazo Atómico
-        # Si todo fue exitoso, eliminamos el directorio antiguo y renombramos el nuevo.
-        logging.info("Reemplazando la base de datos antigua con la nueva versión...")
-        if DIR_DB_FAISS.exists():
-            shutil.rmtree(DIR_DB_FAISS)
-        os.rename(DIR_DB_TEMP, DIR_DB_FAISS)
-        
-        # Paso 5: Actualizar el registro de archivos procesados
-        guardar_registro_archivos(registro_archivos)
-        
-        logging.info(f"🎉 ¡Proceso completado! Base de datos guardada en: {DIR_DB_FAISS}")
+        # Si todo fue exitoso, se reemplaza el directorio antiguo por el nuevo.
+        logging.info(f"Reemplazando {dir_destino} con la nueva versión...")
+        publicar_directorio(dir_temp, dir_destino)
+        return True
 
     except Exception as e:
         logging.error(f"❌ Ocurrió un error crítico durante el proceso: {e}")
         logging.info("La operación fue abortada. La base de datos original no ha sido modificada.")
         # Limpiar el directorio temporal en caso de error
-        if DIR_DB_TEMP.exists():
-            shutil.rmtree(DIR_DB_TEMP)
-            
+        if dir_temp.exists():
+            shutil.rmtree(dir_temp)
+        return False
+
+# --- Compactación ---
+
+
+def compactar_indice(dir_destino, dir_temp, embeddings):
+    """
+    Reescribe un índice (el único o un shard) sin los chunks que su manifiesto no reconoce
+    (p. ej. duplicados de versiones anteriores) ni los de archivos que ya no existen, y
+    reconstruye el índice FAISS con los vectores que quedan: los IVF se reentrenan y el
+    grafo HNSW se rehace. Los IVF-PQ, que no guardan los vectores exactos, recalculan sus embeddings.
+    Si no queda ningún chunk se publica vacío, como en `actualizar_indice`.
+    Devuelve (éxito, publicado): publicado es True si el índice se reescribió.
+    """
+    if not (dir_destino / ARCHIVO_MANIFIESTO).exists():
+        logging.warning(f"{dir_destino} no tiene manifiesto; ejecuta antes procesar_docs2.py. Se omite.")
+        return True, False
+    try:
+        config_indice = leer_config_indice(dir_destino)
+        bytes_antes = sum(f.stat().st_size for f in dir_destino.rglob("*") if f.is_file())
+        db = cargar_base_editable(dir_destino, embeddings)
+        vectores_antes = db.index.ntotal
+        if not vectores_antes:
+            logging.info(f"{dir_destino} está vacío; no hay nada que compactar.")
+            return True, False
+        manifiesto = Manifiesto(dir_destino)
+        try:
+            ids_por_ruta = manifiesto.ids_por_ruta()
+        finally:
+            manifiesto.cerrar()
+        eliminados = [ruta for ruta in ids_por_ruta if not Path(ruta).exists()]
+        validos = {i for ruta, ids in ids_por_ruta.items() if ruta not in eliminados for i in ids}
+        sobrantes = [i for i in db.index_to_docstore_id.values() if i not in validos]
+        dimension = db.index.d
+        db = reconstruir_base(db, config_indice, excluir=sobrantes)
+        if db is None:
+            logging.warning(f"{dir_destino} no conserva ningún chunk; se publica vacío.")
+            db = crear_base_vacia(embeddings, faiss.IndexFlatL2(dimension))
+
+        if dir_temp.exists():
+            shutil.rmtree(dir_temp)
+        guardar_base(db, dir_temp)
+        guardar_config_indice(dir_temp, config_indice)
+        escribir_manifiesto(dir_temp, {}, {}, eliminados, origen=dir_destino)
+        publicar_directorio(dir_temp, dir_destino)
+        bytes_despues = sum(f.stat().st_size for f in dir_destino.rglob("*") if f.is_file())
+        logging.info(f"🗜️ {dir_destino.name}: {vectores_antes} → {db.index.ntotal} vectores "
+                     f"({len(sobrantes)} chunks sobrantes, {len(eliminados)} archivos eliminados), "
+                     f"{bytes_antes / 1e6:.2f} → {bytes_despues / 1e6:.2f} MB")
+        return True, True
+    except Exception as e:
+        logging.error(f"❌ No se pudo compactar {dir_destino}: {e}")
+        if dir_temp.exists():
+            shutil.rmtree(dir_temp)
+        return False, False
+
+
+def compactar(base_embeddings, embeddings):
+    """Compacta el índice único o cada shard y, si se reescribió alguno, publica una nueva generación."""
+    if not DIR_DB_FAISS.exists():
+        logging.error(f"No existe el índice {DIR_DB_FAISS}.")
+        return False
+    generacion_anterior = leer_generacion(DIR_DB_FAISS)
+    if leer_config_shards(DIR_DB_FAISS) is not None:
+        objetivos = [(d, ruta_temporal_shard(DIR_DB_FAISS, d.name)) for d in listar_shards(DIR_DB_FAISS)]
+    else:
+        objetivos = [(DIR_DB_FAISS, DIR_DB_TEMP)]
+    resultados = [compactar_indice(destino, temporal, embeddings) for destino, temporal in objetivos]
+    if any(publicado for _, publicado in resultados):
+        guardar_config_embeddings(DIR_DB_FAISS, base_embeddings)
+        registrar_generacion(DIR_DB_FAISS, generacion_anterior)
+    return all(exito for exito, _ in resultados)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,295 @@
+"""
+Pool de proveedores de LLM de larga duración.
+
+- Un cliente por (modelo, temperatura), creado una vez y reutilizado: `ChatOllama` y
+  `ChatGoogleGenerativeAI` mantienen su propio cliente HTTP, así que reutilizarlos
+  conserva las conexiones abiertas entre preguntas.
+- Por proveedor: límite de peticiones simultáneas, token bucket de peticiones por
+  minuto (`limites.py`) e interruptor de circuito que deja de intentar un proveedor
+  que falla seguido y lo vuelve a probar tras un tiempo.
+- El estado de Ollama se sondea en un hilo de fondo en lugar de en cada pregunta.
+- Modo con respaldo: si el modelo principal no produce el primer token antes del
+  plazo, se lanza también el de respaldo y se queda el que responda primero.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from limites import LIMITES_PROVEEDOR, LimitadorTasa
+from rag import MODEL_CONFIG, LLMNoDisponible, get_llm, verificar_ollama
+
+logger = logging.getLogger(__name__)
+
+PLAZO_PRIMER_TOKEN = 8.0   # segundos antes de lanzar el modelo de respaldo
+UMBRAL_FALLOS = 3          # fallos seguidos que abren el circuito
+ENFRIAMIENTO = 30.0        # segundos con el circuito abierto antes de volver a probar
+PLAZO_PRUEBA = 60.0        # segundos que se espera a la petición de prueba antes de permitir otra
+INTERVALO_SONDEO = 15.0    # cada cuánto se comprueba si Ollama está activo
+
+
+class Interruptor:
+    """
+    Interruptor de circuito: cerrado → abierto tras varios fallos → semiabierto tras el
+    enfriamiento. Si la petición de prueba no informa de su resultado en `plazo_prueba`
+    segundos, se deja pasar otra.
+    """
+
+    def __init__(self, umbral_fallos: int = UMBRAL_FALLOS, enfriamiento: float = ENFRIAMIENTO,
+                 plazo_prueba: float = PLAZO_PRUEBA):
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento = enfriamiento
+        self.plazo_prueba = plazo_prueba
+        self.estado = "cerrado"
+        self.fallos = 0
+        self._apertura = 0.0
+        self._prueba = 0.0
+        self._lock = threading.Lock()
+
+    def bloqueado(self) -> bool:
+        """Abierto y todavía en enfriamiento (no modifica el estado)."""
+        return self.estado == "abierto" and time.monotonic() - self._apertura < self.enfriamiento
+
+    def permitir(self) -> bool:
+        with self._lock:
+            ahora = time.monotonic()
+            if (self.estado == "abierto" and ahora - self._apertura >= self.enfriamiento
+                    or self.estado == "semiabierto" and ahora - self._prueba >= self.plazo_prueba):
+                self.estado = "semiabierto"  # se deja pasar una petición de prueba
+                self._prueba = ahora
+                return True
+            return self.estado == "cerrado"
+
+    def exito(self) -> None:
+        with self._lock:
+            self.estado = "cerrado"
+            self.fallos = 0
+
+    def fallo(self) -> None:
+        with self._lock:
+            self.fallos += 1
+            if self.estado == "semiabierto" or self.fallos >= self.umbral_fallos:
+                if self.estado != "abierto":
+                    logger.warning(f"Circuito abierto tras {self.fallos} fallos; se reintenta en {self.enfriamiento:.0f}s.")
+                self.estado = "abierto"
+                self._apertura = time.monotonic()
+
+
+class Proveedor:
+    """Límites y estado compartidos por todos los modelos de un proveedor."""
+
+    def __init__(self, nombre: str, por_minuto: Optional[float], concurrencia: Optional[int]):
+        self.nombre = nombre
+        self.limitador = LimitadorTasa(por_minuto)
+        self.concurrencia = concurrencia or 1
+        self.semaforo = threading.BoundedSemaphore(self.concurrencia)
+        self.interruptor = Interruptor()
+        self.peticiones = 0
+        self.errores = 0
+
+
+class PoolProveedores:
+    """Clientes, límites e interruptores de todos los proveedores, compartidos entre sesiones."""
+
+    def __init__(self, google_api_key: Optional[str] = None, sondear_ollama: bool = True):
+        self.google_api_key = google_api_key
+        self.proveedores = {nombre: Proveedor(nombre, limites.get("por_minuto"), limites.get("concurrencia"))
+                            for nombre, limites in LIMITES_PROVEEDOR.items()}
+        self._clientes: Dict[Tuple[str, float], Any] = {}
+        self._lock = threading.Lock()
+        self.respaldos_lanzados = 0
+        self.respaldos_ganadores = 0
+        self.ollama_activo = verificar_ollama()
+        if sondear_ollama:
+            threading.Thread(target=self._sondear_ollama, daemon=True).start()
+
+    def _sondear_ollama(self) -> None:
+        while True:
+            time.sleep(INTERVALO_SONDEO)
+            self.ollama_activo = verificar_ollama()
+
+    def proveedor(self, modelo: str) -> Proveedor:
+        nombre = MODEL_CONFIG.get(modelo, {}).get("provider")
+        if nombre not in self.proveedores:
+            raise LLMNoDisponible(f"Proveedor '{nombre}' para el modelo '{modelo}' no está configurado.")
+        return self.proveedores[nombre]
+
+    def cliente(self, modelo: str, temperature: float):
+        """Cliente reutilizable del modelo; lanza `LLMNoDisponible` como `get_llm`."""
+        clave = (modelo, temperature)
+        with self._lock:
+            if clave not in self._clientes:
+                self._clientes[clave] = get_llm(modelo, temperature, google_api_key=self.google_api_key,
+                                                ollama_activo=lambda: self.ollama_activo)
+            return self._clientes[clave]
+
+    def _contar(self, objeto: Any, contador: str) -> None:
+        """Incrementa un contador de estadísticas; varios hilos lo actualizan a la vez."""
+        with self._lock:
+            setattr(objeto, contador, getattr(objeto, contador) + 1)
+
+    def disponible(self, modelo: str) -> bool:
+        """Sin bloquear: el proveedor tiene el circuito cerrado (y, si es Ollama, está activo)."""
+        proveedor = self.proveedor(modelo)
+        if proveedor.nombre == "ollama" and not self.ollama_activo:
+            return False
+        return not proveedor.interruptor.bloqueado()
+
+    # --- Generación ---
+
+    def transmitir(self, modelo: str, temperature: float, prompt: str,
+                   cancelado: Optional[threading.Event] = None) -> Iterator[str]:
+        """Texto generado por un modelo, respetando los límites de su proveedor."""
+        proveedor = self.proveedor(modelo)
+        # Un error de configuración (falta la API key, no se importa Ollama) no es un fallo del proveedor
+        cliente = self.cliente(modelo, temperature)
+        if not proveedor.interruptor.permitir():
+            raise LLMNoDisponible(f"El proveedor '{proveedor.nombre}' está fallando; se reintentará en unos segundos.")
+        # Toda petición admitida informa al interruptor; si no, una prueba lo dejaría semiabierto
+        fallida = False
+        try:
+            proveedor.limitador.adquirir()
+            with proveedor.semaforo:
+                self._contar(proveedor, "peticiones")
+                for parte in cliente.stream(prompt):
+                    if cancelado is not None and cancelado.is_set():
+                        break  # cerrar el stream corta la petición en curso; el proveedor sí respondió
+                    yield getattr(parte, "content", parte)
+        except Exception:
+            fallida = True
+            self._contar(proveedor, "errores")
+            proveedor.interruptor.fallo()
+            raise
+        finally:
+            # También si quien consume el stream lo cierra antes de tiempo (GeneratorExit)
+            if not fallida:
+                proveedor.interruptor.exito()
+
+    def transmitir_con_respaldo(self, modelo: str, temperature: float, prompt: str, respaldo: Optional[str] = None,
+                                plazo: float = PLAZO_PRIMER_TOKEN, info: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        Como `transmitir`, pero si `modelo` no da su primer token en `plazo` segundos (o
+        falla, o su circuito está abierto) se lanza `respaldo`. Gana el primero que
+        produce texto y el otro se cancela. En `info` se anota qué modelo respondió.
+        """
+        if not respaldo or respaldo == modelo:
+            if info is not None:
+                info.update(modelo=modelo, respaldo=False)
+            yield from self.transmitir(modelo, temperature, prompt)
+            return
+
+        cola: "queue.Queue[Tuple[str, str, Any]]" = queue.Queue()
+        lanzados: Dict[str, threading.Event] = {}
+
+        def lanzar(nombre: str) -> None:
+            cancelado = threading.Event()
+            lanzados[nombre] = cancelado
+
+            def producir():
+                try:
+                    for texto in self.transmitir(nombre, temperature, prompt, cancelado):
+                        cola.put((nombre, "texto", texto))
+                    cola.put((nombre, "fin", None))
+                except Exception as e:
+                    cola.put((nombre, "error", e))
+
+            threading.Thread(target=producir, daemon=True).start()
+
+        def lanzar_respaldo(motivo: str) -> None:
+            logger.info(f"Se lanza el modelo de respaldo '{respaldo}': {motivo}")
+            self._contar(self, "respaldos_lanzados")
+            lanzar(respaldo)
+
+        if self.disponible(modelo):
+            lanzar(modelo)
+            limite = time.monotonic() + plazo
+        else:
+            lanzar_respaldo(f"'{modelo}' no está disponible")
+            limite = None
+
+        ganador, primero = None, None
+        errores: List[Exception] = []
+        try:
+            while ganador is None:
+                espera = None if limite is None or respaldo in lanzados else limite - time.monotonic()
+                if espera is not None and espera <= 0:
+                    lanzar_respaldo(f"sin primer token de '{modelo}' en {plazo:.1f}s")
+                    continue
+                try:
+                    nombre, tipo, valor = cola.get(timeout=espera)
+                except queue.Empty:
+                    continue  # se cumplió el plazo: la siguiente vuelta lanza el respaldo
+                if tipo == "error":
+                    errores.append(valor)
+                    if respaldo not in lanzados:
+                        lanzar_respaldo(f"'{nombre}' falló ({valor})")
+                    elif len(errores) == len(lanzados):
+                        raise errores[-1]
+                else:
+                    ganador, primero = nombre, valor
+
+            for nombre, cancelado in lanzados.items():
+                if nombre != ganador:
+                    cancelado.set()
+            if ganador == respaldo:
+                self._contar(self, "respaldos_ganadores")
+            if info is not None:
+                info.update(modelo=ganador, respaldo=ganador != modelo)
+            if primero is not None:
+                yield primero
+            else:
+                return  # el ganador terminó sin texto
+
+            while True:
+                nombre, tipo, valor = cola.get()
+                if nombre != ganador:
+                    continue
+                if tipo == "texto":
+                    yield valor
+                elif tipo == "error":
+                    raise valor
+                else:
+                    return
+        finally:
+            for cancelado in lanzados.values():
+                cancelado.set()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "respaldos_lanzados": self.respaldos_lanzados,
+            "respaldos_ganadores": self.respaldos_ganadores,
+            "proveedores": {nombre: {"circuito": p.interruptor.estado, "peticiones": p.peticiones,
+                                     "errores": p.errores} for nombre, p in self.proveedores.items()},
+        }
+
+
+class LLMGestionado(LLM):
+    """LLM de LangChain que genera a través del pool (límites, circuito y respaldo opcional)."""
+
+    pool: Any
+    modelo: str
+    temperature: float = 0.2
+    respaldo: Optional[str] = None
+    plazo_primer_token: float = PLAZO_PRIMER_TOKEN
+    info: Dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "gestionado"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        return "".join(self.pool.transmitir_con_respaldo(self.modelo, self.temperature, prompt, self.respaldo,
+                                                         self.plazo_primer_token, self.info))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        for texto in self.pool.transmitir_con_respaldo(self.modelo, self.temperature, prompt, self.respaldo,
+                                                       self.plazo_primer_token, self.info):
+            chunk = GenerationChunk(text=texto)
+            if run_manager:
+                run_manager.on_llm_new_token(texto, chunk=chunk)
+            yield chunk
@@ -0,0 +1,165 @@
+"""
+Piezas de la cadena RAG que no dependen de Streamlit: el prompt, el formateo del
+contexto, la fábrica de LLMs y un LLM simulado y determinista para medir el
+pipeline sin red.
+"""
+import asyncio
+import hashlib
+import os
+import time
+import tomllib
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+import requests
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+MODEL_CONFIG = {
+    "mistral:7b": {
+        "provider": "ollama",
+        "info": "🏆 Local - Excelente para investigación, gratis, requiere 4GB RAM.",
+        "presupuesto_contexto": 1500,  # Ollama trunca los prompts que superan su num_ctx (2048 por defecto)
+    },
+    "gemini-1.5-flash": {
+        "provider": "google",
+        "info": "🟢 API Google - Rápido y preciso, requiere API key, 15 req/min gratis.",
+        "presupuesto_contexto": 8000,
+    },
+}
+URL_OLLAMA = "http://localhost:11434"
+# Streamlit busca secrets.toml en el directorio desde el que se lanza (`src/`, según el README)
+RUTAS_SECRETOS = (Path(__file__).resolve().parent / ".streamlit" / "secrets.toml",
+                  Path.cwd() / ".streamlit" / "secrets.toml")
+
+PROMPT_TEMPLATE = """Eres un asistente experto en investigación del INAOE. Tu tarea es responder a la pregunta del usuario de la forma más completa y precisa posible.
+
+Para ello, debes seguir estas reglas:
+1.  **COMBINA CONOCIMIENTO:** Fusiona tu propio conocimiento general sobre ciencia, tecnología y el INAOE con la información específica encontrada en los siguientes documentos de contexto.
+2.  **PRIORIZA EL CONTEXTO:** Si la respuesta se encuentra en los documentos, dale prioridad a esa información para que la respuesta sea fundamentada.
+3.  **USA CONOCIMIENTO GENERAL:** Si los documentos no contienen información relevante para la pregunta (o si el contexto está vacío), responde utilizando tu conocimiento general. No te limites a decir "no encontré información".
+4.  **SÉ COMPLETO:** Proporciona respuestas detalladas y bien estructuradas, adecuadas para un público de investigadores.
+
+A continuación, se presenta el contexto y la pregunta.
+
+CONTEXTO DE LOS DOCUMENTOS:
+{context}
+
+PREGUNTA: {question}
+
+RESPUESTA EXPERTA:"""
+
+
+def format_docs(docs):
+    """Formatea los documentos recuperados en una sola cadena de texto."""
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+# --- Fábrica de LLMs (LLM Factory) ---
+
+class LLMNoDisponible(RuntimeError):
+    """El modelo pedido no se puede usar (falta la API key, Ollama apagado, proveedor desconocido)."""
+
+
+def leer_api_key_google() -> Optional[str]:
+    """La API key de la variable de entorno o, si no, del mismo secrets.toml que usa la app."""
+    if os.environ.get("GOOGLE_API_KEY"):
+        return os.environ["GOOGLE_API_KEY"]
+    for ruta in RUTAS_SECRETOS:
+        if ruta.exists():
+            with open(ruta, "rb") as f:
+                return tomllib.load(f).get("GOOGLE_API_KEY")
+    return None
+
+
+def verificar_ollama() -> bool:
+    """Verifica si el servicio de Ollama está activo."""
+    try:
+        requests.get(URL_OLLAMA, timeout=3)
+        return True
+    except requests.ConnectionError:
+        return False
+
+
+def get_llm(modelo: str, temperature: float, google_api_key: Optional[str] = None,
+            ollama_activo: Callable[[], bool] = verificar_ollama):
+    """
+    Fábrica que devuelve una instancia del LLM seleccionado.
+    Lanza `LLMNoDisponible` con un mensaje para el usuario si no se puede crear.
+    """
+    config = MODEL_CONFIG.get(modelo, {})
+    provider = config.get("provider")
+
+    if provider == "google":
+        if not google_api_key:
+            raise LLMNoDisponible("Falta la API Key de Google en .streamlit/secrets.toml.")
+        try:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+        except ImportError as e:
+            raise LLMNoDisponible(f"Error al importar langchain_google_genai: {e}. "
+                                  "Instala con: 'pip install langchain-google-genai'") from e
+        return ChatGoogleGenerativeAI(model=modelo, api_key=google_api_key, temperature=temperature)
+
+    elif provider == "ollama":
+        if not ollama_activo():
+            raise LLMNoDisponible("Ollama no está ejecutándose. Inicia el servicio de Ollama para usar este modelo.")
+        try:
+            from langchain_ollama import ChatOllama
+        except ImportError as e:
+            raise LLMNoDisponible(f"Error al importar langchain_ollama: {e}. "
+                                  "Instala con: 'pip install langchain-ollama'") from e
+        return ChatOllama(model=modelo, temperature=temperature)
+
+    else:
+        raise LLMNoDisponible(f"Proveedor '{provider}' para el modelo '{modelo}' no está configurado.")
+
+
+class LLMSimulado(LLM):
+    """
+    LLM local y determinista: la respuesta depende sólo del prompt (su hash), así que dos
+    ejecuciones con el mismo contexto producen el mismo texto. `segundos_por_token`
+    simula la velocidad de generación de un modelo real.
+    """
+
+    palabras: int = 40
+    segundos_por_token: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulado"
+
+    def _tokens(self, prompt: str) -> List[str]:
+        huella = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        return [f"{'token' if i else 'Respuesta'}-{huella[i % len(huella)]} " for i in range(self.palabras)]
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        return "".join(self._stream_texto(prompt))
+
+    def _stream_texto(self, prompt: str) -> Iterator[str]:
+        for token in self._tokens(prompt):
+            if self.segundos_por_token:
+                time.sleep(self.segundos_por_token)
+            yield token
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        for token in self._stream_texto(prompt):
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                     **kwargs: Any) -> str:
+        return "".join([chunk.text async for chunk in self._astream(prompt)])
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        # Como un proveedor remoto: la espera entre tokens no ocupa un hilo
+        for token in self._tokens(prompt):
+            if self.segundos_por_token:
+                await asyncio.sleep(self.segundos_por_token)
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
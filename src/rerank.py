@@ -0,0 +1,97 @@
+"""
+Reordenamiento opcional de los documentos recuperados con un cross-encoder local.
+
+Se recuperan más candidatos de los que recibe el prompt, se puntúan todos los pares
+(pregunta, chunk) en una sola pasada por lotes y sólo los mejores pasan a `format_docs`.
+Cada consulta tiene un presupuesto de tiempo estricto: si el modelo no termina a
+tiempo se usa el orden de la búsqueda vectorial.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from cache_consultas import CacheLRU, normalizar_pregunta
+from lexico import clave_documento
+
+logger = logging.getLogger(__name__)
+
+MODELO_RERANK = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # multilingüe (español e inglés)
+FACTOR_CANDIDATOS = 4      # se recuperan k·4 candidatos para reordenar
+PRESUPUESTO_MS = 300
+MAX_LONGITUD = 512         # tokens por par; el resto del chunk se trunca
+MAX_ENTRADAS_CACHE = 20_000
+
+
+class Reordenador:
+    """Cross-encoder con caché de puntuaciones por (pregunta, chunk) y presupuesto de tiempo."""
+
+    def __init__(self, modelo: str = MODELO_RERANK, device: Optional[str] = None,
+                 max_entradas_cache: int = MAX_ENTRADAS_CACHE, ttl: float = 24 * 3600):
+        from sentence_transformers import CrossEncoder
+
+        self.nombre_modelo = modelo
+        self.modelo = CrossEncoder(modelo, device=device, max_length=MAX_LONGITUD)
+        self.puntuaciones = CacheLRU(max_entradas_cache, ttl)
+        # Un solo hilo: una pasada que se pasa de tiempo termina en segundo plano y
+        # deja sus puntuaciones en la caché para la siguiente consulta igual.
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self.reordenadas = 0
+        self.excedidas = 0
+
+    def _puntuar(self, pregunta: str, claves: List[tuple], docs: List[Document]) -> Dict[tuple, float]:
+        pares = [(pregunta, doc.page_content) for doc in docs]
+        puntuaciones = self.modelo.predict(pares, batch_size=len(pares), show_progress_bar=False)
+        resultado = {clave: float(p) for clave, p in zip(claves, puntuaciones)}
+        for clave, puntuacion in resultado.items():
+            self.puntuaciones.guardar(clave, puntuacion)
+        return resultado
+
+    def reordenar(self, pregunta: str, docs: Sequence[Document], k: int,
+                  presupuesto_ms: float = PRESUPUESTO_MS) -> List[Document]:
+        """Los k documentos mejor puntuados, o los k primeros en su orden original si se agota el presupuesto."""
+        docs = list(docs)
+        if len(docs) <= 1:
+            return docs[:k]
+        inicio = time.perf_counter()
+        pregunta_normalizada = normalizar_pregunta(pregunta)
+        claves = [(pregunta_normalizada, clave_documento(doc)) for doc in docs]
+
+        puntuaciones: Dict[tuple, float] = {}
+        pendientes = []
+        for clave, doc in zip(claves, docs):
+            puntuacion = self.puntuaciones.obtener(clave)
+            if puntuacion is None:
+                pendientes.append((clave, doc))
+            else:
+                puntuaciones[clave] = puntuacion
+
+        if pendientes:
+            futuro = self._pool.submit(self._puntuar, pregunta,
+                                       [c for c, _ in pendientes], [d for _, d in pendientes])
+            restante = presupuesto_ms / 1000 - (time.perf_counter() - inicio)
+            try:
+                puntuaciones.update(futuro.result(timeout=max(restante, 0)))
+            except FuturesTimeoutError:
+                with self._lock:
+                    self.excedidas += 1
+                logger.warning(f"Reordenamiento: presupuesto de {presupuesto_ms:.0f} ms excedido; "
+                               "se usa el orden de la búsqueda vectorial.")
+                return docs[:k]
+            except Exception as e:
+                logger.error(f"Reordenamiento fallido ({e}); se usa el orden de la búsqueda vectorial.")
+                return docs[:k]
+
+        orden = sorted(range(len(docs)), key=lambda i: -puntuaciones[claves[i]])
+        with self._lock:
+            self.reordenadas += 1
+        logger.info(f"Reordenamiento de {len(docs)} candidatos ({len(pendientes)} sin caché) "
+                    f"en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        return [docs[i] for i in orden[:k]]
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {"reordenadas": self.reordenadas, "excedidas": self.excedidas, "pares_en_cache": len(self.puntuaciones)}
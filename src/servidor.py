@@ -0,0 +1,304 @@
+"""
+Servicio HTTP asíncrono de consultas, sin Streamlit.
+
+Carga el índice FAISS (único o por shards), el índice BM25 y el modelo de embeddings
+una sola vez y atiende peticiones concurrentes:
+
+- Las preguntas que llegan casi a la vez se agrupan (micro-lotes) en una sola llamada
+  a `encode`, que es mucho más barata que una llamada por pregunta.
+- La búsqueda corre en hilos, sin bloquear el bucle de eventos.
+- La respuesta del LLM se devuelve en streaming como JSON por líneas (NDJSON).
+
+    python servidor.py --puerto 8000
+    curl -N -X POST localhost:8000/preguntar -d '{"pregunta": "¿Qué es el INAOE?"}'
+
+Endpoints: POST /preguntar, GET /salud, GET /estado y GET /metrics (Prometheus).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from cache_consultas import CacheConsultas, normalizar_pregunta
+from contexto import empaquetar_contexto, presupuesto_modelo
+from embeddings_cpu import EmbeddingsCPU, leer_config_embeddings
+from proveedores import LLMGestionado, PoolProveedores
+from rag import MODEL_CONFIG, PROMPT_TEMPLATE, LLMNoDisponible, LLMSimulado, format_docs, leer_api_key_google
+from shards import cargar_busqueda_lexica, cargar_indice_consultas
+from trazas import RegistroTrazas, Traza, estimar_tokens
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+RUTA_PROYECTO = Path(__file__).resolve().parent.parent
+RUTA_DB = RUTA_PROYECTO / "indice_faiss"
+PUERTO = 8000
+MAX_LOTE = 32        # preguntas por llamada a encode
+ESPERA_LOTE_MS = 20  # cuánto se espera a que lleguen más preguntas tras la primera (ver README)
+K_POR_DEFECTO = 5
+
+
+# --- Micro-lotes de embeddings ---
+
+class MicroLotes:
+    """
+    Agrupa las preguntas que llegan dentro de `espera_ms` (hasta `max_lote`) y calcula
+    sus embeddings con una sola llamada al modelo en un hilo aparte.
+    """
+
+    def __init__(self, embeddings: EmbeddingsCPU, max_lote: int = MAX_LOTE, espera_ms: float = ESPERA_LOTE_MS):
+        self.embeddings = embeddings
+        self.max_lote = max_lote
+        self.espera = espera_ms / 1000
+        self._cola: "asyncio.Queue[Tuple[str, asyncio.Future]]" = asyncio.Queue()
+        self._tarea: Optional[asyncio.Task] = None
+        self.lotes = 0
+        self.preguntas = 0
+        self.segundos = 0.0
+
+    def iniciar(self) -> None:
+        self._tarea = asyncio.create_task(self._procesar())
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+
+    async def embedding(self, pregunta: str) -> List[float]:
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((pregunta, futuro))
+        return await futuro
+
+    async def _reunir_lote(self) -> List[Tuple[str, asyncio.Future]]:
+        lote = [await self._cola.get()]
+        if self.espera > 0 and self._cola.qsize() < self.max_lote - 1:
+            await asyncio.sleep(self.espera)
+        while len(lote) < self.max_lote and not self._cola.empty():
+            lote.append(self._cola.get_nowait())
+        return lote
+
+    async def _procesar(self) -> None:
+        while True:
+            lote = await self._reunir_lote()
+            inicio = time.perf_counter()
+            try:
+                vectores = await asyncio.to_thread(self.embeddings.embed_queries, [p for p, _ in lote])
+            except Exception as e:
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                continue
+            self.segundos += time.perf_counter() - inicio
+            self.lotes += 1
+            self.preguntas += len(lote)
+            for (_, futuro), vector in zip(lote, vectores):
+                if not futuro.done():  # el cliente pudo desconectarse mientras esperaba
+                    futuro.set_result(vector)
+
+    def estadisticas(self) -> Dict[str, float]:
+        return {
+            "lotes": self.lotes,
+            "preguntas": self.preguntas,
+            "tamano_medio_lote": self.preguntas / self.lotes if self.lotes else 0.0,
+            "ms_por_lote": self.segundos * 1000 / self.lotes if self.lotes else 0.0,
+        }
+
+
+# --- Servicio ---
+
+class ServicioConsultas:
+    """Índices, modelo, cachés y LLMs compartidos por todas las peticiones."""
+
+    def __init__(self, ruta_db: Path, llm_simulado: bool = False, segundos_por_token: float = 0.0,
+                 max_lote: int = MAX_LOTE, espera_ms: float = ESPERA_LOTE_MS, ruta_trazas: Optional[Path] = None):
+        config_embeddings = leer_config_embeddings(ruta_db)
+        self.embeddings = EmbeddingsCPU(config_embeddings["modelo"], config_embeddings["backend"])
+        self.db = cargar_indice_consultas(ruta_db, self.embeddings)
+        self.lexico = cargar_busqueda_lexica(ruta_db, self.db)
+        self.cache = CacheConsultas(ruta_db)
+        self.trazas = RegistroTrazas(ruta_trazas)
+        self.prompt = PromptTemplate.from_template(PROMPT_TEMPLATE)
+        self.llm_simulado = llm_simulado
+        self.segundos_por_token = segundos_por_token
+        self.pool = None if llm_simulado else PoolProveedores(google_api_key=leer_api_key_google())
+        self.max_lote = max_lote
+        self.espera_ms = espera_ms
+        self.lotes: Optional[MicroLotes] = None
+        self.inicio = time.time()
+
+    def llm(self, modelo: str, temperature: float, respaldo: Optional[str] = None):
+        """LLM de la petición; los clientes y los límites por proveedor viven en el pool."""
+        if self.llm_simulado:
+            return LLMSimulado(segundos_por_token=self.segundos_por_token)
+        if respaldo is None:
+            self.pool.cliente(modelo, temperature)  # LLMNoDisponible antes de empezar a responder
+        return LLMGestionado(pool=self.pool, modelo=modelo, temperature=temperature, respaldo=respaldo)
+
+    async def recuperar(self, pregunta: str, k: int, hibrida: bool, traza: Traza):
+        with traza.span("embedding"):
+            clave = normalizar_pregunta(pregunta)
+            if self.cache.embeddings.obtener(clave) is None:
+                self.cache.embeddings.guardar(clave, await self.lotes.embedding(pregunta))
+        with traza.span("busqueda"):
+            # Con el vector ya en la caché, buscar() sólo hace la búsqueda (o devuelve el resultado cacheado)
+            lexico = self.lexico if hibrida else None
+            return await asyncio.to_thread(self.cache.buscar, self.db, pregunta, k, lexico)
+
+
+def leer_peticion(datos: Dict[str, Any]) -> Dict[str, Any]:
+    pregunta = str(datos.get("pregunta", "")).strip()
+    if not pregunta:
+        raise ValueError("Falta el campo 'pregunta'.")
+    modelo = datos.get("modelo", next(iter(MODEL_CONFIG)))
+    if modelo not in MODEL_CONFIG:
+        raise ValueError(f"Modelo desconocido: '{modelo}'. Opciones: {', '.join(MODEL_CONFIG)}")
+    respaldo = datos.get("respaldo")
+    if respaldo is not None and respaldo not in MODEL_CONFIG:
+        raise ValueError(f"Modelo de respaldo desconocido: '{respaldo}'.")
+    return {
+        "pregunta": pregunta,
+        "modelo": modelo,
+        "respaldo": respaldo,
+        "k": int(datos.get("k", K_POR_DEFECTO)),
+        "temperature": float(datos.get("temperature", 0.2)),
+        "hibrida": bool(datos.get("hibrida", True)),
+        "stream": bool(datos.get("stream", True)),
+        "empaquetar": bool(datos.get("empaquetar", True)),
+        "presupuesto_contexto": int(datos["presupuesto_contexto"]) if datos.get("presupuesto_contexto") else None,
+    }
+
+
+def linea(objeto: Dict[str, Any]) -> str:
+    return json.dumps(objeto, ensure_ascii=False) + "\n"
+
+
+def crear_app(servicio: ServicioConsultas) -> Starlette:
+
+    async def preguntar(request: Request):
+        try:
+            peticion = leer_peticion(await request.json())
+            llm = servicio.llm(peticion["modelo"], peticion["temperature"], peticion["respaldo"])
+        except (ValueError, json.JSONDecodeError) as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        except LLMNoDisponible as e:
+            return JSONResponse({"error": str(e)}, status_code=503)
+
+        proveedor = "simulado" if servicio.llm_simulado else MODEL_CONFIG[peticion["modelo"]]["provider"]
+        traza = Traza(proveedor, peticion["modelo"])
+        docs = await servicio.recuperar(peticion["pregunta"], peticion["k"], peticion["hibrida"], traza)
+        if peticion["empaquetar"]:
+            presupuesto = peticion["presupuesto_contexto"] or presupuesto_modelo(peticion["modelo"], peticion["respaldo"])
+            with traza.span("empaquetado"):
+                docs, _ = empaquetar_contexto(docs, presupuesto)
+        with traza.span("format_docs"):
+            contexto = format_docs(docs)
+        traza.atributos.update({"docs": len(docs), "contexto_tokens": estimar_tokens(contexto)})
+        fuentes = [{"fuente": Path(d.metadata.get("source", "")).name, "pagina": d.metadata.get("page")}
+                   for d in docs]
+        cadena = servicio.prompt | llm | StrOutputParser()
+        entrada = {"context": contexto, "question": peticion["pregunta"]}
+
+        def etiquetar_respaldo():
+            # Las métricas se atribuyen al modelo que respondió
+            if isinstance(llm, LLMGestionado) and llm.info.get("respaldo"):
+                modelo = llm.info["modelo"]
+                traza.etiquetas.update(proveedor=MODEL_CONFIG[modelo]["provider"], modelo=modelo)
+
+        if not peticion["stream"]:
+            with traza.span("llm"):
+                respuesta = await cadena.ainvoke(entrada)
+            etiquetar_respaldo()
+            return JSONResponse({"respuesta": respuesta, "fuentes": fuentes,
+                                 "traza": servicio.trazas.registrar(traza)})
+
+        async def generar():
+            yield linea({"tipo": "fuentes", "fuentes": fuentes})
+            inicio_llm = time.perf_counter()
+            primero = True
+            async for texto in cadena.astream(entrada):
+                if primero:
+                    traza.agregar("llm_primer_token", time.perf_counter() - inicio_llm)
+                    primero = False
+                yield linea({"tipo": "texto", "texto": texto})
+            traza.agregar("llm", time.perf_counter() - inicio_llm)
+            etiquetar_respaldo()
+            yield linea({"tipo": "fin", "traza": servicio.trazas.registrar(traza)})
+
+        return StreamingResponse(generar(), media_type="application/x-ndjson")
+
+    async def salud(request: Request):
+        return JSONResponse({"estado": "ok"})
+
+    async def estado(request: Request):
+        return JSONResponse({
+            "segundos_activo": time.time() - servicio.inicio,
+            "version_indice": servicio.cache.version_indice(),
+            "hibrida_disponible": servicio.lexico is not None,
+            "micro_lotes": servicio.lotes.estadisticas() if servicio.lotes else {},
+            "cache": {"aciertos": servicio.cache.aciertos, "fallos": servicio.cache.fallos},
+            "proveedores": servicio.pool.estadisticas() if servicio.pool else {},
+        })
+
+    async def metricas(request: Request):
+        return PlainTextResponse(servicio.trazas.exportar_prometheus(),
+                                 media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @asynccontextmanager
+    async def ciclo_de_vida(app: Starlette):
+        # La cola de micro-lotes pertenece al bucle de eventos del servidor
+        servicio.lotes = MicroLotes(servicio.embeddings, servicio.max_lote, servicio.espera_ms)
+        servicio.lotes.iniciar()
+        yield
+        await servicio.lotes.detener()
+
+    return Starlette(
+        routes=[
+            Route("/preguntar", preguntar, methods=["POST"]),
+            Route("/salud", salud),
+            Route("/estado", estado),
+            Route("/metrics", metricas),
+        ],
+        lifespan=ciclo_de_vida,
+    )
+
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description="Servicio HTTP asíncrono de consultas sobre el índice FAISS.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--indice", type=Path, default=RUTA_DB, help="Directorio del índice FAISS.")
+    parser.add_argument("--max-lote", type=int, default=MAX_LOTE, help="Preguntas máximas por llamada a encode.")
+    parser.add_argument("--espera-lote-ms", type=float, default=ESPERA_LOTE_MS,
+                        help="Espera máxima para completar un micro-lote (0 = sin agrupar).")
+    parser.add_argument("--trazas", type=Path, help="Archivo JSONL donde registrar las trazas por petición.")
+    parser.add_argument("--llm-simulado", action="store_true",
+                        help="Usa el LLM simulado y determinista (pruebas de carga sin red).")
+    parser.add_argument("--segundos-por-token", type=float, default=0.0,
+                        help="Velocidad de generación del LLM simulado.")
+    return parser.parse_args()
+
+
+def main():
+    args = parsear_argumentos()
+    if not args.indice.exists():
+        logger.error(f"No se encontró el índice en {args.indice}. Ejecuta primero: python procesar_docs.py")
+        return
+    servicio = ServicioConsultas(args.indice, args.llm_simulado, args.segundos_por_token,
+                                 args.max_lote, args.espera_lote_ms, args.trazas)
+    uvicorn.run(crear_app(servicio), host=args.host, port=args.puerto, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Índices fragmentados (shards) con búsqueda en paralelo.
+
+Con shards, `indice_faiss/` contiene `shards.json` (cómo se reparten los archivos) y
+un subdirectorio por shard en `indice_faiss/shards/<nombre>/`, cada uno en el formato
+de `almacen.py`. Cada shard se construye y publica por separado, y las consultas se
+lanzan a todos a la vez y se fusionan por distancia.
+"""
+import json
+import logging
+import os
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from almacen import ARCHIVO_DOCSTORE, ARCHIVO_INDICE, cargar_base
+from indices import ARCHIVO_CONFIG, activar_reconstruccion, aplicar_parametros_busqueda, leer_config_indice
+from lexico import ARCHIVO_LEXICO, BusquedaLexica, cargar_indice_lexico
+
+logger = logging.getLogger(__name__)
+
+DIR_SHARDS = "shards"
+ARCHIVO_SHARDS = "shards.json"
+PARTICIONES = ("carpeta", "hash")
+SHARD_RAIZ = "general"  # archivos que están directamente en documentos/
+
+
+# --- Reparto de archivos ---
+
+def nombre_shard(ruta_archivo: Path, dir_docs: Path, particion: str = "carpeta", num_shards: int = 4) -> str:
+    """
+    Shard al que pertenece un archivo.
+
+    - "carpeta": la subcarpeta de primer nivel dentro de `documentos/`.
+    - "hash": un hash estable del nombre, para repartir una carpeta grande en `num_shards`.
+    """
+    relativa = Path(ruta_archivo).resolve().relative_to(Path(dir_docs).resolve())
+    if particion == "hash":
+        return f"shard_{zlib.crc32(str(relativa).encode('utf-8')) % num_shards:03d}"
+    return relativa.parts[0] if len(relativa.parts) > 1 else SHARD_RAIZ
+
+
+def agrupar_por_shard(rutas: Iterable[str], dir_docs: Path, particion: str = "carpeta",
+                      num_shards: int = 4) -> Dict[str, List[str]]:
+    """Agrupa las rutas de archivos por shard, conservando su orden."""
+    grupos: Dict[str, List[str]] = {}
+    for ruta in rutas:
+        grupos.setdefault(nombre_shard(Path(ruta), dir_docs, particion, num_shards), []).append(str(ruta))
+    return grupos
+
+
+def leer_config_shards(ruta_db: Path) -> Optional[Dict[str, Any]]:
+    """Configuración de reparto si el índice está fragmentado; None si es un índice único."""
+    ruta = Path(ruta_db) / ARCHIVO_SHARDS
+    if not ruta.exists():
+        return None
+    with open(ruta) as f:
+        return json.load(f)
+
+
+def guardar_config_shards(ruta_db: Path, particion: str, num_shards: int) -> None:
+    Path(ruta_db).mkdir(parents=True, exist_ok=True)
+    with open(Path(ruta_db) / ARCHIVO_SHARDS, "w") as f:
+        json.dump({"particion": particion, "num_shards": num_shards}, f, indent=4)
+
+
+def ruta_shard(ruta_db: Path, nombre: str) -> Path:
+    return Path(ruta_db) / DIR_SHARDS / nombre
+
+
+def listar_shards(ruta_db: Path) -> List[Path]:
+    directorio = Path(ruta_db) / DIR_SHARDS
+    if not directorio.exists():
+        return []
+    # Los directorios ocultos son temporales de una publicación en curso
+    return sorted(d for d in directorio.iterdir()
+                  if d.is_dir() and not d.name.startswith(".") and (d / ARCHIVO_INDICE).exists())
+
+
+def ruta_temporal_shard(ruta_db: Path, nombre: str) -> Path:
+    return Path(ruta_db) / DIR_SHARDS / f".{nombre}.tmp"
+
+
+def publicar_directorio(temporal: Path, destino: Path) -> None:
+    """Reemplaza `destino` por `temporal` con renombrados, sin dejar nunca el destino a medias."""
+    viejo = destino.with_name(f".{destino.name}.old")
+    if viejo.exists():
+        shutil.rmtree(viejo)
+    if destino.exists():
+        os.rename(destino, viejo)
+    os.rename(temporal, destino)
+    if viejo.exists():
+        shutil.rmtree(viejo)
+
+
+def limpiar_indice_unico(ruta_db: Path) -> None:
+    """Borra los archivos del índice no fragmentado al pasar a shards."""
+    for nombre in (ARCHIVO_INDICE, ARCHIVO_DOCSTORE, ARCHIVO_CONFIG, ARCHIVO_LEXICO, "index.pkl"):
+        (Path(ruta_db) / nombre).unlink(missing_ok=True)
+
+
+# --- Búsqueda ---
+
+class BaseFragmentada(VectorStore):
+    """Vectorstore de sólo lectura que consulta todos los shards en paralelo y fusiona el top-k."""
+
+    def __init__(self, shards: Sequence[FAISS], embeddings: Embeddings, directorios: Sequence[Path] = ()):
+        self.shards = list(shards)
+        self.directorios = list(directorios)
+        self.embedding_function = embeddings
+        # faiss libera el GIL durante la búsqueda, así que los hilos usan varios núcleos
+        self._pool = ThreadPoolExecutor(max_workers=max(1, min(len(self.shards), os.cpu_count() or 1)))
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        futuros = [self._pool.submit(s.similarity_search_with_score_by_vector, embedding, k, **kwargs)
+                   for s in self.shards]
+        resultados = [par for futuro in futuros for par in futuro.result()]
+        # Todos los shards usan distancia L2 con el mismo modelo: menor es más similar
+        return sorted(resultados, key=lambda par: par[1])[:k]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def buscar_lote(self, vectores: np.ndarray, k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """Una búsqueda matricial por shard; cada fila se fusiona por distancia."""
+        futuros = [self._pool.submit(buscar_lote, s, vectores, k) for s in self.shards]
+        por_shard = [futuro.result() for futuro in futuros]
+        return [sorted((par for filas in por_shard for par in filas[i]), key=lambda par: par[1])[:k]
+                for i in range(len(vectores))]
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("BaseFragmentada es de sólo lectura; usa procesar_docs.py para modificar shards.")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   **kwargs: Any) -> "BaseFragmentada":
+        raise NotImplementedError("Construye los shards con procesar_docs.py --shards.")
+
+
+def buscar_lote(db, vectores: np.ndarray, k: int = 4) -> List[List[Tuple[Document, float]]]:
+    """
+    Top-k de muchas preguntas con una sola llamada a `index.search` (una matriz de
+    consultas) en lugar de una búsqueda por pregunta; devuelve (documento, distancia).
+    """
+    if isinstance(db, BaseFragmentada):
+        return db.buscar_lote(vectores, k)
+    consultas = np.array(vectores, dtype=np.float32)
+    if getattr(db, "_normalize_L2", False):
+        faiss.normalize_L2(consultas)
+    distancias, posiciones = db.index.search(consultas, k)
+    resultados = []
+    for fila_distancias, fila_posiciones in zip(distancias, posiciones):
+        pares = []
+        for distancia, pos in zip(fila_distancias, fila_posiciones):
+            if pos == -1:  # menos de k vectores (o sondas IVF vacías)
+                continue
+            doc = db.docstore.search(db.index_to_docstore_id[int(pos)])
+            if isinstance(doc, Document):
+                pares.append((doc, float(distancia)))
+        resultados.append(pares)
+    return resultados
+
+
+def cargar_indice_consultas(ruta_db: Path, embeddings: Embeddings):
+    """
+    Abre el índice para consultas: un FAISS si es un índice único o una
+    BaseFragmentada si `ruta_db` contiene shards.
+    """
+    ruta_db = Path(ruta_db)
+    directorios = listar_shards(ruta_db) if leer_config_shards(ruta_db) is not None else []
+    if not directorios:
+        db = cargar_base(ruta_db, embeddings)
+        aplicar_parametros_busqueda(db.index, leer_config_indice(ruta_db))
+        activar_reconstruccion(db.index)
+        return db
+
+    shards = []
+    for directorio in directorios:
+        shard = cargar_base(directorio, embeddings)
+        aplicar_parametros_busqueda(shard.index, leer_config_indice(directorio))
+        activar_reconstruccion(shard.index)
+        shards.append(shard)
+    logger.info(f"Cargados {len(shards)} shards: {', '.join(d.name for d in directorios)}")
+    return BaseFragmentada(shards, embeddings, directorios)
+
+
+def cargar_busqueda_lexica(ruta_db: Path, db) -> Optional[BusquedaLexica]:
+    """
+    Búsqueda BM25 sobre el índice cargado con `cargar_indice_consultas`; None si el
+    índice (o alguno de sus shards) se generó sin índice léxico.
+    """
+    if isinstance(db, BaseFragmentada):
+        pares = list(zip([cargar_indice_lexico(d) for d in db.directorios], db.shards))
+    else:
+        pares = [(cargar_indice_lexico(Path(ruta_db)), db)]
+    if not pares or any(indice is None for indice, _ in pares):
+        logger.warning("No se encontró el índice léxico: vuelve a generar el índice para usar la búsqueda híbrida.")
+        return None
+    return BusquedaLexica(pares)
@@ -0,0 +1,189 @@
+"""
+Trazas por etapa de la cadena RAG y exportación de métricas.
+
+Cada pregunta genera una `Traza` con la duración de sus etapas (embedding, búsqueda,
+format_docs, prompt, LLM...), el tamaño del contexto y las etiquetas de proveedor y
+modelo. `RegistroTrazas` las añade a un archivo JSONL y mantiene ventanas recientes
+por etapa que se exponen en formato de texto de Prometheus.
+
+Resumen de un log existente:
+
+    python trazas.py ../trazas.jsonl
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CARACTERES_POR_TOKEN = 4    # aproximación para texto mixto español/inglés
+VENTANA_METRICAS = 1000     # duraciones recientes por etapa usadas para los cuantiles
+CUANTILES = (0.5, 0.95, 0.99)
+PUERTO_METRICAS = 9464
+
+
+def estimar_tokens(texto: str) -> int:
+    """Tokens aproximados de un texto, sin depender del tokenizador de cada proveedor."""
+    return (len(texto) + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN
+
+
+class Traza:
+    """Duraciones de las etapas de una pregunta, con atributos y etiquetas."""
+
+    def __init__(self, proveedor: str, modelo: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.fecha = datetime.now().isoformat(timespec="seconds")
+        self.etiquetas = {"proveedor": proveedor, "modelo": modelo}
+        self.inicio = time.perf_counter()
+        self.etapas: List[Tuple[str, float]] = []
+        self.fines: Dict[str, float] = {}
+        self.atributos: Dict[str, Any] = {}
+        self._lock = threading.Lock()  # las ramas de la cadena pueden correr en hilos distintos
+
+    @contextmanager
+    def span(self, nombre: str) -> Iterator[None]:
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.agregar(nombre, time.perf_counter() - inicio)
+
+    def agregar(self, nombre: str, duracion: float) -> None:
+        with self._lock:
+            self.etapas.append((nombre, duracion))
+            self.fines[nombre] = time.perf_counter()
+
+    def desde(self, nombre: str) -> float:
+        """Segundos transcurridos desde que terminó la etapa indicada (o desde el inicio)."""
+        return time.perf_counter() - self.fines.get(nombre, self.inicio)
+
+    def total(self) -> float:
+        return time.perf_counter() - self.inicio
+
+    def etapas_ms(self) -> Dict[str, float]:
+        """Duración de cada etapa en ms, sumando las que se repiten, en orden de aparición."""
+        etapas: Dict[str, float] = {}
+        for nombre, duracion in self.etapas:
+            etapas[nombre] = etapas.get(nombre, 0.0) + duracion * 1000
+        return etapas
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "fecha": self.fecha,
+            **self.etiquetas,
+            "total_ms": self.total() * 1000,
+            "etapas": self.etapas_ms(),
+            **self.atributos,
+        }
+
+
+class RegistroTrazas:
+    """Añade las trazas a un JSONL y acumula estadísticas por (etapa, proveedor, modelo)."""
+
+    def __init__(self, ruta_jsonl: Optional[Path] = None, ventana: int = VENTANA_METRICAS):
+        self.ruta = Path(ruta_jsonl) if ruta_jsonl else None
+        self._lock = threading.Lock()
+        self._recientes: Dict[Tuple[str, str, str], Deque[float]] = defaultdict(lambda: deque(maxlen=ventana))
+        self._sumas: Dict[Tuple[str, str, str], float] = defaultdict(float)
+        self._cuentas: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self._contexto_tokens: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    def registrar(self, traza: Traza) -> Dict[str, Any]:
+        datos = traza.como_dict()
+        proveedor, modelo = traza.etiquetas["proveedor"], traza.etiquetas["modelo"]
+        with self._lock:
+            for nombre, ms in list(datos["etapas"].items()) + [("total", datos["total_ms"])]:
+                clave, duracion = (nombre, proveedor, modelo), ms / 1000
+                self._recientes[clave].append(duracion)
+                self._sumas[clave] += duracion
+                self._cuentas[clave] += 1
+            self._contexto_tokens[(proveedor, modelo)] += int(traza.atributos.get("contexto_tokens", 0))
+            if self.ruta is not None:
+                with open(self.ruta, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(datos, ensure_ascii=False, default=str) + "\n")
+        return datos
+
+    def exportar_prometheus(self) -> str:
+        """Métricas en el formato de texto de Prometheus (summary por etapa)."""
+        lineas = [
+            "# HELP rag_etapa_segundos Duración de cada etapa de la cadena RAG.",
+            "# TYPE rag_etapa_segundos summary",
+        ]
+        with self._lock:
+            for (etapa, proveedor, modelo), recientes in sorted(self._recientes.items()):
+                etiquetas = f'etapa="{etapa}",proveedor="{proveedor}",modelo="{modelo}"'
+                for q in CUANTILES:
+                    valor = float(np.quantile(np.asarray(recientes), q))
+                    lineas.append(f'rag_etapa_segundos{{{etiquetas},quantile="{q}"}} {valor:.6f}')
+                lineas.append(f"rag_etapa_segundos_sum{{{etiquetas}}} {self._sumas[(etapa, proveedor, modelo)]:.6f}")
+                lineas.append(f"rag_etapa_segundos_count{{{etiquetas}}} {self._cuentas[(etapa, proveedor, modelo)]}")
+            lineas += [
+                "# HELP rag_contexto_tokens_total Tokens de contexto (estimados) enviados al LLM.",
+                "# TYPE rag_contexto_tokens_total counter",
+            ]
+            for (proveedor, modelo), tokens in sorted(self._contexto_tokens.items()):
+                lineas.append(f'rag_contexto_tokens_total{{proveedor="{proveedor}",modelo="{modelo}"}} {tokens}')
+        return "\n".join(lineas) + "\n"
+
+
+def iniciar_servidor_metricas(registro: RegistroTrazas, puerto: int = PUERTO_METRICAS,
+                              host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """Sirve `/metrics` en un hilo de fondo; devuelve None si el puerto no está disponible."""
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            cuerpo = registro.exportar_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, formato, *args):
+            pass  # sin una línea de log por cada scrape
+
+    try:
+        servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    except OSError as e:
+        logger.warning(f"No se pudo abrir el puerto de métricas {puerto}: {e}")
+        return None
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    logger.info(f"Métricas en formato Prometheus en http://localhost:{puerto}/metrics")
+    return servidor
+
+
+def resumir(ruta_jsonl: Path) -> Dict[str, Dict[str, float]]:
+    """p50/p95/p99 por etapa (en ms) a partir de un log JSONL de trazas."""
+    duraciones: Dict[str, List[float]] = defaultdict(list)
+    with open(ruta_jsonl, encoding="utf-8") as f:
+        for linea in f:
+            traza = json.loads(linea)
+            for etapa, ms in traza["etapas"].items():
+                duraciones[etapa].append(ms)
+            duraciones["total"].append(traza["total_ms"])
+    return {etapa: {"n": len(valores), **{f"p{int(q * 100)}_ms": float(np.quantile(valores, q)) for q in CUANTILES}}
+            for etapa, valores in duraciones.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resume un log JSONL de trazas por etapa.")
+    parser.add_argument("ruta", type=Path, help="Archivo JSONL de trazas.")
+    args = parser.parse_args()
+    for etapa, datos in resumir(args.ruta).items():
+        print(f"{etapa:>22}  n={datos['n']:<6} p50 {datos['p50_ms']:9.1f} ms  "
+              f"p95 {datos['p95_ms']:9.1f} ms  p99 {datos['p99_ms']:9.1f} ms")
@@ -2,9 +2,10 @@
 Utilidades para el proyecto RAG INAOE
 """
 import os
+import time
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, Iterator
 
 # Configurar logging
 logging.basicConfig(
@@ -28,7 +29,7 @@ def verificar_configuracion() -> Dict[str, Any]:
     ruta_proyecto = Path(__file__).resolve().parent.parent
     ruta_db = ruta_proyecto / "indice_faiss"
     
-    if ruta_db.exists() and (ruta_db / "index.faiss").exists():
+    if ruta_db.exists() and ((ruta_db / "index.faiss").exists() or (ruta_db / "shards.json").exists()):
         config["base_datos_existe"] = True
     else:
         config["errores"].append("Base de datos no encontrada. Ejecuta: python procesar_docs.py")
@@ -126,6 +127,18 @@ def formatear_tiempo(segundos: float) -> str:
         minutos = int((segundos % 3600) // 60)
         return f"{horas}h {minutos}m"
 
+def medir_stream(tokens: Iterable[str], metricas: Dict[str, float]) -> Iterator[str]:
+    """
+    Reenvía los tokens de un stream registrando en `metricas` el tiempo al primer
+    token ("primer_token") y el tiempo total de generación ("generacion"), en segundos.
+    """
+    inicio = time.perf_counter()
+    for token in tokens:
+        if "primer_token" not in metricas:
+            metricas["primer_token"] = time.perf_counter() - inicio
+        yield token
+    metricas["generacion"] = time.perf_counter() - inicio
+
 def validar_pregunta(pregunta: str) -> tuple[bool, str]:
     """
     Valida si una pregunta es apropiada para el sistema.
@@ -0,0 +1,141 @@
+"""
+Modo vigilancia: mantiene el índice al día mientras se suben documentos.
+
+Un observador de `watchdog` recibe los avisos del sistema de archivos sobre
+`documentos/` (documentos nuevos, modificados, movidos o borrados de los tipos con
+cargador en `cargadores.py`). Cuando los avisos dejan de llegar durante `--espera`
+segundos (una subida de varios archivos o un archivo que se copia en varios trozos
+genera muchos) se procesa el lote:
+
+1. Se compara `documentos/` con el manifiesto del índice (el hash de cada archivo),
+   igual que en `procesar_docs2.py`, así que sólo se tocan los archivos afectados y
+   un aviso perdido se recupera en el siguiente lote.
+2. Se quitan los chunks de los archivos modificados o borrados, se añaden los
+   nuevos y se publica el índice (o cada shard afectado) de forma atómica.
+
+El modelo de embeddings y su caché se cargan una sola vez al arrancar.
+
+    python vigilar_docs.py --espera 2
+"""
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Sequence, Set
+
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+
+from cache_embeddings import EmbeddingsCacheados
+from cache_paginas import directorio_cache, registrar_estadisticas
+from cargadores import extensiones_soportadas
+from procesar_docs2 import (DIR_DB_FAISS, DIR_DOCS, actualizar_base, cargar_registro_archivos, crear_embeddings,
+                            crear_parser, obtener_archivos_a_procesar, obtener_archivos_eliminados)
+from shards import leer_config_shards
+
+ESPERA = 2.0            # segundos sin avisos antes de procesar el lote
+ESPERA_MAXIMA = 30.0    # con avisos continuos, se procesa igualmente pasado este tiempo
+
+
+class ColaCambios(FileSystemEventHandler):
+    """Acumula las rutas con cambios y agrupa las ráfagas de avisos en lotes."""
+
+    def __init__(self, extensiones: Sequence[str] = ()):
+        self.extensiones = tuple(extensiones) or tuple(extensiones_soportadas())
+        self._pendientes: Set[str] = set()
+        self._primero = 0.0
+        self._ultimo = 0.0
+        self._lock = threading.Lock()
+        self._hay_cambios = threading.Event()
+
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        if event.is_directory or event.event_type in ("opened", "closed_no_write"):
+            return
+        rutas = [r for r in (event.src_path, getattr(event, "dest_path", "")) if r]
+        rutas = [str(r) for r in rutas if Path(str(r)).suffix.lower() in self.extensiones]
+        if not rutas:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            if not self._pendientes:
+                self._primero = ahora
+            self._pendientes.update(rutas)
+            self._ultimo = ahora
+        self._hay_cambios.set()
+
+    def esperar_lote(self, espera: float = ESPERA, espera_maxima: float = ESPERA_MAXIMA) -> Set[str]:
+        """Bloquea hasta que haya cambios y lleven `espera` segundos en calma; devuelve las rutas avisadas."""
+        self._hay_cambios.wait()
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                calma = ahora - self._ultimo
+                if calma >= espera or ahora - self._primero >= espera_maxima:
+                    lote, self._pendientes = self._pendientes, set()
+                    self._hay_cambios.clear()
+                    return lote
+            time.sleep(min(espera - calma, 0.5) if calma < espera else 0.05)
+
+
+def procesar_cambios(base_embeddings, embeddings, args) -> bool:
+    """Aplica al índice los archivos nuevos, modificados y eliminados desde el último lote."""
+    config_shards = leer_config_shards(DIR_DB_FAISS)
+    registro = cargar_registro_archivos()
+    archivos_a_procesar = obtener_archivos_a_procesar(registro, recursivo=config_shards is not None)
+    archivos_eliminados = obtener_archivos_eliminados(registro)
+    if not archivos_a_procesar and not archivos_eliminados:
+        logging.info("Sin cambios que indexar.")
+        return True
+
+    inicio, inicio_reloj = time.perf_counter(), time.time()
+    logging.info(f"Lote: {len(archivos_a_procesar)} archivos nuevos o modificados, {len(archivos_eliminados)} eliminados.")
+    exito = actualizar_base(archivos_a_procesar, archivos_eliminados, base_embeddings, embeddings, args, registro)
+    if exito:
+        logging.info(f"✅ Índice publicado en {time.perf_counter() - inicio:.1f}s.")
+        registrar_estadisticas(directorio_cache(args), inicio_reloj)
+    else:
+        logging.error("El lote falló; se reintentará con el siguiente cambio.")
+    return exito
+
+
+def parsear_argumentos():
+    parser = crear_parser("Vigila 'documentos/' y mantiene el índice FAISS actualizado.")
+    parser.add_argument("--espera", type=float, default=ESPERA,
+                        help="Segundos sin cambios antes de procesar un lote.")
+    parser.add_argument("--espera-maxima", type=float, default=ESPERA_MAXIMA,
+                        help="Segundos máximos que se acumulan cambios antes de procesarlos.")
+    return parser.parse_args()
+
+
+def main():
+    args = parsear_argumentos()
+    if not DIR_DOCS.exists():
+        logging.error(f"El directorio de documentos '{DIR_DOCS}' no existe.")
+        return
+
+    base_embeddings, embeddings = crear_embeddings(args)
+    cola = ColaCambios()
+    observador = Observer()
+    observador.schedule(cola, str(DIR_DOCS), recursive=True)
+    observador.start()
+    logging.info(f"👀 Vigilando {DIR_DOCS} (lotes tras {args.espera:g}s sin cambios). Ctrl+C para salir.")
+
+    try:
+        procesar_cambios(base_embeddings, embeddings, args)  # lo que cambió mientras no se vigilaba
+        while True:
+            rutas = cola.esperar_lote(args.espera, args.espera_maxima)
+            logging.info(f"{len(rutas)} archivos con avisos de cambio.")
+            procesar_cambios(base_embeddings, embeddings, args)
+    except KeyboardInterrupt:
+        logging.info("Deteniendo la vigilancia...")
+    finally:
+        observador.stop()
+        observador.join()
+        if isinstance(embeddings, EmbeddingsCacheados):
+            embeddings.registrar_estadisticas()
+            embeddings.cache.cerrar()
+        base_embeddings.registrar_estadisticas()
+
+
+if __name__ == "__main__":
+    main()